@@ -1,5 +1,4 @@
 import asyncio
-import json
 import traceback
 from datetime import datetime
 from pathlib import Path
@@ -33,8 +32,23 @@ from models.interface import Controller
 from models.interface.inputs import PathField
 from utils import tasks
 from utils.functions import long_throttle, throttle
-from utils.trove.extractor import find_all_indexes, FileStatus
+from utils.jobs import Job, JobStatus, scheduler
+from utils.trove.extractor import (
+    find_all_indexes,
+    scan_indexes,
+    ExtractionEngine,
+    ExtractionManifest,
+)
+from utils.trove.blob_store import BlobStore
+from utils.trove.diff import Catalog, CatalogDiff, find_changes
+from utils.trove.extraction_pack import PackWriter
+from utils.trove.file_filter import FileFilter
+from utils.trove.file_writer import FileWriter
+from utils.trove.history import get_file_history
+from utils.trove.index_cache import get_index_cache
 from utils.trove.registry import get_trove_locations
+from utils.trove.selection import SelectionTotals
+from utils.trove.verify import TreeVerifier
 
 
 class ExtractorController(Controller):
@@ -42,9 +56,16 @@ class ExtractorController(Controller):
         if not hasattr(self.page, "main"):
             self.tfi_list = []
             self.main = ResponsiveRow(alignment=MainAxisAlignment.START)
-            self.cancel_extraction = False
+            self.extraction_job = None
+            self.selection = SelectionTotals()
         self.trove_locations = list(get_trove_locations())
         self.locations = self.page.preferences.directories
+        self.index_cache = get_index_cache(
+            self.page.RTT.app_data.joinpath("index_cache.sqlite")
+        )
+        self.history = get_file_history(
+            self.page.RTT.app_data.joinpath("history.sqlite")
+        )
         if self.trove_locations:
             directory = self.trove_locations[0]
             if self.locations.extract_from is None:
@@ -121,12 +142,40 @@ class ExtractorController(Controller):
         self.extract_all_button = ElevatedButton(
             loc("Extract all"), on_click=self.extract_all, disabled=True, col=6
         )
+        self.extraction_filter = TextField(
+            value=self.page.preferences.extraction_filter,
+            label=loc("Filter"),
+            hint_text="*.blueprint !languages/** ext:png size:<1M re:...",
+            on_submit=self.set_extraction_filter,
+            on_blur=self.set_extraction_filter,
+            text_size=14,
+            height=58,
+            col=6,
+        )
+        self.extract_filtered_button = ElevatedButton(
+            loc("Extract filtered"),
+            on_click=self.extract_filtered,
+            disabled=True,
+            col=6,
+        )
+        self.verify_button = ElevatedButton(
+            loc("Verify extracted files"),
+            on_click=self.verify_extracted,
+            disabled=True,
+            col=6,
+        )
         self.cancel_extraction_button = ElevatedButton(
             loc("Cancel extraction"),
             on_click=self.cancel_ongoing_extraction,
             visible=False,
             col=2,
         )
+        self.pause_extraction_button = ElevatedButton(
+            loc("Pause extraction"),
+            on_click=self.toggle_extraction_pause,
+            visible=False,
+            col=2,
+        )
         self.directory_dropdown = Dropdown(
             value=(
                 self.locations.extract_from
@@ -208,6 +257,26 @@ class ExtractorController(Controller):
                             ],
                             col=6,
                         ),
+                        Row(
+                            controls=[
+                                Switch(
+                                    value=self.page.preferences.blob_store,
+                                    on_change=self.switch_blob_store,
+                                ),
+                                Text(loc("Deduplicate Files")),
+                            ],
+                            col=6,
+                        ),
+                        Row(
+                            controls=[
+                                Switch(
+                                    value=self.page.preferences.packed_output,
+                                    on_change=self.switch_packed_output,
+                                ),
+                                Text(loc("Packed Output")),
+                            ],
+                            col=6,
+                        ),
                     ],
                     col=6,
                 ),
@@ -231,6 +300,9 @@ class ExtractorController(Controller):
                         self.extract_changes_button,
                         self.extract_selected_button,
                         self.extract_all_button,
+                        self.extraction_filter,
+                        self.extract_filtered_button,
+                        self.verify_button,
                     ],
                     col=6,
                 ),
@@ -277,7 +349,8 @@ class ExtractorController(Controller):
                 Row(controls=[Text(loc("Extractor Idle")), Text("")], expand=False),
                 ResponsiveRow(
                     controls=[
-                        ProgressBar(height=30, value=0, col=10),
+                        ProgressBar(height=30, value=0, col=8),
+                        self.pause_extraction_button,
                         self.cancel_extraction_button,
                     ]
                 ),
@@ -319,6 +392,10 @@ class ExtractorController(Controller):
                 alignment=MainAxisAlignment.START,
             ),
         ]
+        watcher = getattr(self.page.RTT, "patch_watcher", None)
+        if watcher is not None and watcher.prepared is not None:
+            self.main.disabled = True
+            self.refresh_lists.start(True)
 
     def setup_events(self): ...
 
@@ -330,43 +407,48 @@ class ExtractorController(Controller):
             loc("Changed the format for changes folder"), color="green"
         )
 
+    async def set_extraction_filter(self, _=None) -> bool:
+        value = self.extraction_filter.value or ""
+        try:
+            FileFilter.parse(value)
+        except ValueError as e:
+            self.extraction_filter.error_text = str(e)
+            await self.extraction_filter.update_async()
+            return False
+        self.extraction_filter.error_text = None
+        await self.extraction_filter.update_async()
+        if value != self.page.preferences.extraction_filter:
+            self.page.preferences.extraction_filter = value
+            self.page.preferences.save()
+        return True
+
     async def cancel_ongoing_extraction(self, _):
-        self.cancel_extraction = True
+        if self.extraction_job is not None:
+            self.extraction_job.cancel()
+
+    async def toggle_extraction_pause(self, event):
+        if self.extraction_job is None:
+            return
+        if self.extraction_job.status == JobStatus.paused:
+            self.extraction_job.resume()
+            event.control.text = loc("Pause extraction")
+        else:
+            self.extraction_job.pause()
+            event.control.text = loc("Resume extraction")
+        await event.control.update_async()
 
     async def select_all(self, _):
         for row in self.directory_list.rows:
             row.selected = True
-        self.extract_selected_button.disabled = False
-        selected_size = sum(
-            [
-                f["size"]
-                for r in self.directory_list.rows
-                for f in await r.data.files_list
-                if r.selected
-            ]
-        )
-        self.extract_selected_button.text = loc("Extract Selected [{value}]").format(
-            value=naturalsize(selected_size, gnu=True)
-        )
-
+        self.selection.select_all()
+        self.update_extraction_buttons()
         await self.page.update_async()
 
     async def unselect_all(self, _):
         for row in self.directory_list.rows:
             row.selected = False
-        self.extract_selected_button.disabled = True
-        selected_size = sum(
-            [
-                f["size"]
-                for r in self.directory_list.rows
-                for f in await r.data.files_list
-                if r.selected
-            ]
-        )
-        self.extract_selected_button.text = loc("Extract Selected [{value}]").format(
-            value=naturalsize(selected_size, gnu=True)
-        )
-
+        self.selection.unselect_all()
+        self.update_extraction_buttons()
         await self.page.update_async()
 
     @throttle
@@ -497,6 +579,14 @@ class ExtractorController(Controller):
         self.page.preferences.save()
         await self.page.update_async()
 
+    async def switch_blob_store(self, event):
+        self.page.preferences.blob_store = event.control.value
+        self.page.preferences.save()
+
+    async def switch_packed_output(self, event):
+        self.page.preferences.packed_output = event.control.value
+        self.page.preferences.save()
+
     async def switch_performance_mode(self, event):
         if event.control.value:
             if not self.page.preferences.dismissables.performance_mode:
@@ -504,46 +594,56 @@ class ExtractorController(Controller):
         self.page.preferences.performance_mode = event.control.value
         self.page.preferences.save()
 
+    async def record_history(self, job, root, indexes):
+        job.report(indexes=len(indexes))
+        version = await asyncio.to_thread(self.history.update, root, indexes)
+        job.report(version=version, done=True)
+        return version
+
+    async def compare_changes(self, job, indexes):
+        return await find_changes(
+            indexes,
+            self.locations.extract_from,
+            self.manifest,
+            self.page.preferences.performance_mode,
+            self.page.preferences.extraction_inflate_workers,
+            job,
+        )
+
+    async def show_refresh_progress(self, job):
+        if job.kind != "refresh" or not job.progress.get("done"):
+            return
+        done, total = job.progress["done"], job.progress["total"]
+        elapsed = job.progress["elapsed"]
+        remaining = round(elapsed * (total / done - 1))
+        self.directory_progress.controls[0].controls[
+            1
+        ].value = f"[{round(done / total * 100, 1)}%] | Elapsed: {round(elapsed):>3}s | Estimated {remaining:>3}s remaining\r"
+        self.directory_progress.controls[1].value = round(done / total * 1000) / 1000
+        await self.directory_progress.update_async()
+
     async def directory_selection(self, event):
         event.control.selected = not event.control.selected
         for row in self.files_list.rows:
             if row.data is not None:
                 if row.data.archive.index == event.control.data:
                     row.visible = event.control.selected
-        selected_indexes = [r.data for r in self.directory_list.rows if r.selected]
-        changes = [f for f in self.changed_files if f.archive.index in selected_indexes]
-        changes_size = sum([f.size for f in changes])
-        selected_size = sum(
-            [
-                f["size"]
-                for r in self.directory_list.rows
-                for f in await r.data.files_list
-                if r.selected
-            ]
-        )
-        all_size = sum(
-            [
-                f["size"]
-                for r in self.directory_list.rows
-                for f in await r.data.files_list
-            ]
-        )
+        self.selection.select(event.control.data, event.control.selected)
+        self.update_extraction_buttons()
+        await self.page.update_async()
+
+    def update_extraction_buttons(self):
+        selection = self.selection
         self.extract_changes_button.text = loc("Extract Changes [{value}]").format(
-            value=naturalsize(changes_size, gnu=True)
+            value=naturalsize(selection.chosen.changed_size, gnu=True)
         )
-
         self.extract_selected_button.text = loc("Extract Selected [{value}]").format(
-            value=naturalsize(selected_size, gnu=True)
+            value=naturalsize(selection.chosen.size, gnu=True)
         )
-
         self.extract_all_button.text = loc("Extract All [{value}]").format(
-            value=naturalsize(all_size, gnu=True)
-        )
-
-        self.extract_selected_button.disabled = not bool(
-            [r for r in self.directory_list.rows if r.selected]
+            value=naturalsize(selection.all.size, gnu=True)
         )
-        await self.page.update_async()
+        self.extract_selected_button.disabled = not selection.selected
 
     async def refresh_directories(self, _):
         self.main.disabled = True
@@ -553,6 +653,39 @@ class ExtractorController(Controller):
         self.main.disabled = True
         self.refresh_lists.start(True)
 
+    def directory_row(self, index):
+        totals = self.selection[index]
+        changes_count = totals.changed_files
+        return DataRow(
+            data=index,
+            cells=[
+                DataCell(
+                    Text(
+                        str(index.directory.relative_to(self.locations.extract_from)),
+                        color="green" if changes_count else None,
+                        size=12,
+                    )
+                ),
+                DataCell(
+                    Text(
+                        naturalsize(totals.size, gnu=True),
+                        color="green" if changes_count else None,
+                        size=12,
+                    ),
+                    data=totals.size,
+                ),
+                DataCell(
+                    Text(
+                        changes_count,
+                        color="green" if changes_count else None,
+                        size=12,
+                    )
+                ),
+            ],
+            selected=self.selection.is_selected(index),
+            on_select_changed=self.directory_selection,
+        )
+
     @tasks.loop(seconds=1)
     async def refresh_lists(self, with_changes=False):
         try:
@@ -561,129 +694,96 @@ class ExtractorController(Controller):
             self.extract_changes_button.disabled = False
             self.extract_selected_button.disabled = False
             self.directory_progress.visible = True
-            self.directory_list.visible = False
+            self.directory_list.visible = True
             self.files_list.visible = False
             await self.page.update_async()
             await asyncio.sleep(0.5)
-            self.hashes = dict()
-            if self.page.preferences.performance_mode:
-                hashes_path = self.locations.extract_to.joinpath("hashes.json")
-                if hashes_path.exists():
-                    try:
-                        self.hashes = json.loads(hashes_path.read_text())
-                    except json.JSONDecodeError:
-                        print(loc("Failed to load hashes, malformed file."))
+            self.manifest = ExtractionManifest.load(self.locations.changes_from)
             self.changed_files = []
+            self.selection.clear()
+            if self.index_cache is not None:
+                self.index_cache.prune()
+            found = [
+                index
+                async for index in find_all_indexes(
+                    self.locations.extract_from, None, False, self.index_cache
+                )
+            ]
             indexes = []
-            i = 0
-            async for index in find_all_indexes(
-                self.locations.extract_from, self.hashes, False
+            shown = perf_counter()
+            # Rows show up as their index is parsed, in whatever order they finish
+            async for index in scan_indexes(
+                found, self.page.preferences.extraction_inflate_workers
             ):
-                indexes.append([index, len(await index.files_list), 0])
-            if with_changes:
-                total_files = sum([index[1] for index in indexes])
-                progress = 0
-                start = perf_counter()
-                for index, files_count, _ in indexes:
-                    index_hash = self.hashes.get(
-                        str(index.path.relative_to(self.locations.extract_from))
+                await self.selection.add(index)
+                indexes.append(index)
+                self.directory_list.rows.append(self.directory_row(index))
+                if perf_counter() - shown > scheduler.interval:
+                    shown = perf_counter()
+                    self.directory_progress.controls[0].controls[
+                        1
+                    ].value = f"{len(indexes)}/{len(found)}"
+                    self.directory_progress.controls[1].value = len(indexes) / len(
+                        found
                     )
-                    if index_hash is None or (await index.content_hash) != index_hash:
-                        for archive in index.archives:
-                            archive_hash = self.hashes.get(
-                                archive.path.relative_to(self.locations.extract_from)
-                            )
-                            if (
-                                archive_hash is None
-                                or (await archive.content_hash) != archive_hash
-                            ):
-                                async for file in archive.files():
-                                    i += 1
-                                    if progress < (
-                                        new_progress := round(i / total_files * 1000)
-                                        / 1000
-                                    ):
-                                        elapsed = perf_counter() - start
-                                        remaining = round(
-                                            elapsed * (total_files / i - 1)
-                                        )
-                                        self.directory_progress.controls[0].controls[
-                                            1
-                                        ].value = f"[{round(i / total_files * 100, 1)}%] | Elapsed: {round(elapsed):>3}s | Estimated {remaining:>3}s remaining\r"
-                                        progress = new_progress
-                                        self.directory_progress.controls[1].value = (
-                                            new_progress
-                                        )
-                                        await self.directory_progress.update_async()
-                                    if (
-                                        await file.compare(
-                                            self.locations.extract_from,
-                                            self.locations.changes_from,
-                                        )
-                                    ) in [FileStatus.added, FileStatus.changed]:
-                                        self.changed_files.append(file)
-                            else:
-                                i += len(
-                                    [
-                                        f
-                                        for f in archive.index.files_list()
-                                        if int(f["archive_index"]) == archive.id
-                                    ]
-                                )
-                    else:
-                        i += files_count
+                    await self.page.update_async()
+            self.directory_list.rows.clear()
+            if self.history is not None:
+                # Runs on the background worker, only indexes that moved get diffed.
+                # A record still waiting is superseded by this one
+                for pending in scheduler.active("history"):
+                    if pending.started is None:
+                        pending.cancel()
+                scheduler.submit(
+                    Job(
+                        "Record file history",
+                        self.record_history,
+                        self.locations.extract_from,
+                        indexes,
+                        priority=-1,
+                        kind="history",
+                    )
+                )
+            prepared = None
+            watcher = getattr(self.page.RTT, "patch_watcher", None)
+            if with_changes and watcher is not None:
+                # Already compared in the background after a patch
+                prepared = watcher.take(
+                    self.locations.extract_from,
+                    self.locations.changes_from,
+                    self.page.preferences.performance_mode,
+                    indexes,
+                )
+            if prepared is not None:
+                self.changed_files = list(prepared.files)
+            elif with_changes:
+                job = scheduler.submit(
+                    Job(
+                        "Compare changes",
+                        self.compare_changes,
+                        indexes,
+                        priority=1,
+                        kind="refresh",
+                    )
+                )
+                unsubscribe = scheduler.subscribe(self.show_refresh_progress)
+                try:
+                    self.changed_files = await job.wait() or []
+                finally:
+                    unsubscribe()
             if self.changed_files:
                 self.changed_files.sort(key=lambda x: [x.archive.index.path, x.path])
                 for file in self.changed_files:
-                    for index in indexes:
-                        if index[0] == file.archive.index:
-                            index[2] += 1
-                            break
+                    self.selection.add_change(file.archive.index, file.size)
             else:
                 self.extract_changes_button.disabled = True
                 self.extract_selected_button.disabled = True
-            indexes.sort(key=lambda x: [-x[2], str(x[0].directory)])
-            for index, files_count, changes_count in indexes:
-                self.directory_list.rows.append(
-                    DataRow(
-                        data=index,
-                        cells=[
-                            DataCell(
-                                Text(
-                                    str(
-                                        index.directory.relative_to(
-                                            self.locations.extract_from
-                                        )
-                                    ),
-                                    color="green" if changes_count else None,
-                                    size=12,
-                                )
-                            ),
-                            DataCell(
-                                Text(
-                                    naturalsize(
-                                        sum(
-                                            [f["size"] for f in await index.files_list]
-                                        ),
-                                        gnu=True,
-                                    ),
-                                    color="green" if changes_count else None,
-                                    size=12,
-                                ),
-                                data=sum([f["size"] for f in await index.files_list]),
-                            ),
-                            DataCell(
-                                Text(
-                                    changes_count,
-                                    color="green" if changes_count else None,
-                                    size=12,
-                                )
-                            ),
-                        ],
-                        selected=bool(changes_count),
-                        on_select_changed=self.directory_selection,
-                    )
-                )
+            indexes.sort(
+                key=lambda x: [-self.selection[x].changed_files, str(x.directory)]
+            )
+            for index in indexes:
+                self.selection.select(index, bool(self.selection[index].changed_files))
+                self.directory_list.rows.append(self.directory_row(index))
             if len(self.changed_files) > 2000:
                 self.files_list.rows.append(
                     DataRow(
@@ -744,47 +844,17 @@ class ExtractorController(Controller):
                         )
                     )
                 self.extract_changes_button.disabled = False
-            selected_indexes = [r.data for r in self.directory_list.rows if r.selected]
-            changes = [
-                f for f in self.changed_files if f.archive.index in selected_indexes
-            ]
-            changes_size = sum([f.size for f in changes])
-            selected_size = sum(
-                [
-                    f["size"]
-                    for r in self.directory_list.rows
-                    for f in await r.data.files_list
-                    if r.selected
-                ]
-            )
-            all_size = sum(
-                [
-                    f["size"]
-                    for r in self.directory_list.rows
-                    for f in await r.data.files_list
-                ]
-            )
-            self.extract_changes_button.text = loc("Extract Changes [{value}]").format(
-                value=naturalsize(changes_size, gnu=True)
-            )
-            self.extract_selected_button.text = loc(
-                "Extract Selected [{value}]"
-            ).format(value=naturalsize(selected_size, gnu=True))
-            self.extract_all_button.text = loc("Extract All [{value}]").format(
-                value=naturalsize(all_size, gnu=True)
-            )
-
+            self.update_extraction_buttons()
             self.metrics.controls[0].controls[1].value = naturalsize(
-                sum([f.size for f in self.changed_files]), gnu=True
+                self.selection.all.changed_size, gnu=True
             )
             self.directory_progress.controls[0].controls[1].value = ""
             self.directory_progress.controls[1].value = 0
-            self.extract_selected_button.disabled = not bool(
-                [r for r in self.directory_list.rows if r.selected]
-            )
             self.select_all_button.disabled = False
             self.unselect_all_button.disabled = False
             self.extract_all_button.disabled = False
+            self.extract_filtered_button.disabled = False
+            self.verify_button.disabled = False
             self.directory_progress.visible = False
             self.directory_list.visible = True
             self.files_list.visible = True
@@ -883,206 +953,430 @@ class ExtractorController(Controller):
     async def extract_all(self, _):
         await self.warn_extraction("all")
 
-    async def extract(self, event):
+    async def extract_filtered(self, _):
+        if not await self.set_extraction_filter():
+            return
+        if not FileFilter.parse(self.page.preferences.extraction_filter):
+            return await self.page.snack_bar.show(
+                loc("Type a filter to extract matching files"), color="red"
+            )
+        await self.warn_extraction("filtered")
+
+    async def verify_extracted(self, _):
+        """Checks the extracted tree against the index hashes, offering to repair it."""
         self.main_controls.disabled = True
-        await self.page.dialog.hide()
-        await asyncio.sleep(0.5)
-        if event.control.data == "changes":
+        self.cancel_extraction_button.visible = True
+        await self.page.update_async()
+        indexes = [r.data for r in self.directory_list.rows]
+        verifier = TreeVerifier(
+            self.locations.extract_from,
+            self.locations.extract_to,
+            self.page.preferences.extraction_inflate_workers,
+        )
+
+        async def verify(job):
+            files = []
+            for index in indexes:
+                files.extend(await index.files_list)
+
+            async def progress(done, total):
+                job.report(done=done, total=total)
+
+            return await verifier.verify(
+                files, progress=progress, checkpoint=job.checkpoint
+            )
+
+        async def on_progress(job):
+            if job is not self.extraction_job or not job.progress.get("total"):
+                return
+            done, total = job.progress["done"], job.progress["total"]
+            self.extraction_progress.controls[0].controls[0].value = loc(
+                "Verifying extracted files:"
+            )
+            self.extraction_progress.controls[0].controls[1].value = f"{done}/{total}"
+            self.extraction_progress.controls[1].controls[0].value = (
+                round(done / total * 1000) / 1000
+            )
+            await self.extraction_progress.update_async()
+
+        self.extraction_job = scheduler.submit(
+            Job("Verify extracted files", verify, kind="verify")
+        )
+        unsubscribe = scheduler.subscribe(on_progress)
+        try:
+            report = await self.extraction_job.wait()
+        finally:
+            unsubscribe()
+            self.extraction_job = None
+            self.main_controls.disabled = False
             self.cancel_extraction_button.visible = False
-            if self.page.preferences.advanced_mode:
-                dated_folder = self.locations.changes_to.joinpath(
-                    datetime.now().strftime(
-                        self.page.preferences.changes_name_format.replace(
-                            "$dir", self.locations.extract_from.name
-                        ).strip()
-                    )
-                )
-                old_changes = dated_folder.joinpath("old")
-                new_changes = dated_folder.joinpath("new")
-                dated_folder.mkdir(parents=True, exist_ok=True)
-                old_changes.mkdir(parents=True, exist_ok=True)
-                new_changes.mkdir(parents=True, exist_ok=True)
-                # This in case they want to re-run the extraction, possible
-                with open(old_changes.joinpath("hashes.json"), "w+") as f:
-                    f.write(json.dumps(self.hashes, indent=4))
-            selected_indexes = [r.data for r in self.directory_list.rows if r.selected]
-            changes = [
-                f for f in self.changed_files if f.archive.index in selected_indexes
-            ]
-            selected_archives = [f.archive for f in changes]
-            total = len(changes)
-            start = perf_counter()
-            for i, file in enumerate(changes, 1):
-                old_pro = self.extraction_progress.controls[1].controls[0].value
-                i += 1
-                if old_pro != (progress := round(i / total * 1000) / 1000):
-                    elapsed = perf_counter() - start
-                    remaining = round(elapsed * (total / i - 1))
-                    self.extraction_progress.controls[0].controls[0].value = (
-                        loc(
-                            "[{}%] | Elapsed: {:>3}s | Estimated {:>3}s remaining | Extracting {}"
-                        ).format(
-                            round(i / total * 100, 1),
-                            round(elapsed),
-                            remaining,
-                            event.control.data,
-                        )
-                        + ":\r"
-                    )
-                    self.extraction_progress.controls[0].controls[1].value = file.name
-                    self.extraction_progress.controls[1].controls[0].value = progress
-                    await self.extraction_progress.update_async()
-                if self.page.preferences.advanced_mode:
-                    await file.copy_old(
-                        self.locations.extract_from,
-                        self.locations.changes_from,
-                        old_changes,
-                    )
-                    await file.save(self.locations.extract_from, new_changes)
-                await file.save(self.locations.extract_from, self.locations.extract_to)
-                index_relative_path = file.archive.index.path.relative_to(
-                    self.locations.extract_from
-                )
-                archive_relative_path = file.archive.path.relative_to(
-                    self.locations.extract_from
+            self.extraction_progress.controls[0].controls[0].value = loc(
+                "Extractor Idle"
+            )
+            self.extraction_progress.controls[0].controls[1].value = ""
+            self.extraction_progress.controls[1].controls[0].value = 0
+            await self.page.update_async()
+        if report is None:
+            return await self.page.snack_bar.show(
+                loc("Verification cancelled"), color="red"
+            )
+        if report:
+            return await self.page.snack_bar.show(
+                loc("All {value} extracted files are intact").format(
+                    value=report.checked
                 )
-                self.hashes[str(index_relative_path)] = (
-                    await file.archive.index.content_hash
+            )
+        actions = [ElevatedButton(loc("Close"), on_click=self.page.RTT.close_dialog)]
+        if report.extra:
+            actions.append(
+                ElevatedButton(
+                    loc("Remove extra files"),
+                    data=(verifier, report),
+                    on_click=self.remove_extra_files,
                 )
-                self.hashes[str(archive_relative_path)] = (
-                    await file.archive.content_hash
+            )
+        if report.damaged:
+            actions.append(
+                ElevatedButton(
+                    loc("Repair files"),
+                    data=report,
+                    on_click=self.repair_extracted,
                 )
-            wrote = sum([f.size for f in changes])
-            saved = (
-                sum(
-                    [
-                        f["size"]
-                        for r in self.directory_list.rows
-                        for f in await r.data.files_list
-                    ]
+            )
+        await self.page.dialog.set_data(
+            modal=False,
+            title=Text(loc("Verification results")),
+            content=Text(
+                loc(
+                    "{missing} missing, {corrupt} corrupt and {extra} extra files in {path}"
+                ).format(
+                    missing=len(report.missing),
+                    corrupt=len(report.corrupt),
+                    extra=len(report.extra),
+                    path=self.locations.extract_to,
                 )
-                - wrote
+            ),
+            actions=actions,
+            actions_alignment=MainAxisAlignment.END,
+        )
+
+    async def remove_extra_files(self, event):
+        verifier, report = event.control.data
+        removed = await asyncio.to_thread(verifier.remove_extra, report)
+        report.extra = []
+        event.control.visible = False
+        await event.control.update_async()
+        await self.page.snack_bar.show(
+            loc("Removed {value} extra files").format(value=removed)
+        )
+
+    async def repair_extracted(self, event):
+        report = event.control.data
+        await self.page.dialog.hide()
+        self.main_controls.disabled = True
+        self.cancel_extraction_button.visible = True
+        await self.page.update_async()
+        manifest = ExtractionManifest.load(self.locations.extract_to)
+        self.extraction_engine = self.get_extraction_engine(
+            manifest, self.locations.extract_to
+        )
+        TreeVerifier.discard_blobs(report, self.extraction_engine.store)
+        try:
+            await self.run_extraction(report.jobs(), "repair")
+        finally:
+            if self.extraction_engine.cancelled:
+                manifest.flush()
+            else:
+                manifest.save()
+            self.main_controls.disabled = False
+            self.cancel_extraction_button.visible = False
+            self.extraction_progress.controls[0].controls[0].value = loc(
+                "Extractor Idle"
             )
-            metadata = {
-                "Extracted From": str(self.locations.extract_from),
-                "Extracted To": str(self.locations.extract_to),
-                "Compared with": str(self.locations.changes_from),
-                "Changes to": str(self.locations.changes_to),
-                "Date": datetime.now().isoformat(),
-                "Byte writes": wrote,
-                "Bytes saved": saved,
-                "Byte writes (Readable)": naturalsize(wrote, gnu=True),
-                "Bytes saved (Readable)": naturalsize(saved, gnu=True),
-                "Time elapsed (Seconds)": round(perf_counter() - start, 2),
-                "Extraction": {
-                    "Type": "Changes",
-                    "Indexes": sorted(
-                        list(
-                            set(
-                                [
-                                    str(
-                                        index.path.relative_to(
-                                            self.locations.extract_from
-                                        )
-                                    )
-                                    for index in selected_indexes
-                                ]
-                            )
-                        )
-                    ),
-                    "Archives": (
-                        list(
-                            set(
-                                [
-                                    str(
-                                        archive.path.relative_to(
-                                            self.locations.extract_from
-                                        )
-                                    )
-                                    for archive in selected_archives
-                                ]
-                            )
+            self.extraction_progress.controls[0].controls[1].value = ""
+            self.extraction_progress.controls[1].controls[0].value = 0
+            await self.page.update_async()
+        await self.page.snack_bar.show(
+            loc("Repaired {value} files").format(value=len(report.damaged))
+        )
+
+    def get_extraction_engine(self, manifest, *destinations, pack=None):
+        return ExtractionEngine(
+            self.locations.extract_from,
+            *destinations,
+            inflate_workers=self.page.preferences.extraction_inflate_workers,
+            write_workers=self.page.preferences.extraction_write_workers,
+            budget=self.page.preferences.extraction_memory_budget,
+            manifest=manifest,
+            store=None if pack is not None else self.get_blob_store(),
+            pack=pack,
+            writer=FileWriter(self.page.preferences.extraction_fsync),
+        )
+
+    def get_blob_store(self):
+        if not self.page.preferences.blob_store:
+            return None
+        return BlobStore(
+            self.page.preferences.blob_store_path
+            or self.page.RTT.app_data.joinpath("blob_store")
+        )
+
+    async def run_extraction(self, jobs, extraction_type):
+        """Runs the engine as a scheduled job, rendering its progress as published."""
+        engine = self.extraction_engine
+
+        async def extract(job):
+            job.attach(engine)
+
+            async def report(stats):
+                job.report(**stats.as_dict())
+
+            return await engine.extract(jobs, report)
+
+        async def on_progress(job):
+            if job is self.extraction_job:
+                await self.show_extraction_progress(engine.stats, extraction_type)
+
+        self.pause_extraction_button.text = loc("Pause extraction")
+        self.pause_extraction_button.visible = True
+        await self.pause_extraction_button.update_async()
+        self.extraction_job = scheduler.submit(
+            Job(f"Extract {extraction_type}", extract, kind="extraction")
+        )
+        unsubscribe = scheduler.subscribe(on_progress)
+        try:
+            return await self.extraction_job.wait()
+        finally:
+            unsubscribe()
+            self.extraction_job = None
+            self.pause_extraction_button.visible = False
+
+    async def show_extraction_progress(self, stats, extraction_type):
+        self.extraction_progress.controls[0].controls[0].value = (
+            loc(
+                "[{}%] | Elapsed: {:>3}s | Estimated {:>3}s remaining | Extracting {}"
+            ).format(
+                round(stats.progress * 100, 1),
+                round(stats.elapsed),
+                round(stats.eta),
+                extraction_type,
+            )
+            + ":\r"
+        )
+        self.extraction_progress.controls[0].controls[1].value = (
+            f"{stats.files}/{stats.total_files} | "
+            f"{round(stats.files_per_second)} files/s | "
+            f"{naturalsize(stats.bytes_per_second, gnu=True)}/s"
+        )
+        self.extraction_progress.controls[1].controls[0].value = (
+            round(stats.progress * 1000) / 1000
+        )
+        await self.extraction_progress.update_async()
+
+    async def extract(self, event):
+        self.main_controls.disabled = True
+        await self.page.dialog.hide()
+        await asyncio.sleep(0.5)
+        manifest = ExtractionManifest.load(self.locations.extract_to)
+        cancelled = False
+        try:
+            if event.control.data == "changes":
+                self.cancel_extraction_button.visible = False
+                new_changes = None
+                if self.page.preferences.advanced_mode:
+                    dated_folder = self.locations.changes_to.joinpath(
+                        datetime.now().strftime(
+                            self.page.preferences.changes_name_format.replace(
+                                "$dir", self.locations.extract_from.name
+                            ).strip()
                         )
-                    ),
-                    "Files": (
-                        list(
-                            set(
-                                [
-                                    str(f.path.relative_to(self.locations.extract_from))
-                                    for f in changes
-                                ]
-                            )
+                    )
+                    old_changes = dated_folder.joinpath("old")
+                    new_changes = dated_folder.joinpath("new")
+                    dated_folder.mkdir(parents=True, exist_ok=True)
+                    old_changes.mkdir(parents=True, exist_ok=True)
+                    new_changes.mkdir(parents=True, exist_ok=True)
+                    # This in case they want to re-run the extraction, possible
+                    self.manifest.save(
+                        old_changes.joinpath(ExtractionManifest.file_name)
+                    )
+                selected_indexes = [
+                    r.data for r in self.directory_list.rows if r.selected
+                ]
+                changes = [
+                    f
+                    for f in self.changed_files
+                    if self.selection.is_selected(f.archive.index)
+                ]
+                selected_archives = [f.archive for f in changes]
+                start = perf_counter()
+                destinations = [self.locations.extract_to]
+                if new_changes is not None:
+                    writer = FileWriter(self.page.preferences.extraction_fsync)
+                    for file in changes:
+                        await file.copy_old(
+                            self.locations.extract_from,
+                            self.locations.changes_from,
+                            old_changes,
+                            self.manifest,
+                            self.get_blob_store(),
+                            writer,
                         )
-                    ),
-                },
-            }
-            with open(new_changes.joinpath("metadata.yml"), "w+") as f:
-                dump(metadata, f, sort_keys=False)
-        elif event.control.data in ["all", "selected"]:
-            self.cancel_extraction_button.visible = True
-            await self.cancel_extraction_button.update_async()
-            if event.control.data == "all":
-                indexes = [r.data for r in self.directory_list.rows]
-            elif event.control.data == "selected":
-                indexes = [r.data for r in self.directory_list.rows if r.selected]
-            number_of_files = sum([len(await index.files_list) for index in indexes])
-            i = 0
-            start = perf_counter()
-            for index in indexes:
-                index_relative_path = index.path.relative_to(
-                    self.locations.extract_from
+                    writer.finish()
+                    destinations.append(new_changes)
+                jobs = {}
+                for file in changes:
+                    jobs.setdefault(file.archive.path, (file.archive, []))[1].append(
+                        file
+                    )
+                self.extraction_engine = self.get_extraction_engine(
+                    manifest, *destinations
                 )
-                self.hashes[str(index_relative_path)] = await index.content_hash
-                for archive in index.archives:
-                    archive_relative_path = archive.path.relative_to(
-                        self.locations.extract_from
+                await self.run_extraction(list(jobs.values()), event.control.data)
+                if self.locations.extract_to == self.locations.changes_from:
+                    await manifest.record_sync(
+                        selected_indexes, self.locations.extract_from
                     )
-                    self.hashes[str(archive_relative_path)] = await archive.content_hash
-                    async for file in archive.files():
-                        if self.cancel_extraction:
-                            self.cancel_extraction = False
-                            self.extraction_progress.controls[0].controls[0].value = (
-                                loc("Extractor Idle")
-                            )
-                            self.extraction_progress.controls[0].controls[1].value = ""
-                            self.extraction_progress.controls[1].controls[0].value = 0
-                            return await self.page.snack_bar.show(
-                                loc("Extraction cancelled"), color="red"
-                            )
-                        old_pro = self.extraction_progress.controls[1].controls[0].value
-                        i += 1
-                        if old_pro != (
-                            progress := round(i / number_of_files * 1000) / 1000
-                        ):
-                            elapsed = perf_counter() - start
-                            remaining = round(elapsed * (number_of_files / i - 1))
-                            self.extraction_progress.controls[0].controls[0].value = (
-                                loc(
-                                    "[{}%] | Elapsed: {:>3}s | Estimated {:>3}s remaining | Extracting {}"
-                                ).format(
-                                    round(i / number_of_files * 100, 1),
-                                    round(elapsed),
-                                    remaining,
-                                    event.control.data,
+                if new_changes is not None:
+                    wrote = sum([f.size for f in changes])
+                    saved = self.selection.all.size - wrote
+                    metadata = {
+                        "Extracted From": str(self.locations.extract_from),
+                        "Extracted To": str(self.locations.extract_to),
+                        "Compared with": str(self.locations.changes_from),
+                        "Changes to": str(self.locations.changes_to),
+                        "Date": datetime.now().isoformat(),
+                        "Byte writes": wrote,
+                        "Bytes saved": saved,
+                        "Byte writes (Readable)": naturalsize(wrote, gnu=True),
+                        "Bytes saved (Readable)": naturalsize(saved, gnu=True),
+                        "Time elapsed (Seconds)": round(perf_counter() - start, 2),
+                        "Extraction": {
+                            "Type": "Changes",
+                            "Indexes": sorted(
+                                list(
+                                    set(
+                                        [
+                                            str(
+                                                index.path.relative_to(
+                                                    self.locations.extract_from
+                                                )
+                                            )
+                                            for index in selected_indexes
+                                        ]
+                                    )
                                 )
-                                + ":\r"
-                            )
-                            self.extraction_progress.controls[0].controls[
-                                1
-                            ].value = file.name
-                            self.extraction_progress.controls[1].controls[
-                                0
-                            ].value = progress
-                            await self.extraction_progress.update_async()
-                        await file.save(
-                            self.locations.extract_from, self.locations.extract_to
-                        )
-        hashes_path = self.locations.extract_to.joinpath("hashes.json")
-        hashes_path.write_text(json.dumps(self.hashes, indent=4))
-        self.main_controls.disabled = False
-        self.cancel_extraction_button.visible = False
-        self.extraction_progress.controls[0].controls[0].value = loc("Extractor Idle")
-        self.extraction_progress.controls[0].controls[1].value = ""
-        self.extraction_progress.controls[1].controls[0].value = 0
-        await self.page.snack_bar.show(loc("Extraction Complete"))
+                            ),
+                            "Archives": (
+                                list(
+                                    set(
+                                        [
+                                            str(
+                                                archive.path.relative_to(
+                                                    self.locations.extract_from
+                                                )
+                                            )
+                                            for archive in selected_archives
+                                        ]
+                                    )
+                                )
+                            ),
+                            "Files": (
+                                list(
+                                    set(
+                                        [
+                                            str(
+                                                f.path.relative_to(
+                                                    self.locations.extract_from
+                                                )
+                                            )
+                                            for f in changes
+                                        ]
+                                    )
+                                )
+                            ),
+                        },
+                    }
+                    with open(new_changes.joinpath("metadata.yml"), "w+") as f:
+                        dump(metadata, f, sort_keys=False)
+                    # Index level diff, the only place removed files show up. The manifest
+                    # was pruned on its last sync, files deleted since aren't "removed"
+                    disk = await asyncio.to_thread(self.manifest.scan)
+                    diff = CatalogDiff.compare(
+                        Catalog.from_manifest(self.manifest, disk),
+                        await Catalog.from_installation(
+                            self.locations.extract_from, self.index_cache
+                        ),
+                    )
+                    diff.save(new_changes.joinpath("changes.yml"))
+            elif event.control.data in ["all", "selected", "filtered"]:
+                self.cancel_extraction_button.visible = True
+                await self.cancel_extraction_button.update_async()
+                if event.control.data == "selected":
+                    indexes = [r.data for r in self.directory_list.rows if r.selected]
+                else:
+                    indexes = [r.data for r in self.directory_list.rows]
+                if event.control.data == "filtered":
+                    # Matched on the index tables, archives without matches are skipped
+                    file_filter = FileFilter.parse(
+                        self.page.preferences.extraction_filter
+                    )
+                    jobs = await file_filter.jobs(indexes, self.locations.extract_from)
+                else:
+                    jobs = []
+                    for index in indexes:
+                        for archive in index.archives:
+                            jobs.append((archive, [f async for f in archive.files()]))
+                if self.page.preferences.packed_output:
+                    # Everything goes into one file, nothing for the manifest to track
+                    self.extraction_engine = self.get_extraction_engine(
+                        None,
+                        pack=PackWriter(
+                            self.locations.extract_to.joinpath(PackWriter.file_name),
+                            self.locations.extract_from,
+                        ),
+                    )
+                else:
+                    self.extraction_engine = self.get_extraction_engine(
+                        manifest, self.locations.extract_to
+                    )
+                await self.run_extraction(jobs, event.control.data)
+                if self.extraction_engine.cancelled:
+                    # Keep the journal around so the next run resumes from here
+                    manifest.flush()
+                    cancelled = True
+                # Sources mark whole archives as extracted, not true for a filtered run
+                elif (
+                    not self.page.preferences.packed_output
+                    and event.control.data != "filtered"
+                ):
+                    await manifest.record_sync(
+                        indexes,
+                        self.locations.extract_from,
+                        complete=event.control.data == "all",
+                    )
+            if not cancelled:
+                manifest.save()
+        finally:
+            self.main_controls.disabled = False
+            self.cancel_extraction_button.visible = False
+            self.extraction_progress.controls[0].controls[0].value = loc(
+                "Extractor Idle"
+            )
+            self.extraction_progress.controls[0].controls[1].value = ""
+            self.extraction_progress.controls[1].controls[0].value = 0
+            await self.page.update_async()
+        if cancelled:
+            return await self.page.snack_bar.show(
+                loc("Extraction cancelled"), color="red"
+            )
+        if self.extraction_engine.missing:
+            await self.page.snack_bar.show(
+                loc("Extraction Complete, {value} archives were missing").format(
+                    value=len(self.extraction_engine.missing)
+                ),
+                color="red",
+            )
+        else:
+            await self.page.snack_bar.show(loc("Extraction Complete"))
         self.refresh_lists.start()
@@ -41,6 +41,7 @@ from flet import (
     Stack,
     PopupMenuButton,
     PopupMenuItem,
+    ProgressRing,
 )
 from flet_core import padding, MainAxisAlignment, icons
 
@@ -52,8 +53,10 @@ from models.trove.mod import TMod, TroveModFile
 from utils.functions import throttle
 from utils.kiwiapi import KiwiAPI
 from utils.locale import loc
-from utils.trove.extractor import find_all_indexes
+from utils.trove.extractor import ExtractionManifest, find_all_indexes
+from utils.trove.index_cache import get_index_cache
 from utils.trove.registry import get_trove_locations, TroveGamePath
+from utils.trove.search_index import ContentIndex
 from utils.trove.yaml_mod import ModYaml
 
 
@@ -68,25 +71,30 @@ class ModdersController(Controller):
             self.extract_tab = Tab(loc("Extract TMod"))
             self.compile_tab = Tab(loc("Build TMod"))
             self.projects_tab = Tab(loc("Projects"))
+            self.search_tab = Tab(loc("Search Files"))
             self.settings = Column(expand=True)
             self.extract = Column(expand=True)
             self.compile = Column(expand=True)
             self.projects = Column(expand=True)
+            self.search = Column(expand=True)
             self.tabs.tabs.append(self.settings_tab)
             self.tabs.tabs.append(self.extract_tab)
             self.tabs.tabs.append(self.compile_tab)
             self.tabs.tabs.append(self.projects_tab)
+            self.tabs.tabs.append(self.search_tab)
             self.tab_map = {
                 0: self.load_settings,
                 1: self.load_extract,
                 2: self.load_compile,
                 3: self.load_projects,
+                4: self.load_search,
             }
             self.tab_controls = {
                 0: self.settings,
                 1: self.extract,
                 2: self.compile,
                 3: self.projects,
+                4: self.search,
             }
             self.main.controls.append(self.tabs)
             asyncio.create_task(self.load_tab(boot=True))
@@ -109,6 +117,7 @@ class ModdersController(Controller):
                 "config": None,
                 "version": None,
             },
+            "search": {"content_index": None, "stats": None},
         }
 
     def check_memory(self):
@@ -1939,14 +1948,19 @@ class ModdersController(Controller):
                     files.append(file)
         installation_path = self.memory["extract"]["installation_path"].path
         file_names = [f.name for f in files]
-        async for index in find_all_indexes(installation_path, {}, False):
+        index_cache = get_index_cache(
+            self.page.RTT.app_data.joinpath("index_cache.sqlite")
+        )
+        async for index in find_all_indexes(
+            installation_path, None, False, index_cache
+        ):
             for f in await index.files_list:
-                if f["name"] in file_names:
+                if f.name in file_names:
                     for file in files:
-                        if file.name == f["name"]:
-                            f_rel_path = (
-                                f["path"].relative_to(installation_path).as_posix()
-                            )
+                        if file.name == f.name:
+                            f_rel_path = f.path.relative_to(
+                                installation_path
+                            ).as_posix()
                             file_rel_path = file.relative_to(version_folder).as_posix()
                             if f_rel_path != file_rel_path:
                                 files.remove(file)
@@ -2017,3 +2031,149 @@ class ModdersController(Controller):
             mod.tmod_content
         )
         await self.page.snack_bar.show(f"Built TMod {mod.name}")
+
+    def search_path(self):
+        preferences = self.page.preferences
+        return (
+            preferences.modders_tools.search_path or preferences.directories.extract_to
+        )
+
+    async def load_search(self):
+        path = self.search_path()
+        self.search_path_text_field = TextField(
+            value=path.as_posix() if path else None,
+            label=loc("Extracted files folder"),
+            read_only=True,
+            expand=True,
+            icon=icons.FOLDER,
+            on_focus=self.select_search_path,
+        )
+        self.search_query = TextField(
+            label=loc("Search"),
+            hint_text=loc("Text to find in the extracted files"),
+            expand=True,
+            on_submit=self.search_files,
+        )
+        self.search_regex = Switch(label=loc("Regex"), value=False)
+        self.search_progress = ProgressRing(visible=False, width=24, height=24)
+        self.search_stats = Text(self.search_stats_text())
+        self.search_results = DataTable(
+            columns=[
+                DataColumn(Text(loc("File"))),
+                DataColumn(Text(loc("Line")), numeric=True),
+                DataColumn(Text(loc("Text"))),
+            ],
+            heading_row_height=35,
+            data_row_min_height=25,
+            column_spacing=15,
+        )
+        self.search.controls.extend(
+            [
+                Row(controls=[self.search_path_text_field]),
+                Row(
+                    controls=[
+                        self.search_query,
+                        self.search_regex,
+                        ElevatedButton(
+                            loc("Search"), icon=icons.SEARCH, on_click=self.search_files
+                        ),
+                        ElevatedButton(
+                            loc("Update index"),
+                            icon=icons.REFRESH,
+                            on_click=self.update_search_index,
+                        ),
+                        self.search_progress,
+                    ]
+                ),
+                self.search_stats,
+                Column(controls=[self.search_results], expand=True, scroll="auto"),
+            ]
+        )
+
+    def search_stats_text(self):
+        stats = self.memory["search"]["stats"]
+        if stats is None:
+            return loc("Index not built yet, it's updated on the first search")
+        return loc(
+            "{files} files ({text_files} text) | Index {size} | "
+            "Updated {indexed} files in {elapsed}s"
+        ).format(
+            files=stats.files,
+            text_files=stats.text_files,
+            size=humanize.naturalsize(stats.size),
+            indexed=stats.indexed,
+            elapsed=round(stats.elapsed, 2),
+        )
+
+    async def select_search_path(self, _):
+        self.page.overlay.clear()
+        picker = FilePicker(on_result=self.select_search_path_result)
+        self.page.overlay.append(picker)
+        await self.page.update_async()
+        await picker.get_directory_path_async(
+            dialog_title=loc("Select Extracted Files Folder")
+        )
+
+    async def select_search_path_result(self, result):
+        if not result.path:
+            return
+        path = Path(result.path)
+        self.page.preferences.modders_tools.search_path = path
+        self.page.preferences.save()
+        self.memory["search"] = {"content_index": None, "stats": None}
+        self.search_path_text_field.value = path.as_posix()
+        self.search_stats.value = self.search_stats_text()
+        await self.search.update_async()
+
+    async def update_search_index(self, _=None):
+        path = self.search_path()
+        if path is None or not path.joinpath(ExtractionManifest.file_name).exists():
+            await self.page.snack_bar.show(
+                loc("Extract the game files to this folder first"), color="red"
+            )
+            return None
+        self.search_progress.visible = True
+        await self.search.update_async()
+        try:
+            # Only files the manifest lists as changed since the last update are read
+            content_index, stats = await asyncio.to_thread(
+                ContentIndex.refresh,
+                path,
+                get_index_cache(self.page.RTT.app_data.joinpath("index_cache.sqlite")),
+            )
+        finally:
+            self.search_progress.visible = False
+        self.memory["search"] = {"content_index": content_index, "stats": stats}
+        self.search_stats.value = self.search_stats_text()
+        await self.search.update_async()
+        return content_index
+
+    async def search_files(self, _):
+        if not self.search_query.value:
+            return
+        content_index = self.memory["search"]["content_index"]
+        if content_index is None:
+            content_index = await self.update_search_index()
+            if content_index is None:
+                return
+        try:
+            hits = await asyncio.to_thread(
+                content_index.search,
+                self.search_query.value,
+                self.search_regex.value,
+                500,
+            )
+        except ValueError as e:
+            await self.page.snack_bar.show(str(e), color="red")
+            return
+        self.search_results.rows = [
+            DataRow(
+                cells=[
+                    DataCell(Text(hit.path, selectable=True)),
+                    DataCell(Text(str(hit.line))),
+                    DataCell(Text(hit.text, selectable=True)),
+                ]
+            )
+            for hit in hits
+        ]
+        await self.search_results.update_async()
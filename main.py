@@ -42,11 +42,17 @@ from utils import tasks
 
 from utils.protocol import set_protocol
 from utils.routing import Routing
+from utils.trove.memory_cache import memory_cache
 from utils.trove.server_time import ServerTime
 from views import all_views
 from utils.kiwiapi import KiwiAPI
 from utils import locale
-from utils.trove.registry import add_to_startup, remove_from_startup
+from utils.trove.registry import (
+    add_to_startup,
+    remove_from_startup,
+    get_trove_locations,
+)
+from utils.trove.patch_watcher import PatchWatcher
 from persistent import AsyncFileEventHandler
 from watchdog.observers import Observer
 from tasks import events
@@ -96,6 +102,7 @@ class App:
         await self.setup_protocol_socket()
         self.setup_localization()
         await self.setup_page()
+        self.setup_patch_watcher()
         await self.gather_views()
         await self.handshake_api()
         await self.process_login()
@@ -126,6 +133,29 @@ class App:
             observer.stop()
         observer.join()
 
+    def setup_patch_watcher(self):
+        """Compare game files in the background whenever an installation patches."""
+        self.patch_watcher = None
+        if not self.page.preferences.watch_patches:
+            return
+        self.patch_watcher = PatchWatcher(
+            self.page,
+            self.page.preferences.patch_settle_seconds,
+            self.patch_changes_ready,
+        )
+        for trove_location in get_trove_locations():
+            self.patch_watcher.watch(trove_location.path)
+        self.patch_watcher.start()
+
+    async def patch_changes_ready(self, prepared):
+        if not prepared.files:
+            return
+        await self.page.snack_bar.show(
+            locale.loc(
+                "Game update found, {value} changed files ready to extract"
+            ).format(value=len(prepared.files))
+        )
+
     def setup_folders(self):
         self.compiled = getattr(sys, "frozen", False)
         self.app_path = BasePath
@@ -194,6 +224,7 @@ class App:
             self.page.theme = Theme(
                 color_scheme_seed=str(self.page.preferences.accent_color)
             )
+        memory_cache.budget = self.page.preferences.memory_cache_budget
 
     async def load_constants(self):
         await fetch_files()
@@ -421,6 +452,8 @@ class App:
         await self.page.window_to_front()
 
     async def close_window(self):
+        if getattr(self, "patch_watcher", None) is not None:
+            self.patch_watcher.stop()
         await self.page.window_destroy_async()
 
     def create_image(self):
@@ -4,7 +4,8 @@ from pathlib import Path
 from binary_reader import BinaryReader
 
 from models.trove.mod import TroveMod, Property
-from utils.functions import get_attr, read_leb128, write_leb128, calculate_hash, chunks
+from utils.functions import get_attr, read_leb128, write_leb128, chunks
+from utils.hashing import checksums
 
 
 class TPack:
@@ -23,15 +24,15 @@ class TPack:
             pack.write_bytes(write_leb128(len(prop.value)))
             pack.write_str(prop.value)
         offset = 0
-        for file in self.files:
-            mod_data = file.mod_path.read_bytes()
+        mods = [file.mod_path.read_bytes() for file in self.files]
+        for file, mod_data, mod_hash in zip(self.files, mods, checksums(mods)):
             pack.write_int8(len(file.mod_path.name))
             pack.write_str(file.mod_path.name)
             pack.write_bytes(write_leb128(0))
             pack.write_bytes(write_leb128(0))
             pack.write_bytes(write_leb128(offset))
             pack.write_bytes(write_leb128(len(mod_data)))
-            pack.write_bytes(write_leb128(calculate_hash(mod_data, len(mod_data))))
+            pack.write_bytes(write_leb128(mod_hash))
             offset += len(mod_data)
             file_stream.write_bytes(mod_data)
         pack.seek(0)
@@ -17,7 +17,8 @@ from flet import (
     Stack,
 )
 
-from utils.trove.extractor import find_all_files
+from utils.trove.index_cache import get_index_cache
+from utils.trove.search_index import FileNameIndex
 
 
 class UserControl(Stack):
@@ -44,6 +45,7 @@ class PathViewer(UserControl):
             autofocus=True,
         )
         self.directories = {}
+        self.name_index = None
 
     def get_folder_tile(self, name, index):
         return ExpansionTile(
@@ -100,10 +102,12 @@ class PathViewer(UserControl):
 
     async def _load_files(self):
         self.directories = {}
-        files = find_all_files(self.installation_path, {})
-        file_names = None
+        cache = get_index_cache(self.page.RTT.app_data.joinpath("index_cache.sqlite"))
+        # Reloaded after a patch, the cached rows would point at the old tables
+        if self.name_index is None or await self.name_index.changed(cache):
+            self.name_index = await FileNameIndex.load(self.installation_path, cache)
+        file_names = []
         if "_" not in self.query:
-            file_names = []
             headers = {"User-Agent": f"RenewedTroveTools/{self.page.metadata.version}"}
             async with ClientSession(headers=headers) as session:
                 query = quote_plus(self.query)
@@ -120,12 +124,16 @@ class PathViewer(UserControl):
                                     file_names.append(part.lower() + ".blueprint")
                                 for vfx in result.get("vfx"):
                                     file_names.append(vfx)
-        async for file in files:
-            if not self.query:
-                break
-            if file.path.name not in file_names:
-                if self.query.lower() not in file.path.name.lower():
-                    continue
+        files = await self.name_index.files(self.query)
+        for name in file_names:
+            files.extend(
+                f for f in await self.name_index.files(name) if f.path.name == name
+            )
+        found = set()
+        for file in files:
+            if file.path in found:
+                continue
+            found.add(file.path)
             index = file.index
             cursor = self.directories
             path_parts = (
@@ -175,7 +183,7 @@ class PathViewer(UserControl):
         relative_path = file.path.relative_to(self.installation_path)
         project_path = self.project_path.joinpath(relative_path)
         project_path.parent.mkdir(parents=True, exist_ok=True)
-        project_path.write_bytes(await file.content)
+        project_path.write_bytes(await file.read())
         event.control.disabled = True
         event.control.icon = icons.CHECK
         event.control.icon_color = "green"
@@ -63,6 +63,7 @@ class ModManagerPreferences(BaseModel):
 
 class ModdersToolsPreferences(BaseModel):
     project_path: Optional[Path] = None
+    search_path: Optional[Path] = None
 
 
 class NotificationType(Enum):
@@ -117,6 +118,18 @@ class Preferences(BaseModel):
     advanced_mode: bool = False
     performance_mode: bool = False
     changes_name_format: str = "%Y-%m-%d %H-%M-%S $dir"
+    extraction_memory_budget: int = 32 * 1024 * 1024
+    extraction_inflate_workers: int = 0
+    extraction_write_workers: int = 4
+    extraction_fsync: str = "never"
+    memory_cache_budget: int = 256 * 1024 * 1024
+    blob_store: bool = False
+    # Defaults to the app data folder, hardlinks need it on the same drive as the trees
+    blob_store_path: Optional[Path] = None
+    packed_output: bool = False
+    extraction_filter: str = ""
+    watch_patches: bool = True
+    patch_settle_seconds: int = 30
     directories: Directories = Field(default_factory=Directories)
     dismissables: DismissableContent = Field(default_factory=DismissableContent)
     mod_manager: ModManagerPreferences = Field(default_factory=ModManagerPreferences)
@@ -17,7 +17,8 @@ from toml import dumps
 import re
 import os
 
-from utils.functions import read_leb128, write_leb128, calculate_hash, chunks, get_attr
+from utils.functions import read_leb128, write_leb128, chunks, get_attr
+from utils.hashing import checksum, checksums
 from utils.logger import log
 from ..trovesaurus.mods import Mod
 from utils.trove.registry import TroveGamePath
@@ -58,6 +59,8 @@ class TroveModFile:
 
     def __init__(self, trove_path: Path, data: bytes):
         self.trove_path = trove_path.as_posix().lower()
+        # The reader copies what it's given, hashing reads these bytes instead
+        self._buffer = data
         self._content = BinaryReader(bytearray(data))
         self._checksum = None
 
@@ -74,6 +77,14 @@ class TroveModFile:
     @content.setter
     def content(self, value: BinaryReader):
         self._content = value
+        self._buffer = None
+
+    @property
+    def buffer(self):
+        """The file's bytes, without the copy BinaryReader.buffer() makes when possible."""
+        if self._buffer is None:
+            self._buffer = self.content.buffer()
+        return self._buffer
 
     @property
     def data(self) -> bytes:
@@ -90,9 +101,7 @@ class TroveModFile:
     @property
     def checksum(self):
         if self._checksum is None:
-            self._checksum = calculate_hash(
-                bytes(self.content.buffer()), len(self.content.buffer())
-            )
+            self._checksum = checksum(self.buffer)
         return self._checksum
 
     @property
@@ -108,7 +117,7 @@ class TroveModFile:
         data.write_int8(len(str(self.trove_path)))
         data.write_str(str(self.trove_path))
         data.extend(write_leb128(self.index))
-        data.extend(write_leb128(self.offset if self.content.buffer() else 0))
+        data.extend(write_leb128(self.offset if self.size else 0))
         data.extend(write_leb128(self.size))
         data.extend(write_leb128(self.checksum))
         return data.buffer()
@@ -121,6 +130,7 @@ class PartialTroveModFile(TroveModFile):
         super().__init__(trove_path, b"")
         self.trove_path = trove_path.as_posix().lower()
         self._content = None
+        self._buffer = None
         self._checksum = None
 
     @property
@@ -166,6 +176,7 @@ class PartialTroveModFile(TroveModFile):
     @content.setter
     def content(self, value: BinaryReader):
         self._content = value
+        self._buffer = None
 
 
 class TroveMod:
@@ -391,6 +402,13 @@ class TroveMod:
             return prop.value
         return None
 
+    def compute_checksums(self):
+        """Hashes every file not hashed yet in a single batch."""
+        files = [file for file in self.files if file._checksum is None]
+        buffers = [file.buffer for file in files]
+        for file, value in zip(files, checksums(buffers)):
+            file._checksum = value
+
     def reorder_files(self):
         offset = 0
         for file in self.files:
@@ -457,6 +475,7 @@ class TroveMod:
         for chunk in chunked_file_stream:
             file_stream.extend(bytearray(compressor.compress(chunk)))
         file_stream.extend(bytearray(compressor.flush(zlib.Z_SYNC_FLUSH)))
+        self.compute_checksums()
         for i, file in enumerate(self.files, 1):
             files_list_stream.extend(bytearray(file.header_format))
         header_stream.write_uint64(0)
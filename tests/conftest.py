@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from tools.trove_corpus import generate
+from utils.trove.extractor import find_all_indexes
+
+
+@pytest.fixture(scope="session")
+def corpus(tmp_path_factory) -> Path:
+    """A small installation with a few indexes spread over several archives."""
+    root = tmp_path_factory.mktemp("game")
+    generate(
+        root,
+        files=300,
+        huge=1,
+        huge_size=256 * 1024,
+        indexes=6,
+        archives=3,
+        max_archive_size=128 * 1024,
+        seed=1,
+    )
+    return root
+
+
+async def indexes(root: Path) -> list:
+    return [index async for index in find_all_indexes(root, None, False)]
+
+
+async def jobs(root: Path) -> list:
+    result = []
+    for index in await indexes(root):
+        await index.files_list
+        for archive in index.archives:
+            result.append((archive, [file async for file in archive.files()]))
+    return result
@@ -0,0 +1,60 @@
+import asyncio
+import os
+
+from tests.conftest import jobs
+from utils.hashing import file_checksum
+from utils.trove.blob_store import BlobStore
+from utils.trove.extractor import ExtractionEngine, ExtractionManifest
+
+
+def test_each_content_is_stored_once(corpus, tmp_path):
+    all_jobs = asyncio.run(jobs(corpus))
+    files = [file for _, archive_files in all_jobs for file in archive_files]
+    store = BlobStore(tmp_path.joinpath("store"))
+    first, second = tmp_path.joinpath("first"), tmp_path.joinpath("second")
+    manifest = ExtractionManifest.load(first)
+    engine = ExtractionEngine(corpus, first, second, manifest=manifest, store=store)
+    stats = asyncio.run(engine.extract(all_jobs))
+    assert stats.files == len(files)
+    blobs = [path for path in store.root.rglob("*") if path.is_file()]
+    assert len(blobs) == len({(file.size, file.hash) for file in files})
+    assert not [path for path in blobs if path.name.endswith(".part")]
+    for file in files:
+        blob = store.blob_path(file).stat()
+        for output in [first, second]:
+            path = file.extracted_path(corpus, output)
+            assert file_checksum(path) == file.hash
+            assert os.path.samefile(path, store.blob_path(file))
+        assert blob.st_nlink >= 3
+    assert len(manifest.files) == len(files)
+
+
+def test_known_blobs_are_linked_without_extracting(corpus, tmp_path):
+    all_jobs = asyncio.run(jobs(corpus))
+    store = BlobStore(tmp_path.joinpath("store"))
+    asyncio.run(
+        ExtractionEngine(corpus, tmp_path.joinpath("first"), store=store).extract(
+            all_jobs
+        )
+    )
+    engine = ExtractionEngine(corpus, tmp_path.joinpath("second"), store=store)
+    asyncio.run(engine.extract(all_jobs))
+    assert engine.stats.archives == 0
+    assert engine.stats.files == engine.stats.total_files
+
+
+def test_copies_when_hardlinks_fail(tmp_path, monkeypatch):
+    store = BlobStore(tmp_path.joinpath("store"))
+    blob = tmp_path.joinpath("blob")
+    blob.write_bytes(b"content")
+    target = tmp_path.joinpath("tree", "file.txt")
+    assert store.link(blob, target)
+    assert os.path.samefile(blob, target)
+
+    def link(source, destination):
+        raise OSError("hardlinks not supported")
+
+    monkeypatch.setattr(os, "link", link)
+    assert not store.link(blob, target)
+    assert not os.path.samefile(blob, target)
+    assert target.read_bytes() == b"content"
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import yaml
+
+from tests.conftest import indexes, jobs
+from utils.trove.diff import Catalog, CatalogDiff, find_changes
+from utils.trove.extractor import ExtractionEngine, ExtractionManifest, FileStatus
+
+
+def test_compare_catalogs():
+    old = Catalog("old", {"a": (1, 1), "b": (2, 2), "c": (3, 3)})
+    new = Catalog("new", {"a": (1, 1), "b": (2, 20), "d": (4, 4)})
+    diff = CatalogDiff.compare(old, new)
+    assert [(e.path, e.status) for e in diff.entries] == [
+        ("b", FileStatus.changed),
+        ("c", FileStatus.removed),
+        ("d", FileStatus.added),
+    ]
+    changed = diff.changed[0]
+    assert (changed.size, changed.hash, changed.old_size, changed.old_hash) == (
+        2,
+        20,
+        2,
+        2,
+    )
+    assert diff.removed[0].as_dict() == {
+        "path": "c",
+        "status": "removed",
+        "old_size": 3,
+        "old_hash": 3,
+    }
+
+
+def test_identical_catalogs_have_no_entries():
+    catalog = Catalog("game", {"a": (1, 1)})
+    assert CatalogDiff.compare(catalog, Catalog("copy", catalog)).entries == []
+
+
+def test_save_report(tmp_path):
+    diff = CatalogDiff.compare(Catalog("old", {"a": (1, 1)}), Catalog("new"))
+    diff.save(tmp_path.joinpath("changes.json"))
+    diff.save(tmp_path.joinpath("changes.yml"))
+    report = json.loads(tmp_path.joinpath("changes.json").read_text())
+    assert report["Summary"] == {"Added": 0, "Changed": 0, "Removed": 1}
+    assert report["Files"] == [e.as_dict() for e in diff.entries]
+    saved = yaml.safe_load(tmp_path.joinpath("changes.yml").read_text())
+    assert {**saved, "Date": None} == {**report, "Date": None}
+
+
+def test_manifest_catalog_matches_installation(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    engine = ExtractionEngine(corpus, tmp_path, manifest=manifest)
+    asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+    manifest.save()
+    installation = asyncio.run(Catalog.from_installation(corpus))
+    extracted = asyncio.run(Catalog.load(tmp_path))
+    assert CatalogDiff.compare(extracted, installation).entries == []
+    # Entries of files deleted from the tree are left out given a scan
+    key = next(iter(manifest.files))
+    tmp_path.joinpath(key).unlink()
+    catalog = Catalog.from_manifest(manifest, manifest.scan())
+    assert key not in catalog
+    assert len(catalog) == len(installation) - 1
+
+
+def test_find_changes(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    engine = ExtractionEngine(corpus, tmp_path, manifest=manifest)
+    asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+    manifest.save()
+    files = asyncio.run(indexes(corpus))
+    assert asyncio.run(find_changes(files, corpus, manifest)) == []
+    key = next(iter(manifest.files))
+    path = tmp_path.joinpath(key)
+    path.write_bytes(path.read_bytes() + b"patched")
+    # Untracked edits are caught by hashing the file against its index
+    del manifest.files[key]
+    changes = asyncio.run(find_changes(files, corpus, manifest))
+    assert [file.relative_path(corpus) for file in changes] == [key]
+    assert changes[0].status == FileStatus.changed
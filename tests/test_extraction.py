@@ -0,0 +1,76 @@
+import asyncio
+import os
+import shutil
+
+from tests.conftest import jobs
+from utils.hashing import checksum, file_checksum
+from utils.trove.blob_store import BlobStore
+from utils.trove.extractor import ExtractionEngine, ExtractionManifest
+from utils.trove.file_writer import FileWriter, FsyncPolicy
+
+# Far below the archives' sizes so most files are cut across several chunks
+BUDGET = 4096
+
+
+def test_stream_reassembles_files_across_chunks(corpus):
+    spanning = 0
+    for archive, files in asyncio.run(jobs(corpus)):
+        contents = {file.row: bytearray(file.size) for file in files}
+        pieces = {file.row: 0 for file in files}
+        for file, at, piece in archive.stream(files, BUDGET):
+            assert len(piece) <= BUDGET
+            contents[file.row][at : at + len(piece)] = piece
+            pieces[file.row] += 1
+        for file in files:
+            assert checksum(contents[file.row]) == file.hash
+        spanning += sum(count > 1 for count in pieces.values())
+    assert spanning
+
+
+def test_engine_writes_files_across_chunks(corpus, tmp_path):
+    all_jobs = asyncio.run(jobs(corpus))
+    engine = ExtractionEngine(corpus, tmp_path, budget=BUDGET, queue_size=2)
+    stats = asyncio.run(engine.extract(all_jobs))
+    assert stats.files == stats.total_files
+    for _, files in all_jobs:
+        for file in files:
+            assert file_checksum(file.extracted_path(corpus, tmp_path)) == file.hash
+
+
+def test_missing_archive_is_skipped(corpus, tmp_path):
+    game = tmp_path.joinpath("game")
+    shutil.copytree(corpus, game)
+    all_jobs = asyncio.run(jobs(game))
+    gone, gone_files = all_jobs[0]
+    gone.path.unlink()
+    output = tmp_path.joinpath("output")
+    manifest = ExtractionManifest.load(output)
+    engine = ExtractionEngine(game, output, manifest=manifest)
+    stats = asyncio.run(engine.extract(all_jobs))
+    assert engine.missing == [gone]
+    assert stats.files == stats.total_files
+    assert stats.files == sum(len(files) for _, files in all_jobs[1:])
+    assert not gone_files[0].extracted_path(game, output).exists()
+    assert not manifest.archive_completed(gone, game)
+
+
+def test_short_writes_are_completed(corpus, tmp_path, monkeypatch):
+    write = os.write
+    # Like a write interrupted by a signal, only part of the buffer lands
+    monkeypatch.setattr(os, "write", lambda fd, data: write(fd, data[:1000]))
+    test_engine_writes_files_across_chunks(corpus, tmp_path)
+
+
+def test_store_blobs_follow_the_fsync_policy(corpus, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(FileWriter, "finish", lambda self: synced.extend(self._written))
+    store = BlobStore(tmp_path.joinpath("store"))
+    engine = ExtractionEngine(
+        corpus,
+        tmp_path.joinpath("output"),
+        store=store,
+        writer=FileWriter(FsyncPolicy.end),
+    )
+    asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+    blobs = {path for path in store.root.rglob("*") if path.is_file()}
+    assert blobs and blobs <= set(synced)
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from tests.conftest import jobs
+from utils.hashing import checksum
+from utils.trove.cli import get_parser
+from utils.trove.diff import Catalog
+from utils.trove.extraction_pack import PackReader, PackWriter
+from utils.trove.extractor import ExtractionEngine
+
+
+def test_pack_round_trip(corpus, tmp_path):
+    path = tmp_path.joinpath(PackWriter.file_name)
+    engine = ExtractionEngine(corpus, pack=PackWriter(path, corpus))
+    stats = asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+    installation = asyncio.run(Catalog.from_installation(corpus))
+    assert stats.files == len(installation)
+    assert PackReader.is_pack(path)
+    assert not path.with_name(path.name + ".part").exists()
+    with PackReader(path) as pack:
+        assert len(pack) == len(installation)
+        assert {name: (size, hash) for name, size, hash in pack.entries()} == (
+            installation
+        )
+        for name, (size, hash) in installation.items():
+            data = pack.read(name)
+            assert (len(data), checksum(data)) == (size, hash)
+        name = next(iter(installation))
+        extracted = pack.extract(name, tmp_path.joinpath("out"))
+        assert extracted.read_bytes() == pack.read(name)
+    assert Catalog.from_pack(path) == installation
+
+
+def test_not_a_pack(tmp_path):
+    path = tmp_path.joinpath("broken.rttpack")
+    path.write_bytes(b"RTTPACK\x01 but cut short")
+    with pytest.raises(ValueError):
+        PackReader(path)
+
+
+def test_pack_command_has_no_store(tmp_path):
+    with pytest.raises(SystemExit):
+        get_parser().parse_args(
+            ["pack", "game", "files.rttpack", "--store", str(tmp_path)]
+        )
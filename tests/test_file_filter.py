@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from tests.conftest import indexes
+from utils.trove.file_filter import FileFilter, parse_size
+
+
+def test_parse_size():
+    assert parse_size("512") == 512
+    assert parse_size("10k") == 10 * 1024
+    assert parse_size("1.5M") == 1536 * 1024
+    assert parse_size("2GiB") == 2 * 1024**3
+    with pytest.raises(ValueError):
+        parse_size("ten")
+
+
+def test_parse_expression():
+    file_filter = FileFilter.parse('"ui/*" !ui/old/* ext:png,.DDS re:icon size:1k-2M')
+    assert file_filter.include == ["ui/*"]
+    assert file_filter.exclude == ["ui/old/*"]
+    assert file_filter.extensions == ["png", "dds"]
+    assert file_filter.regex == "icon"
+    assert (file_filter.min_size, file_filter.max_size) == (1024, 2 * 1024**2)
+    assert FileFilter.parse("size:>1k").min_size == 1024
+    assert FileFilter.parse("size:<1k").max_size == 1024
+    with pytest.raises(ValueError):
+        FileFilter.parse("re:(")
+
+
+def test_empty_filter_is_falsy():
+    assert not FileFilter()
+    assert not FileFilter.parse("")
+    assert FileFilter(min_size=0)
+
+
+def test_matches_path():
+    file_filter = FileFilter(["ui/*", "*.blueprint"], ["ui/old/*"], extensions=["PNG"])
+    assert file_filter.matches_path("ui/icon.png")
+    assert file_filter.matches_path("UI/ICON.PNG")
+    assert not file_filter.matches_path("ui/old/icon.png")
+    assert not file_filter.matches_path("ui/icon.dds")
+    assert not file_filter.matches_path("models/icon.png")
+    regex = FileFilter(regex=r"_\d+\.xml$")
+    assert regex.matches_path("ui/file_001.xml")
+    assert not regex.matches_path("ui/file.xml")
+
+
+def test_files_match_a_full_scan(corpus):
+    file_filter = FileFilter(["blueprints/*", "ui/*"], ["*.wav"], min_size=1024)
+    for index in asyncio.run(indexes(corpus)):
+        expected = [
+            file.row
+            for file in asyncio.run(index.files_list)
+            if file_filter.matches(file, corpus)
+        ]
+        files = asyncio.run(file_filter.files(index, corpus))
+        assert [file.row for file in files] == expected
+
+
+def test_jobs_only_hold_matching_archives(corpus):
+    file_filter = FileFilter(extensions=["xml"])
+    jobs = asyncio.run(file_filter.jobs(asyncio.run(indexes(corpus)), corpus))
+    assert jobs
+    for archive, files in jobs:
+        assert files
+        assert all(file.archive == archive for file in files)
+        assert all(file.name.endswith(".xml") for file in files)
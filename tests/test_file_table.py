@@ -0,0 +1,106 @@
+import gc
+
+from binary_reader import BinaryReader
+
+from utils.functions import read_leb128, write_leb128
+from utils.trove.extractor import FileTable, TFIndex
+from utils.trove.index_cache import IndexCache
+from utils.trove.memory_cache import memory_cache
+
+
+def baseline_entries(data: bytes) -> list[tuple]:
+    """The original index.tfi parser, reading entries one field at a time."""
+    reader = BinaryReader(bytearray(data))
+    entries = []
+    while reader.pos() < reader.size():
+        name = reader.read_str(read_leb128(reader, reader.pos()))
+        archive_index = read_leb128(reader, reader.pos())
+        offset = read_leb128(reader, reader.pos())
+        size = read_leb128(reader, reader.pos())
+        hash = read_leb128(reader, reader.pos())
+        entries.append((name, archive_index, offset, size, hash))
+    return entries
+
+
+def table_entries(table: FileTable) -> list[tuple]:
+    return [
+        (
+            table.name(row),
+            table.archive_indexes[row],
+            table.offsets[row],
+            table.sizes[row],
+            table.hashes[row],
+        )
+        for row in range(len(table))
+    ]
+
+
+def encode(entries: list[tuple]) -> bytes:
+    data = bytearray()
+    for name, *values in entries:
+        encoded = name.encode()
+        data += write_leb128(len(encoded)) + encoded
+        for value in values:
+            data += write_leb128(value)
+    return bytes(data)
+
+
+def test_parse_matches_baseline_parser(corpus):
+    indexes = list(corpus.rglob("index.tfi"))
+    assert indexes
+    for path in indexes:
+        data = path.read_bytes()
+        assert table_entries(FileTable.parse(data)) == baseline_entries(data)
+
+
+def test_parse_multi_byte_values():
+    entries = [
+        ("a.txt", 0, 0, 0, 0),
+        ("ui/" + "n" * 200 + ".xml", 1, 127, 128, 0xFFFFFFFF),
+        ("big.dds", 300, 2**28 + 5, 2**21, 16384),
+    ]
+    data = encode(entries)
+    assert baseline_entries(data) == entries
+    assert table_entries(FileTable.parse(data)) == entries
+
+
+def test_archive_rows_sorted_by_offset():
+    entries = [("c", 1, 50, 5, 1), ("a", 0, 10, 5, 2), ("b", 1, 0, 5, 3)]
+    table = FileTable.parse(encode(entries))
+    assert list(table.rows_for(1)) == [2, 0]
+    assert list(table.rows_for(0)) == [1]
+    assert list(table.rows_for(7)) == []
+
+
+def test_parse_empty_index():
+    table = FileTable.parse(b"")
+    assert len(table) == 0
+    assert table_entries(table) == []
+
+
+def test_evicted_table_comes_back_from_the_index_cache(corpus, tmp_path, monkeypatch):
+    cache = IndexCache(tmp_path.joinpath("cache.sqlite"))
+    path = next(corpus.rglob("index.tfi"))
+    index = TFIndex(path, cache)
+    expected = table_entries(index.load())
+    file = index.table[0]
+    memory_cache.clear()
+    gc.collect()
+
+    def parse(data):
+        raise AssertionError("parsed again instead of using the index cache")
+
+    monkeypatch.setattr(FileTable, "parse", parse)
+    assert table_entries(index.table) == expected
+    assert file.name == expected[0][0]
+
+
+def test_tables_are_cached_per_file(corpus, tmp_path):
+    path = next(corpus.rglob("index.tfi"))
+    memory_cache.clear()
+    TFIndex(path).load()
+    second = TFIndex(path)
+    second.load()
+    keys = [key for key in memory_cache._entries if key[0] == "table"]
+    assert keys == [("table", *second.cache_key)]
+    assert memory_cache.get(keys[0]).index is second
@@ -0,0 +1,40 @@
+import random
+
+import pytest
+
+from utils import hashing
+from utils.hashing import calculate_hash, checksum, checksums, python_hash
+
+native = pytest.mark.skipif(not hashing.native, reason="native library not built")
+
+
+def samples():
+    generator = random.Random(20)
+    for length in range(0, 40):
+        yield bytes(generator.randrange(256) for _ in range(length))
+    for tail in range(4):
+        # Trailing bytes with the high bit set are read as signed chars
+        yield b"\x80\xff\xfe\x90\x81\xa0\xc3"[: 4 + tail]
+        yield bytes([0x80 + tail] * tail)
+        yield bytes([0x7F] * tail)
+
+
+@native
+@pytest.mark.parametrize(
+    "data", list(samples()), ids=lambda data: data.hex() or "empty"
+)
+def test_python_hash_matches_native(data):
+    assert python_hash(data) == calculate_hash(data, len(data))
+
+
+def test_checksum_reads_any_buffer():
+    data = bytes(range(256)) * 3 + b"\xff\x80"
+    expected = python_hash(data)
+    assert checksum(data) == expected
+    assert checksum(bytearray(data)) == expected
+    assert checksum(memoryview(data)) == expected
+    assert checksums([data, b"", data[:5]]) == [
+        expected,
+        python_hash(b""),
+        python_hash(data[:5]),
+    ]
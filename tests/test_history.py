@@ -0,0 +1,62 @@
+import asyncio
+import os
+import shutil
+
+from tests.conftest import indexes
+from tools.trove_corpus import write_index
+from utils.trove.history import FileHistory
+
+
+def patch(directory, entries):
+    write_index(directory, entries, 1, 1024 * 1024)
+    index = directory.joinpath("index.tfi")
+    stat = index.stat()
+    # Make sure the index looks modified even on coarse mtime filesystems
+    os.utime(index, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def update(history, root, label=None):
+    return history.update(root, asyncio.run(indexes(root)), label)
+
+
+def test_versions_record_only_what_changed(tmp_path):
+    root = tmp_path.joinpath("game")
+    history = FileHistory(tmp_path.joinpath("history.sqlite"))
+    try:
+        patch(root.joinpath("ui"), [("a.xml", b"a"), ("b.xml", b"b")])
+        patch(root.joinpath("audio"), [("c.wav", b"c")])
+        first = update(history, root, "initial")
+        assert first is not None
+        # Nothing moved, nothing recorded
+        assert update(history, root) is None
+        patch(root.joinpath("ui"), [("a.xml", b"changed"), ("d.xml", b"d")])
+        second = update(history, root, "patch")
+        assert [
+            (v["id"], v["label"], v["changes"]) for v in history.versions(root)
+        ] == [
+            (first, "initial", 3),
+            (second, "patch", 3),
+        ]
+        a = history.file(root, "ui/a.xml")
+        assert (a["first_seen"], a["last_changed"], a["removed"]) == (
+            first,
+            second,
+            None,
+        )
+        assert a["size"] == len(b"changed")
+        assert history.file(root, "ui/b.xml")["removed"] == second
+        assert history.file(root, "ui/d.xml")["first_seen"] == second
+        assert [
+            (c["version"], c["status"]) for c in history.file_changes(root, "ui/a.xml")
+        ] == [(first, "added"), (second, "changed")]
+        assert [f["path"] for f in history.directory(root, "ui")] == [
+            "ui/a.xml",
+            "ui/b.xml",
+            "ui/d.xml",
+        ]
+        # Whole index gone
+        shutil.rmtree(root.joinpath("audio"))
+        third = update(history, root)
+        assert history.file(root, "audio/c.wav")["removed"] == third
+    finally:
+        history.close()
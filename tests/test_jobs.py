@@ -0,0 +1,120 @@
+import asyncio
+
+from utils.jobs import Job, JobScheduler, JobStatus
+
+
+async def record(job, order, name, gate=None):
+    if gate is not None:
+        await gate.wait()
+    await job.checkpoint()
+    order.append(name)
+    return name
+
+
+def run(test):
+    async def main():
+        scheduler = JobScheduler(interval=0.01)
+        try:
+            await test(scheduler)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(main())
+
+
+def test_higher_priority_runs_first():
+    async def test(scheduler):
+        order = []
+        gate = asyncio.Event()
+        blocker = scheduler.submit(Job("blocker", record, order, "blocker", gate))
+        await asyncio.sleep(0)
+        low = scheduler.submit(Job("low", record, order, "low"))
+        high = scheduler.submit(Job("high", record, order, "high", priority=2))
+        same = scheduler.submit(Job("same", record, order, "same", priority=2))
+        gate.set()
+        await asyncio.gather(blocker.wait(), low.wait(), high.wait(), same.wait())
+        assert order == ["blocker", "high", "same", "low"]
+
+    run(test)
+
+
+def test_paused_queued_job_does_not_hold_the_worker():
+    async def test(scheduler):
+        order = []
+        paused = Job("paused", record, order, "paused")
+        paused.pause()
+        scheduler.submit(paused)
+        other = scheduler.submit(Job("other", record, order, "other"))
+        assert await asyncio.wait_for(other.wait(), 1) == "other"
+        assert paused.status == JobStatus.paused
+        paused.resume()
+        assert await asyncio.wait_for(paused.wait(), 1) == "paused"
+        assert order == ["other", "paused"]
+
+    run(test)
+
+
+def test_cancelling_a_parked_job_ends_it():
+    async def test(scheduler):
+        job = Job("parked", record, [], "parked")
+        job.pause()
+        scheduler.submit(job)
+        await asyncio.sleep(0.01)
+        job.cancel()
+        await asyncio.wait_for(job._done.wait(), 1)
+        assert job.status == JobStatus.cancelled
+        assert not scheduler.active()
+
+    run(test)
+
+
+def test_pause_holds_a_running_job_at_its_checkpoint():
+    async def test(scheduler):
+        order = []
+        gate = asyncio.Event()
+        job = scheduler.submit(Job("job", record, order, "job", gate))
+        await asyncio.sleep(0)
+        assert job.status == JobStatus.running
+        job.pause()
+        gate.set()
+        await asyncio.sleep(0.05)
+        assert order == []
+        job.resume()
+        await asyncio.wait_for(job.wait(), 1)
+        assert order == ["job"]
+
+    run(test)
+
+
+def test_background_jobs_run_on_their_own_worker():
+    async def test(scheduler):
+        order = []
+        gate = asyncio.Event()
+        background = scheduler.submit(
+            Job("history", record, order, "history", gate, priority=-1)
+        )
+        user = scheduler.submit(Job("extract", record, order, "extract"))
+        await asyncio.wait_for(user.wait(), 1)
+        assert background.status == JobStatus.running
+        gate.set()
+        await background.wait()
+        assert order == ["extract", "history"]
+
+    run(test)
+
+
+def test_failed_job_raises_on_wait():
+    async def fail(job):
+        raise ValueError("broken")
+
+    async def test(scheduler):
+        job = scheduler.submit(Job("fail", fail))
+        try:
+            await job.wait()
+        except ValueError as e:
+            assert str(e) == "broken"
+        else:
+            raise AssertionError("wait should raise the job's error")
+        assert job.status == JobStatus.failed
+
+    run(test)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import os
+
+from tests.conftest import indexes, jobs
+from utils.trove.extractor import ExtractionEngine, ExtractionManifest, FileStatus
+
+
+def extract(corpus, output, manifest):
+    engine = ExtractionEngine(corpus, output, manifest=manifest)
+    return asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+
+
+def test_journal_replays_into_a_new_manifest(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    stats = extract(corpus, tmp_path, manifest)
+    # Interrupted before save, only the journal made it to disk
+    manifest.flush()
+    assert not manifest.path.exists()
+    resumed = ExtractionManifest.load(tmp_path)
+    assert resumed.resumable
+    assert resumed.files == manifest.files
+    assert len(resumed.files) == stats.files
+    assert resumed.completed_archives == manifest.completed_archives
+
+
+def test_journal_ignores_a_torn_last_line(tmp_path):
+    journal = tmp_path.joinpath(ExtractionManifest.journal_name)
+    journal.write_text(
+        json.dumps(["f", "a.txt", 1, 2, 3, 4])
+        + "\n"
+        + json.dumps(["a", "ui/archive0.tfa"])
+        + "\n"
+        + '["f", "b.t'
+    )
+    manifest = ExtractionManifest.load(tmp_path)
+    assert manifest.files == {"a.txt": [1, 2, 3, 4]}
+    assert manifest.journaled == {"a.txt"}
+    # Archive entries without their size and mtime can't be trusted
+    assert manifest.completed_archives == {}
+
+
+def test_resume_skips_what_was_written(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    extract(corpus, tmp_path, manifest)
+    manifest.flush()
+    stats = extract(corpus, tmp_path, ExtractionManifest.load(tmp_path))
+    assert stats.total_files == 0
+
+
+def test_resume_rechecks_archives_that_moved(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    extract(corpus, tmp_path, manifest)
+    manifest.flush()
+    archive, files = asyncio.run(jobs(corpus))[0]
+    resumed = ExtractionManifest.load(tmp_path)
+    assert resumed.archive_completed(archive, corpus)
+    stat = archive.path.stat()
+    os.utime(archive.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    try:
+        assert not resumed.archive_completed(archive, corpus)
+        # Unchanged files are still known from the per file journal
+        assert all(resumed.is_journaled(file, corpus) for file in files)
+    finally:
+        os.utime(archive.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_save_commits_the_journal(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    extract(corpus, tmp_path, manifest)
+    manifest.save()
+    assert not manifest.journal_path.exists()
+    loaded = ExtractionManifest.load(tmp_path)
+    assert not loaded.resumable
+    assert loaded.files == manifest.files
+
+
+def test_status_from_the_manifest(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    extract(corpus, tmp_path, manifest)
+    manifest.save()
+    archive, files = asyncio.run(jobs(corpus))[0]
+    file = files[0]
+    disk = manifest.scan()
+    assert manifest.status(file, corpus, disk) == FileStatus.unchanged
+    key = file.relative_path(corpus)
+    manifest.files[key][1] ^= 1
+    assert manifest.status(file, corpus, disk) == FileStatus.changed
+    del disk[key]
+    assert manifest.status(file, corpus, disk) == FileStatus.added
+
+
+def test_sync_drops_files_no_index_lists(corpus, tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    extract(corpus, tmp_path, manifest)
+    files = dict(manifest.files)
+    manifest.files["ui/removed_by_a_patch.xml"] = [1, 1, 1, 1]
+    manifest.files["not_a_game_directory/file.txt"] = [1, 1, 1, 1]
+    asyncio.run(manifest.record_sync(asyncio.run(indexes(corpus)), corpus))
+    # Only entries under a synced index directory are pruned
+    assert "ui/removed_by_a_patch.xml" not in manifest.files
+    assert "not_a_game_directory/file.txt" in manifest.files
+    asyncio.run(
+        manifest.record_sync(asyncio.run(indexes(corpus)), corpus, complete=True)
+    )
+    assert manifest.files == files
@@ -0,0 +1,40 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils.trove.extractor import ExtractionManifest
+from utils.trove.patch_watcher import PatchWatcher
+
+
+def page(corpus, output):
+    directories = SimpleNamespace(
+        extract_from=corpus, extract_to=output, changes_from=output, changes_to=None
+    )
+    return SimpleNamespace(preferences=SimpleNamespace(directories=directories))
+
+
+def test_nothing_is_compared_before_a_first_extraction(corpus, tmp_path):
+    async def run():
+        watcher = PatchWatcher(page(corpus, tmp_path), settle=0)
+        try:
+            assert watcher.compared_with() is None
+            watcher.settled(corpus)
+            assert watcher.job is None
+            assert await watcher.prepare(None, corpus) is None
+            ExtractionManifest(tmp_path).save()
+            assert watcher.compared_with() == tmp_path
+        finally:
+            watcher.stop()
+
+    asyncio.run(run())
+
+
+def test_nothing_is_compared_without_an_extracted_tree(corpus, tmp_path):
+    async def run():
+        watcher = PatchWatcher(page(corpus, None))
+        try:
+            assert watcher.compared_with() is None
+            assert await watcher.prepare(None, corpus) is None
+        finally:
+            watcher.stop()
+
+    asyncio.run(run())
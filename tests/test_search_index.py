@@ -0,0 +1,131 @@
+import asyncio
+import os
+import shutil
+from pathlib import PurePosixPath
+
+from utils.hashing import checksum
+from utils.trove.extractor import ExtractionManifest
+from utils.trove.index_cache import IndexCache
+from utils.trove.search_index import (
+    ContentIndex,
+    FileNameIndex,
+    TrigramIndex,
+    regex_literals,
+)
+
+
+def write(root, manifest, files: dict):
+    for key, data in files.items():
+        path = root.joinpath(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        stat = path.stat()
+        manifest.files[key] = [
+            len(data),
+            checksum(data),
+            stat.st_size,
+            stat.st_mtime_ns,
+        ]
+    manifest.save()
+
+
+def hits(content_index, query, regex=False):
+    return sorted(
+        (hit.path, hit.line, hit.text)
+        for hit in content_index.search(query, regex, limit=None)
+    )
+
+
+def test_trigram_candidates():
+    index = TrigramIndex.build(["Hello world", "yellow", "word"])
+    assert index.candidates(["ello"]) == {0, 1}
+    assert index.candidates(["WORL"]) == {0}
+    assert index.candidates(["llo", "wor"]) == {0}
+    assert index.candidates(["zzz"]) == set()
+    # Too short to narrow anything down
+    assert index.candidates(["wo"]) is None
+
+
+def test_trigram_round_trip():
+    index = TrigramIndex.build(["abcd", "bcde", "xyz"])
+    loaded = TrigramIndex.loads(index.dumps())
+    assert {t: list(ids) for t, ids in loaded.postings.items()} == {
+        t: list(ids) for t, ids in index.postings.items()
+    }
+
+
+def test_regex_literals():
+    assert regex_literals(r"foo\d+bar") == ["foo", "bar"]
+    assert regex_literals(r"a|b") == []
+    assert regex_literals(r"needle") == ["needle"]
+
+
+def test_content_search(tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    write(
+        tmp_path,
+        manifest,
+        {
+            "ui/a.xml": b"<root>\n  <Needle value='1'/>\n</root>\n",
+            "ui/b.txt": b"nothing here\nneedle in the haystack\n",
+            "models/c.binfab": b"needle\0binary",
+            "textures/d.png": b"needle",
+        },
+    )
+    content_index = ContentIndex(tmp_path)
+    stats = content_index.update(manifest)
+    assert (stats.files, stats.text_files) == (4, 2)
+    assert hits(content_index, "NEEDLE") == [
+        ("ui/a.xml", 2, "<Needle value='1'/>"),
+        ("ui/b.txt", 2, "needle in the haystack"),
+    ]
+    assert hits(content_index, r"needle\s+in", True) == [
+        ("ui/b.txt", 2, "needle in the haystack")
+    ]
+    assert hits(content_index, "haystacks") == []
+
+
+def test_update_reads_changed_files_only(tmp_path):
+    manifest = ExtractionManifest.load(tmp_path)
+    write(tmp_path, manifest, {"a.txt": b"alpha", "b.txt": b"bravo"})
+    content_index = ContentIndex(tmp_path)
+    content_index.update(manifest)
+    write(tmp_path, manifest, {"b.txt": b"charlie"})
+    del manifest.files["a.txt"]
+    stats = content_index.update(manifest)
+    assert (stats.indexed, stats.removed) == (1, 1)
+    assert hits(content_index, "alpha") == []
+    assert hits(content_index, "bravo") == []
+    assert hits(content_index, "charlie") == [("b.txt", 1, "charlie")]
+
+
+def test_segments_load_like_a_fresh_index(tmp_path):
+    tree = tmp_path.joinpath("tree")
+    cache = IndexCache(tmp_path.joinpath("cache.sqlite"))
+    manifest = ExtractionManifest.load(tree)
+    write(tree, manifest, {f"f{i}.txt": f"file {i} alpha".encode() for i in range(20)})
+    for round in range(ContentIndex.max_segments + 2):
+        content_index, _ = ContentIndex.refresh(tree, cache)
+        assert content_index.segments <= ContentIndex.max_segments
+        fresh = ContentIndex(tree)
+        fresh.update(ExtractionManifest.load(tree))
+        for query in ["alpha", "bravo", f"round {round - 1}"]:
+            assert hits(content_index, query) == hits(fresh, query)
+        manifest = ExtractionManifest.load(tree)
+        write(tree, manifest, {f"f{round}.txt": f"bravo round {round}".encode()})
+    cache.close()
+
+
+def test_name_index_notices_a_patch(corpus, tmp_path):
+    game = tmp_path.joinpath("game")
+    shutil.copytree(corpus, game)
+    cache = IndexCache(tmp_path.joinpath("cache.sqlite"))
+    name_index = asyncio.run(FileNameIndex.load(game, cache))
+    assert not asyncio.run(name_index.changed(cache))
+    name = PurePosixPath(name_index.paths[0]).name
+    files = asyncio.run(name_index.files(name))
+    assert name in [file.path.name for file in files]
+    index = next(game.rglob("index.tfi"))
+    stat = index.stat()
+    os.utime(index, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert asyncio.run(name_index.changed(cache))
@@ -0,0 +1,86 @@
+import asyncio
+
+from tests.conftest import indexes, jobs
+from utils.trove.extraction_pack import PackWriter
+from utils.trove.extractor import ExtractionEngine, ExtractionManifest
+from utils.trove.verify import TreeVerifier
+
+
+def files(corpus):
+    return [
+        file for _, archive_files in asyncio.run(jobs(corpus)) for file in archive_files
+    ]
+
+
+def extracted(corpus, output):
+    manifest = ExtractionManifest.load(output)
+    engine = ExtractionEngine(corpus, output, manifest=manifest)
+    asyncio.run(engine.extract(asyncio.run(jobs(corpus))))
+    manifest.save()
+    return manifest
+
+
+def verify(corpus, output, complete=True):
+    verifier = TreeVerifier(corpus, output)
+    return asyncio.run(verifier.verify(files(corpus), complete))
+
+
+def test_intact_tree(corpus, tmp_path):
+    extracted(corpus, tmp_path)
+    report = verify(corpus, tmp_path)
+    assert report
+    assert report.checked == len(files(corpus))
+
+
+def test_missing_corrupt_and_extra(corpus, tmp_path):
+    extracted(corpus, tmp_path)
+    first, second, third = [f for f in files(corpus) if f.size][:3]
+    first.extracted_path(corpus, tmp_path).unlink()
+    # Same size, different bytes, only hashing tells
+    path = second.extracted_path(corpus, tmp_path)
+    data = bytearray(path.read_bytes())
+    data[0] ^= 0xFF
+    path.write_bytes(data)
+    path = third.extracted_path(corpus, tmp_path)
+    path.write_bytes(path.read_bytes() + b"!")
+    tmp_path.joinpath("ui", "stray.txt").write_bytes(b"stray")
+    report = verify(corpus, tmp_path)
+    assert [f.row for f in report.missing] == [first.row]
+    assert sorted(f.relative_path(corpus) for f in report.corrupt) == sorted(
+        [second.relative_path(corpus), third.relative_path(corpus)]
+    )
+    assert report.extra == ["ui/stray.txt"]
+    assert len(report.damaged) == 3
+    # A filtered run can't tell extra files from files it left out
+    assert verify(corpus, tmp_path, complete=False).extra == []
+
+
+def test_own_files_are_not_extra(corpus, tmp_path):
+    extracted(corpus, tmp_path)
+    for name in [
+        PackWriter.file_name,
+        f"{ExtractionManifest.file_name}.tmp",
+        ExtractionManifest.journal_name,
+        ExtractionManifest.search_name,
+        ExtractionManifest.legacy_name,
+    ]:
+        tmp_path.joinpath(name).write_bytes(b"ours")
+    report = verify(corpus, tmp_path)
+    assert report.extra == []
+    assert TreeVerifier(corpus, tmp_path).remove_extra(report) == 0
+    assert tmp_path.joinpath(PackWriter.file_name).exists()
+
+
+def test_repair_jobs(corpus, tmp_path):
+    extracted(corpus, tmp_path)
+    file = files(corpus)[0]
+    file.extracted_path(corpus, tmp_path).unlink()
+    report = verify(corpus, tmp_path)
+    assert [(archive, [f.row for f in fs]) for archive, fs in report.jobs()] == [
+        (file.archive, [file.row])
+    ]
+    manifest = ExtractionManifest.load(tmp_path)
+    engine = ExtractionEngine(corpus, tmp_path, manifest=manifest)
+    asyncio.run(engine.extract(report.jobs()))
+    assert verify(corpus, tmp_path)
+    assert asyncio.run(indexes(corpus))
@@ -0,0 +1,191 @@
+"""Times the extractor on a synthetic corpus and prints the results as JSON.
+
+    python -m tools.benchmark_extractor [--corpus <dir>] [--output results.json]
+
+Without --corpus a corpus is generated in a temporary directory. Each benchmark
+runs --repeat times and reports its best and median times, so results can be
+compared commit to commit.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from tools.trove_corpus import generate
+from utils.hashing import checksums, native, python_hash
+from utils.trove.extractor import (
+    ExtractionEngine,
+    ExtractionManifest,
+    TFIndex,
+    find_all_indexes,
+)
+from utils.trove.diff import find_changes
+from utils.trove.index_cache import IndexCache
+
+
+async def indexes(corpus: Path, cache=None) -> list[TFIndex]:
+    return [index async for index in find_all_indexes(corpus, None, False, cache)]
+
+
+async def parse_indexes(corpus: Path, cache=None) -> dict:
+    files = 0
+    for index in await indexes(corpus, cache):
+        files += len(await index.files_list)
+    return {"files": files}
+
+
+async def inflate_archives(corpus: Path) -> dict:
+    size = 0
+    for index in await indexes(corpus):
+        for archive in index.archives:
+            for chunk in archive.inflate():
+                size += len(chunk)
+    return {"bytes": size}
+
+
+async def jobs(corpus: Path):
+    result = []
+    for index in await indexes(corpus):
+        await index.files_list
+        for archive in index.archives:
+            result.append((archive, [file async for file in archive.files()]))
+    return result
+
+
+async def extract(corpus: Path, output: Path) -> dict:
+    shutil.rmtree(output, ignore_errors=True)
+    manifest = ExtractionManifest.load(output)
+    engine = ExtractionEngine(corpus, output, manifest=manifest)
+    stats = await engine.extract(await jobs(corpus))
+    manifest.save()
+    return {"files": stats.files, "bytes": stats.bytes}
+
+
+async def detect_changes(corpus: Path, output: Path) -> dict:
+    manifest = ExtractionManifest.load(output)
+    changes = await find_changes(await indexes(corpus), corpus, manifest)
+    return {"changes": len(changes)}
+
+
+async def detect_changes_trusted(corpus: Path, output: Path) -> dict:
+    manifest = ExtractionManifest.load(output)
+    changes = await find_changes(await indexes(corpus), corpus, manifest, True)
+    return {"changes": len(changes)}
+
+
+async def hash_buffers(buffers: list[bytes]) -> dict:
+    checksums(buffers)
+    return {"files": len(buffers), "bytes": sum(map(len, buffers))}
+
+
+def extracted_files(output: Path) -> list[bytes]:
+    return [
+        path.read_bytes()
+        for path in output.rglob("*")
+        if path.is_file() and path.name != ExtractionManifest.file_name
+    ]
+
+
+async def measure(name: str, repeat: int, benchmark, *args) -> dict:
+    runs = []
+    result = {}
+    for _ in range(repeat):
+        start = perf_counter()
+        result = await benchmark(*args)
+        runs.append(perf_counter() - start)
+    best = min(runs)
+    measurement = {
+        "best": round(best, 4),
+        "median": round(statistics.median(runs), 4),
+        "runs": [round(run, 4) for run in runs],
+        **result,
+    }
+    for key in ["files", "bytes"]:
+        if key in result and best:
+            measurement[f"{key}_per_second"] = round(result[key] / best, 1)
+    return {name: measurement}
+
+
+def commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, workspace: Path) -> dict:
+    corpus = args.corpus
+    summary = None
+    if corpus is None:
+        corpus = workspace.joinpath("corpus")
+        summary = generate(corpus, args.files, args.huge, args.huge_size, seed=0)
+    output = workspace.joinpath("extracted")
+    cache = IndexCache(workspace.joinpath("index_cache.sqlite"))
+    await parse_indexes(corpus, cache)
+    results = {}
+    results.update(await measure("parse_indexes", args.repeat, parse_indexes, corpus))
+    results.update(
+        await measure("parse_indexes_cached", args.repeat, parse_indexes, corpus, cache)
+    )
+    results.update(
+        await measure("inflate_archives", args.repeat, inflate_archives, corpus)
+    )
+    results.update(await measure("extract_all", args.repeat, extract, corpus, output))
+    results.update(
+        await measure("detect_changes", args.repeat, detect_changes, corpus, output)
+    )
+    results.update(
+        await measure(
+            "detect_changes_trusted",
+            args.repeat,
+            detect_changes_trusted,
+            corpus,
+            output,
+        )
+    )
+    buffers = extracted_files(output)
+    results.update(await measure("hash_files", args.repeat, hash_buffers, buffers))
+    sample = buffers[:200]
+    results["hash_files"]["native"] = native
+    results["hash_files"]["fallback_matches"] = [
+        python_hash(data) for data in sample
+    ] == checksums(sample)
+    cache.close()
+    return {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": summary or {"path": str(corpus)},
+        "results": results,
+    }
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, help="Use an existing installation")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--huge", type=int, default=4)
+    parser.add_argument("--huge-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="Also write the results here")
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    with tempfile.TemporaryDirectory() as workspace:
+        report = asyncio.run(run(args, Path(workspace)))
+    print(json.dumps(report, indent=4))
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=4))
@@ -0,0 +1,159 @@
+"""Writes a synthetic Trove installation for benchmarks.
+
+Indexes and archives follow the game's format (LEB128 index.tfi entries pointing
+into zlib compressed archiveN.tfa files) with a realistic shape: many small
+files, a handful of huge ones, spread over several directories and archives.
+
+    python -m tools.trove_corpus <output> [--files 20000] [--huge 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import zlib
+from pathlib import Path
+
+from utils.functions import write_leb128
+from utils.hashing import calculate_hash
+
+DIRECTORIES = ["blueprints", "models", "textures", "ui", "audio"]
+EXTENSIONS = [".blueprint", ".binfab", ".png", ".dds", ".xml", ".swf", ".wav"]
+# Zlib level the generated archives are written with
+COMPRESSION = 6
+POOL_SIZE = 4 * 1024 * 1024
+
+
+def content_pool(rnd: random.Random) -> bytes:
+    """Semi compressible bytes, random words with some noise, to slice files from."""
+    words = [rnd.randbytes(rnd.randint(2, 12)) for _ in range(4096)]
+    pool = bytearray()
+    while len(pool) < POOL_SIZE:
+        pool += rnd.choice(words)
+        if not rnd.randrange(8):
+            pool += rnd.randbytes(rnd.randint(1, 32))
+    return bytes(pool)
+
+
+def file_sizes(rnd: random.Random, files: int, huge: int, huge_size: int):
+    # Game files are mostly a few KiB with a long tail
+    sizes = [
+        min(int(rnd.lognormvariate(7.5, 1.4)), 4 * 1024 * 1024) for _ in range(files)
+    ]
+    for i in rnd.sample(range(files), min(huge, files)):
+        sizes[i] = rnd.randint(huge_size // 2, huge_size)
+    return sizes
+
+
+def file_content(rnd: random.Random, pool: bytes, size: int) -> bytes:
+    if size <= len(pool):
+        start = rnd.randrange(len(pool) - size + 1)
+        return pool[start : start + size]
+    return (pool * (size // len(pool) + 1))[:size]
+
+
+def write_index(
+    path: Path,
+    entries: list[tuple[str, bytes]],
+    archives: int,
+    max_archive_size: int,
+):
+    """Writes one index.tfi and its archives, filling archives up to max size."""
+    path.mkdir(parents=True, exist_ok=True)
+    index = bytearray()
+    archive_id = 0
+    archive = bytearray()
+    archive_ids = []
+
+    def flush():
+        (path / f"archive{archive_id}.tfa").write_bytes(
+            zlib.compress(bytes(archive), COMPRESSION)
+        )
+        archive_ids.append(archive_id)
+
+    for name, data in entries:
+        if archive and len(archive) + len(data) > max_archive_size:
+            if archive_id + 1 < archives:
+                flush()
+                archive_id += 1
+                archive = bytearray()
+        encoded_name = name.encode()
+        index += write_leb128(len(encoded_name)) + encoded_name
+        index += write_leb128(archive_id)
+        index += write_leb128(len(archive))
+        index += write_leb128(len(data))
+        index += write_leb128(calculate_hash(data, len(data)))
+        archive += data
+    flush()
+    (path / "index.tfi").write_bytes(index)
+    return archive_ids
+
+
+def generate(
+    root: Path,
+    files: int = 20000,
+    huge: int = 4,
+    huge_size: int = 64 * 1024 * 1024,
+    indexes: int = 12,
+    archives: int = 8,
+    max_archive_size: int = 32 * 1024 * 1024,
+    seed: int = 0,
+) -> dict:
+    """Generates the corpus under root and returns a summary of its shape."""
+    rnd = random.Random(seed)
+    pool = content_pool(rnd)
+    sizes = file_sizes(rnd, files, huge, huge_size)
+    locations = []
+    for i in range(indexes):
+        directory = Path(DIRECTORIES[i % len(DIRECTORIES)])
+        if i >= len(DIRECTORIES):
+            directory = directory.joinpath(f"pack{i // len(DIRECTORIES)}")
+        locations.append(directory)
+    buckets = [[] for _ in locations]
+    for i, size in enumerate(sizes):
+        name = f"file_{i:06d}{rnd.choice(EXTENSIONS)}"
+        buckets[rnd.randrange(len(locations))].append((name, size))
+    total_archives = 0
+    for directory, bucket in zip(locations, buckets):
+        entries = [(name, file_content(rnd, pool, size)) for name, size in bucket]
+        total_archives += len(
+            write_index(root.joinpath(directory), entries, archives, max_archive_size)
+        )
+    return {
+        "seed": seed,
+        "files": files,
+        "huge_files": min(huge, files),
+        "bytes": sum(sizes),
+        "indexes": len(locations),
+        "archives": total_archives,
+        "compressed_bytes": sum(p.stat().st_size for p in root.rglob("*.tfa")),
+    }
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--huge", type=int, default=4)
+    parser.add_argument("--huge-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--indexes", type=int, default=12)
+    parser.add_argument("--archives", type=int, default=8)
+    parser.add_argument("--max-archive-size", type=int, default=32 * 1024 * 1024)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    summary = generate(
+        args.output,
+        args.files,
+        args.huge,
+        args.huge_size,
+        args.indexes,
+        args.archives,
+        args.max_archive_size,
+        args.seed,
+    )
+    print(json.dumps(summary))
@@ -1,10 +1,8 @@
 from __future__ import annotations
 
 import asyncio
-import ctypes
 import datetime
 import random
-import sys
 import time
 from random import randint
 from random import sample
@@ -14,16 +12,6 @@ from typing import Callable, Generic, Literal, TypeVar, Union, overload
 from aiohttp import ClientSession
 from binary_reader import BinaryReader
 
-from .path import BasePath
-
-if sys.platform == "win32":
-    dll = ctypes.CDLL(BasePath.joinpath("trove.dll").as_posix())
-else:
-    dll = ctypes.CDLL(BasePath.joinpath("trove.so").as_posix())
-calculate_hash = dll.calculate_hash
-calculate_hash.restype = ctypes.c_uint32
-calculate_hash.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
-
 
 def random_id(k=8):
     return "".join(sample(ascii_letters + digits, k=k))
@@ -195,6 +183,21 @@ def read_leb128(buffer: BinaryReader, pos):
                 raise Exception("Too many bytes when decoding varint.")
 
 
+def decode_leb128(view, pos: int) -> tuple[int, int]:
+    """Decodes a varint from a bytes-like object, returning the value and the next position."""
+    result = 0
+    shift = 0
+    while 1:
+        byte = view[pos]
+        result |= (byte & 0x7F) << shift
+        pos += 1
+        if not (byte & 0x80):
+            return result & 0xFFFFFFFF, pos
+        shift += 7
+        if shift >= 64:
+            raise Exception("Too many bytes when decoding varint.")
+
+
 def write_leb128(value):
     result = bytearray()
     while value >= 0x80:
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import ctypes
+import mmap
+import os
+import sys
+from pathlib import Path
+from typing import Optional, Sequence
+
+from .path import BasePath
+
+FNV_OFFSET = 2166136261
+FNV_PRIME = 16777619
+MASK = 0xFFFFFFFF
+PyBUF_SIMPLE = 0
+
+__all__ = (
+    "calculate_hash",
+    "checksum",
+    "checksums",
+    "file_checksum",
+    "native",
+    "python_hash",
+)
+
+
+class _Buffer(ctypes.Structure):
+    """Py_buffer, filled by PyObject_GetBuffer to reach an object's memory."""
+
+    _fields_ = [
+        ("buf", ctypes.c_void_p),
+        ("obj", ctypes.c_void_p),
+        ("len", ctypes.c_ssize_t),
+        ("itemsize", ctypes.c_ssize_t),
+        ("readonly", ctypes.c_int),
+        ("ndim", ctypes.c_int),
+        ("format", ctypes.c_char_p),
+        ("shape", ctypes.c_void_p),
+        ("strides", ctypes.c_void_p),
+        ("suboffsets", ctypes.c_void_p),
+        ("internal", ctypes.c_void_p),
+    ]
+
+
+_get_buffer = ctypes.pythonapi.PyObject_GetBuffer
+_get_buffer.argtypes = [ctypes.py_object, ctypes.POINTER(_Buffer), ctypes.c_int]
+_get_buffer.restype = ctypes.c_int
+_release_buffer = ctypes.pythonapi.PyBuffer_Release
+_release_buffer.argtypes = [ctypes.POINTER(_Buffer)]
+_release_buffer.restype = None
+
+
+def _load_library() -> Optional[ctypes.CDLL]:
+    name = "trove.dll" if sys.platform == "win32" else "trove.so"
+    try:
+        return ctypes.CDLL(BasePath.joinpath(name).as_posix())
+    except OSError:
+        return None
+
+
+_library = _load_library()
+native = _library is not None
+_native_hash = None
+if native:
+    # Same symbol as calculate_hash, but taking any address instead of bytes
+    _native_hash = _library["calculate_hash"]
+    _native_hash.restype = ctypes.c_uint32
+    _native_hash.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+
+
+def _signed(byte: int) -> int:
+    # The game's hash reads the trailing bytes as signed chars
+    return byte | 0xFFFFFF00 if byte & 0x80 else byte
+
+
+def python_hash(data) -> int:
+    """Pure Python calculate_hash, matching the native one bit for bit."""
+    with memoryview(data) as view, view.cast("B") as view:
+        length = len(view)
+        body = length & ~3
+        value = FNV_OFFSET
+        if body:
+            with view[:body] as words, words.cast("I") as words:
+                for word in words:
+                    value = ((value ^ word) * FNV_PRIME) & MASK
+        tail = view[body:].tolist()
+    if not tail:
+        return value
+    word = 0
+    for byte in tail:
+        word = ((word << 8) & MASK) | _signed(byte)
+    return ((value ^ word) * FNV_PRIME) & MASK
+
+
+class _Pinned:
+    """Holds the buffers of many objects open so their addresses stay valid."""
+
+    def __init__(self, objects: Sequence):
+        self.objects = objects
+        self.buffers: list[_Buffer] = []
+
+    def __enter__(self) -> list[_Buffer]:
+        try:
+            for obj in self.objects:
+                buffer = _Buffer()
+                if _get_buffer(obj, ctypes.byref(buffer), PyBUF_SIMPLE):
+                    raise BufferError(f"Can't read {type(obj).__name__} as bytes")
+                self.buffers.append(buffer)
+        except BaseException:
+            self.__exit__()
+            raise
+        return self.buffers
+
+    def __exit__(self, *args):
+        for buffer in self.buffers:
+            _release_buffer(ctypes.byref(buffer))
+        self.buffers = []
+
+
+def checksum(data) -> int:
+    """Trove hash of any bytes-like object, read in place without copying it.
+
+    Works the same for bytes, bytearray, memoryview and mmap, falling back to
+    the Python implementation where the native library can't be loaded."""
+    if _native_hash is None:
+        return python_hash(data)
+    with _Pinned([data]) as (buffer,):
+        return _native_hash(buffer.buf, buffer.len)
+
+
+def checksums(objects: Sequence) -> list[int]:
+    """Trove hashes of many bytes-like objects, pinning them all once."""
+    if _native_hash is None:
+        return [python_hash(data) for data in objects]
+    with _Pinned(objects) as buffers:
+        return [_native_hash(buffer.buf, buffer.len) for buffer in buffers]
+
+
+def file_checksum(path: Path) -> Optional[int]:
+    """Trove hash of a file on disk, read through a memory map, None if unreadable."""
+    try:
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return checksum(b"")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return checksum(mapped)
+    except OSError:
+        return None
+
+
+if native:
+    calculate_hash = _library.calculate_hash
+    calculate_hash.restype = ctypes.c_uint32
+    calculate_hash.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+else:
+
+    def calculate_hash(data: bytes, length: int) -> int:
+        return python_hash(memoryview(data)[:length])
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import traceback
+from enum import Enum
+from itertools import count
+from time import perf_counter
+from typing import Any, Callable, Coroutine, Optional
+
+__all__ = ("Job", "JobStatus", "JobScheduler", "scheduler")
+
+_ids = count(1)
+
+
+class JobStatus(Enum):
+    queued = "queued"
+    running = "running"
+    paused = "paused"
+    cancelled = "cancelled"
+    completed = "completed"
+    failed = "failed"
+
+
+class Job:
+    """A queued unit of long running work, like an extraction or a refresh.
+
+    The function receives the job itself to report progress and to reach
+    checkpoints where pausing and cancelling take effect. Anything attached with
+    `attach` (such as an ExtractionEngine) is paused, resumed and cancelled too."""
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable[..., Coroutine[Any, Any, Any]],
+        *args,
+        priority: int = 0,
+        kind: str = "job",
+        **kwargs,
+    ):
+        self.id = next(_ids)
+        self.name = name
+        self.kind = kind
+        self.priority = priority
+        self.status = JobStatus.queued
+        self.progress: dict = {}
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.created = perf_counter()
+        self.started: Optional[float] = None
+        self.ended: Optional[float] = None
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+        self._attached = []
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._done = asyncio.Event()
+        self._cancelled = False
+        self._dirty = False
+        self._scheduler: Optional[JobScheduler] = None
+
+    def __lt__(self, other: Job):
+        # Higher priority first, then first come first served
+        return (-self.priority, self.id) < (-other.priority, other.id)
+
+    def __repr__(self):
+        return f"<Job id={self.id} name={self.name!r} status={self.status.name}>"
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def attach(self, controlled):
+        """Forwards pause, resume and cancel to an object exposing those methods."""
+        self._attached.append(controlled)
+        if self._cancelled:
+            controlled.cancel()
+        elif self.status == JobStatus.paused:
+            controlled.pause()
+
+    def report(self, **progress):
+        """Updates progress, subscribers get it on the scheduler's next tick."""
+        self.progress.update(progress)
+        self._dirty = True
+
+    async def checkpoint(self):
+        """Waits while paused, raises CancelledError if cancelled."""
+        if self._cancelled:
+            raise asyncio.CancelledError
+        await self._resumed.wait()
+        if self._cancelled:
+            raise asyncio.CancelledError
+
+    def pause(self):
+        if self.status not in [JobStatus.queued, JobStatus.running]:
+            return
+        self._resumed.clear()
+        if self.status == JobStatus.running:
+            for controlled in self._attached:
+                controlled.pause()
+        self.status = JobStatus.paused
+        self._dirty = True
+
+    def resume(self):
+        if self.status != JobStatus.paused:
+            return
+        self._resumed.set()
+        for controlled in self._attached:
+            controlled.resume()
+        self.status = JobStatus.running if self.started else JobStatus.queued
+        self._dirty = True
+        if self._scheduler is not None:
+            self._scheduler._unpark(self)
+
+    def cancel(self):
+        if self.done:
+            return
+        self._cancelled = True
+        self._resumed.set()
+        for controlled in self._attached:
+            controlled.cancel()
+        self._dirty = True
+        if self._scheduler is not None:
+            # A parked job has to go through a worker to end
+            self._scheduler._unpark(self)
+
+    async def wait(self):
+        """Waits for the job to end, returning its result or raising its error."""
+        await self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def run(self):
+        if self._cancelled:
+            self._finish(JobStatus.cancelled)
+            return
+        self.started = perf_counter()
+        self.status = JobStatus.running
+        try:
+            self.result = await self._function(self, *self._args, **self._kwargs)
+        except asyncio.CancelledError:
+            self._finish(JobStatus.cancelled)
+        except Exception as e:
+            self.error = e
+            print("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+            self._finish(JobStatus.failed)
+        else:
+            self._finish(
+                JobStatus.cancelled if self._cancelled else JobStatus.completed
+            )
+
+    def _finish(self, status: JobStatus):
+        self.status = status
+        self.ended = perf_counter()
+        self._dirty = True
+        self._done.set()
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "kind": self.kind,
+            "priority": self.priority,
+            "status": self.status.value,
+            "progress": self.progress,
+        }
+
+
+class JobScheduler:
+    """Runs queued jobs by priority on a few workers and publishes their progress.
+
+    Jobs with a negative priority run on their own background workers, so a
+    user's extraction never queues behind a long history or patch comparison.
+    A job paused before it started is set aside until resumed rather than
+    holding a worker. Subscribers are called at most once per `interval` for
+    each job that changed, so progress reporting never paces the work itself."""
+
+    def __init__(
+        self, workers: int = 1, background_workers: int = 1, interval: float = 0.25
+    ):
+        self.workers = workers
+        self.background_workers = background_workers
+        self.interval = interval
+        self.jobs: dict[int, Job] = {}
+        self._subscribers: list[Callable[[Job], Coroutine]] = []
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._background: Optional[asyncio.PriorityQueue] = None
+        self._parked: dict[int, Job] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._background = asyncio.PriorityQueue()
+        self._tasks = [
+            asyncio.create_task(self._worker(self._queue)) for _ in range(self.workers)
+        ]
+        self._tasks += [
+            asyncio.create_task(self._worker(self._background))
+            for _ in range(self.background_workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._publisher()))
+
+    async def stop(self):
+        for job in self.jobs.values():
+            job.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._parked.clear()
+
+    def submit(self, job: Job) -> Job:
+        self.start()
+        self.jobs[job.id] = job
+        job._scheduler = self
+        self._lane(job).put_nowait(job)
+        job._dirty = True
+        return job
+
+    def _lane(self, job: Job) -> asyncio.PriorityQueue:
+        return self._background if job.priority < 0 else self._queue
+
+    def _unpark(self, job: Job):
+        if self._parked.pop(job.id, None) is not None:
+            self._lane(job).put_nowait(job)
+
+    def subscribe(self, callback: Callable[[Job], Coroutine]) -> Callable[[], None]:
+        """Registers `await callback(job)` for progress and status changes."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def active(self, kind: Optional[str] = None) -> list[Job]:
+        return [
+            job
+            for job in self.jobs.values()
+            if not job.done and (kind is None or job.kind == kind)
+        ]
+
+    async def _worker(self, queue: asyncio.PriorityQueue):
+        while True:
+            job = await queue.get()
+            if job.status == JobStatus.paused and not job.cancelled:
+                # Back in the queue once resumed, the worker moves on meanwhile
+                self._parked[job.id] = job
+                queue.task_done()
+                continue
+            try:
+                await job.run()
+            finally:
+                await self._publish(job)
+                self.jobs.pop(job.id, None)
+                queue.task_done()
+
+    async def _publisher(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for job in list(self.jobs.values()):
+                if job._dirty:
+                    await self._publish(job)
+
+    async def _publish(self, job: Job):
+        job._dirty = False
+        for callback in list(self._subscribers):
+            try:
+                await callback(job)
+            except Exception as e:
+                print("".join(traceback.format_exception(type(e), e, e.__traceback__)))
+
+
+scheduler = JobScheduler()
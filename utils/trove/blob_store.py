@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import os
+import shutil
+from pathlib import Path
+
+
+class BlobStore:
+    """Content addressed store of extracted files.
+
+    Blobs are keyed by the Trove hash and size found in the indexes, so a file is
+    only ever written once and every tree that contains it (the extracted game and
+    each dated changes folder) just links to the blob."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    @staticmethod
+    def key(size: int, hash: int) -> str:
+        return f"{hash:08x}{size:x}"
+
+    def path(self, size: int, hash: int) -> Path:
+        key = self.key(size, hash)
+        return self.root.joinpath(key[:2], key)
+
+    def blob_path(self, file) -> Path:
+        return self.path(file.size, file.hash)
+
+    def temporary_path(self, file) -> Path:
+        blob_path = self.blob_path(file)
+        return blob_path.with_name(blob_path.name + ".part")
+
+    def has(self, file) -> bool:
+        return self.blob_path(file).exists()
+
+    def commit(self, file):
+        """Moves a fully written temporary blob into place."""
+        os.replace(self.temporary_path(file), self.blob_path(file))
+
+    def link(self, blob_path: Path, target: Path) -> bool:
+        """Materializes a blob at target, returns whether a hardlink could be used."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)
+        try:
+            os.link(blob_path, target)
+            return True
+        except OSError:
+            # Different volume or a filesystem without hardlinks
+            shutil.copyfile(blob_path, target)
+            return False
+
+    def materialize(self, file, target: Path) -> bool:
+        return self.link(self.blob_path(file), target)
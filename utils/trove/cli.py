@@ -0,0 +1,453 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+from utils.trove.blob_store import BlobStore
+from utils.trove.diff import Catalog, CatalogDiff, find_changes
+from utils.trove.extraction_pack import PackReader, PackWriter
+from utils.trove.file_filter import FileFilter, parse_size
+from utils.trove.file_writer import FileWriter, FsyncPolicy
+from utils.trove.extractor import (
+    DEFAULT_MEMORY_BUDGET,
+    ExtractionEngine,
+    ExtractionManifest,
+    TroveFile,
+    find_all_indexes,
+)
+from utils.trove.history import FileHistory
+from utils.trove.index_cache import get_index_cache
+from utils.trove.search_index import ContentIndex
+from utils.trove.verify import TreeVerifier
+
+
+def emit(event: str, **data):
+    """Writes one JSON line to stdout, the only output of the CLI."""
+    sys.stdout.write(json.dumps({"event": event, **data}) + "\n")
+    sys.stdout.flush()
+
+
+def file_data(file: TroveFile, opath: Path) -> dict:
+    return {
+        "path": file.relative_path(opath),
+        "archive": file.archive.path.relative_to(opath).as_posix(),
+        "size": file.size,
+        "hash": file.hash,
+    }
+
+
+class ExtractorCLI:
+    """Drives the extractor without the UI, reporting everything as JSON lines."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.game = args.game
+        self.cache = get_index_cache(args.cache) if args.cache else None
+        self.filter = FileFilter(
+            args.filter,
+            args.exclude,
+            args.regex,
+            args.ext,
+            args.min_size,
+            args.max_size,
+        )
+
+    def matches(self, file: TroveFile) -> bool:
+        return not self.filter or self.filter.matches(file, self.game)
+
+    async def indexes(self):
+        async for index in find_all_indexes(self.game, None, False, self.cache):
+            yield index
+
+    async def files(self):
+        async for index in self.indexes():
+            if self.filter:
+                files = await self.filter.files(index, self.game)
+            else:
+                files = await index.files_list
+            for file in files:
+                yield file
+
+    async def changes(self, manifest: ExtractionManifest) -> list[TroveFile]:
+        indexes = [index async for index in self.indexes()]
+        files = await find_changes(
+            indexes,
+            self.game,
+            manifest,
+            self.args.trust_manifest,
+            getattr(self.args, "inflate_workers", 0),
+        )
+        files.sort(key=lambda file: [file.archive.index.path, file.path])
+        return [file for file in files if self.matches(file)]
+
+    def engine(
+        self,
+        manifest: Optional[ExtractionManifest],
+        *destinations: Path,
+        pack: Optional[PackWriter] = None,
+    ):
+        return ExtractionEngine(
+            self.game,
+            *destinations,
+            inflate_workers=self.args.inflate_workers,
+            write_workers=self.args.write_workers,
+            budget=self.args.budget,
+            manifest=manifest,
+            # Packs hold every file themselves, nothing goes through a store
+            store=(
+                BlobStore(self.args.store) if self.args.store and pack is None else None
+            ),
+            pack=pack,
+            writer=FileWriter(self.args.fsync),
+        )
+
+    async def run_engine(self, engine: ExtractionEngine, files):
+        jobs = {}
+        for file in files:
+            jobs.setdefault(file.archive.path, (file.archive, []))[1].append(file)
+
+        async def progress(stats):
+            emit("progress", **stats.as_dict())
+
+        try:
+            stats = await engine.extract(
+                list(jobs.values()), progress, self.args.interval
+            )
+        except (asyncio.CancelledError, KeyboardInterrupt):
+            engine.cancel()
+            if engine.manifest is not None:
+                engine.manifest.flush()
+            raise
+        for archive in engine.missing:
+            emit("missing", archive=archive.path.relative_to(self.game).as_posix())
+        emit("done", **stats.as_dict())
+        return stats
+
+    async def list(self):
+        count = 0
+        async for file in self.files():
+            emit("file", **file_data(file, self.game))
+            count += 1
+        emit("done", files=count)
+
+    async def diff(self):
+        manifest = ExtractionManifest.load(self.args.output)
+        count = 0
+        for file in await self.changes(manifest):
+            emit("change", status=file.status.name, **file_data(file, self.game))
+            count += 1
+        emit("done", changes=count)
+
+    async def compare(self):
+        diff = CatalogDiff.compare(
+            await Catalog.load(self.game, self.cache),
+            await Catalog.load(self.args.output, self.cache),
+        )
+        for entry in diff.entries:
+            size = entry.size if entry.size is not None else entry.old_size
+            if not self.filter or (
+                self.filter.matches_path(entry.path) and self.filter.matches_size(size)
+            ):
+                emit("change", **entry.as_dict())
+        if self.args.report is not None:
+            diff.save(self.args.report)
+        emit(
+            "done",
+            added=len(diff.added),
+            changed=len(diff.changed),
+            removed=len(diff.removed),
+        )
+
+    async def extract_all(self):
+        manifest = ExtractionManifest.load(self.args.output)
+        indexes = [index async for index in self.indexes()]
+        files = []
+        for index in indexes:
+            if self.filter:
+                files.extend(await self.filter.files(index, self.game))
+            else:
+                files.extend(await index.files_list)
+        await self.run_engine(self.engine(manifest, self.args.output), files)
+        if not self.filter:
+            await manifest.record_sync(indexes, self.game, complete=True)
+        manifest.save()
+
+    async def extract(self):
+        if not self.filter:
+            raise ValueError("extract needs at least one filter, use extract-all")
+        await self.extract_all()
+
+    async def pack(self):
+        engine = self.engine(None, pack=PackWriter(self.args.output, self.game))
+        await self.run_engine(engine, [file async for file in self.files()])
+
+    async def extract_changes(self):
+        manifest = ExtractionManifest.load(self.args.output)
+        files = await self.changes(manifest)
+        destinations = [self.args.output]
+        if self.args.changes_to is not None:
+            old_changes = self.args.changes_to.joinpath("old")
+            new_changes = self.args.changes_to.joinpath("new")
+            old_changes.mkdir(parents=True, exist_ok=True)
+            new_changes.mkdir(parents=True, exist_ok=True)
+            manifest.save(old_changes.joinpath(ExtractionManifest.file_name))
+            store = BlobStore(self.args.store) if self.args.store else None
+            writer = FileWriter(self.args.fsync)
+            for file in files:
+                await file.copy_old(
+                    self.game, self.args.output, old_changes, manifest, store, writer
+                )
+            writer.finish()
+            destinations.append(new_changes)
+        await self.run_engine(self.engine(manifest, *destinations), files)
+        if not self.filter:
+            await manifest.record_sync(
+                [index async for index in self.indexes()], self.game, complete=True
+            )
+        manifest.save()
+
+    async def unpack(self):
+        manifest = ExtractionManifest.load(self.args.output)
+        count = 0
+        with PackReader(self.args.pack) as pack:
+            for name, size, hash in pack.entries():
+                if self.filter and not (
+                    self.filter.matches_path(name) and self.filter.matches_size(size)
+                ):
+                    continue
+                path = pack.extract(name, self.args.output)
+                manifest.record_path(name, size, hash, path.stat())
+                count += 1
+        manifest.save()
+        emit("done", files=count)
+
+    async def verify(self):
+        verifier = TreeVerifier(self.game, self.args.output, self.args.hash_workers)
+
+        async def progress(done, total):
+            emit("progress", checked=done, total=total)
+
+        report = await verifier.verify(
+            [file async for file in self.files()],
+            complete=not self.filter,
+            progress=progress,
+            interval=self.args.interval,
+        )
+        for status, files in [("missing", report.missing), ("corrupt", report.corrupt)]:
+            for file in files:
+                emit(status, **file_data(file, self.game))
+        for path in report.extra:
+            emit("extra", path=path)
+        emit("verified", **report.as_dict())
+        if self.args.remove_extra:
+            emit("removed", files=verifier.remove_extra(report))
+        if self.args.repair and report.damaged:
+            manifest = ExtractionManifest.load(self.args.output)
+            engine = self.engine(manifest, self.args.output)
+            verifier.discard_blobs(report, engine.store)
+            await self.run_engine(engine, report.damaged)
+            manifest.save()
+
+    async def history(self):
+        history = FileHistory(self.args.database)
+        try:
+            if not self.args.no_update:
+                indexes = [index async for index in self.indexes()]
+                version = await asyncio.to_thread(
+                    history.update, self.game, indexes, self.args.label
+                )
+                emit("updated", version=version)
+            if self.args.file is not None:
+                state = history.file(self.game, self.args.file)
+                if state is None:
+                    raise ValueError(f"{self.args.file} was never seen")
+                for change in history.file_changes(self.game, self.args.file):
+                    emit("change", **change)
+                emit("file", **state)
+            elif self.args.directory is not None:
+                for state in history.directory(self.game, self.args.directory):
+                    if not self.filter or (
+                        self.filter.matches_path(state["path"])
+                        and self.filter.matches_size(state["size"])
+                    ):
+                        emit("file", **state)
+            else:
+                for version in history.versions(self.game):
+                    emit("version", **version)
+        finally:
+            history.close()
+
+    async def search(self):
+        def progress(done, total):
+            emit("progress", indexed=done, total=total)
+
+        cache = self.cache or get_index_cache(
+            self.args.output.joinpath(ExtractionManifest.search_name)
+        )
+        content_index, stats = await asyncio.to_thread(
+            ContentIndex.refresh, self.args.output, cache, progress
+        )
+        emit("indexed", **stats.as_dict())
+        start = perf_counter()
+        hits = content_index.search(self.args.query, self.args.regexp, self.args.limit)
+        for hit in hits:
+            emit("hit", **hit.as_dict())
+        emit("done", hits=len(hits), elapsed=round(perf_counter() - start, 3))
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Lists, diffs and extracts Trove archives."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def command(name, help, output=True):
+        sub = commands.add_parser(name, help=help)
+        sub.add_argument("game", type=Path, help="Trove installation directory")
+        if output:
+            sub.add_argument("output", type=Path, help="Extracted files directory")
+        filter_options(sub)
+        sub.add_argument("--cache", type=Path, help="Index cache sqlite file")
+        return sub
+
+    def filter_options(sub):
+        sub.add_argument(
+            "-f",
+            "--filter",
+            action="append",
+            default=[],
+            help="Glob over the file paths to include, may be repeated",
+        )
+        sub.add_argument(
+            "-x",
+            "--exclude",
+            action="append",
+            default=[],
+            help="Glob over the file paths to leave out, may be repeated",
+        )
+        sub.add_argument("--regex", help="Regex searched in the file paths")
+        sub.add_argument(
+            "--ext",
+            action="append",
+            default=[],
+            help="File extension to include, may be repeated",
+        )
+        sub.add_argument("--min-size", type=parse_size, help="Like 512, 10k or 1M")
+        sub.add_argument("--max-size", type=parse_size, help="Like 512, 10k or 1M")
+
+    def engine_options(sub, store=True):
+        sub.add_argument("--inflate-workers", type=int, default=0)
+        sub.add_argument("--write-workers", type=int, default=4)
+        sub.add_argument("--budget", type=int, default=DEFAULT_MEMORY_BUDGET)
+        sub.add_argument("--interval", type=float, default=0.5)
+        if store:
+            sub.add_argument(
+                "--store", type=Path, help="Deduplicate through this store"
+            )
+        else:
+            sub.set_defaults(store=None)
+        sub.add_argument(
+            "--fsync",
+            choices=[p.value for p in FsyncPolicy],
+            default=FsyncPolicy.never.value,
+            help="Flush files to disk never, after each file or once at the end",
+        )
+
+    command("list", "List files in the indexes", False)
+    diff = command("diff", "List files that changed since the last extraction")
+    compare = command(
+        "compare", "Diff two installations or manifests by their indexes only"
+    )
+    compare.add_argument(
+        "--report", type=Path, help="Save a YAML (or .json) report here"
+    )
+    extract_all = command("extract-all", "Extract every (filtered) file")
+    extract = command("extract", "Extract files matching the filters")
+    pack = command("pack", "Extract (filtered) files into a single .rttpack file")
+    extract_changes = command("extract-changes", "Extract added and changed files")
+    extract_changes.add_argument(
+        "--changes-to", type=Path, help="Also save old and new versions here"
+    )
+    for sub in [diff, extract_changes]:
+        sub.add_argument(
+            "--trust-manifest",
+            action="store_true",
+            help="Skip the disk scan and unchanged indexes, like performance mode",
+        )
+    unpack = commands.add_parser(
+        "unpack", help="Extract (filtered) files out of a .rttpack file"
+    )
+    unpack.add_argument("pack", type=Path, help="Pack written by the pack command")
+    unpack.add_argument("output", type=Path, help="Extracted files directory")
+    filter_options(unpack)
+    unpack.set_defaults(game=None, cache=None)
+    verify = command("verify", "Check extracted files against the index hashes")
+    verify.add_argument(
+        "--repair", action="store_true", help="Extract missing and corrupt files"
+    )
+    verify.add_argument(
+        "--remove-extra", action="store_true", help="Delete files not in any index"
+    )
+    verify.add_argument("--hash-workers", type=int, default=0)
+    history = command("history", "Record and query file versions over patches", False)
+    history.add_argument("database", type=Path, help="History sqlite file")
+    history.add_argument("--file", help="Changes of this file over the versions")
+    history.add_argument(
+        "--directory", help="Every file ever seen in this directory and below"
+    )
+    history.add_argument("--label", help="Name of the version if one is recorded")
+    history.add_argument(
+        "--no-update", action="store_true", help="Query without recording first"
+    )
+    search = commands.add_parser(
+        "search", help="Search the contents of extracted files"
+    )
+    search.add_argument("output", type=Path, help="Extracted files directory")
+    search.add_argument("query", help="Text to find, case insensitively")
+    search.add_argument(
+        "-E", "--regexp", action="store_true", help="The query is a regex"
+    )
+    search.add_argument("--limit", type=int, default=1000, help="Most lines to show")
+    search.add_argument(
+        "--cache",
+        type=Path,
+        help=f"Index cache sqlite file, {ExtractionManifest.search_name} "
+        "next to the manifest by default",
+    )
+    search.set_defaults(
+        game=None,
+        filter=[],
+        exclude=[],
+        regex=None,
+        ext=[],
+        min_size=None,
+        max_size=None,
+    )
+    for sub in [extract_all, extract, extract_changes, verify]:
+        engine_options(sub)
+    engine_options(pack, store=False)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = get_parser().parse_args(argv)
+    cli = ExtractorCLI(args)
+    handler = getattr(cli, args.command.replace("-", "_"))
+    try:
+        asyncio.run(handler())
+    except KeyboardInterrupt:
+        emit("cancelled")
+        return 130
+    except Exception as e:
+        emit("error", message=str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
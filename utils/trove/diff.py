@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+from yaml import dump
+
+from utils.trove.extraction_pack import PackReader
+from utils.trove.extractor import (
+    ExtractionManifest,
+    FileStatus,
+    TFIndex,
+    TroveFile,
+    find_all_indexes,
+)
+
+
+@dataclass
+class DiffEntry:
+    path: str
+    status: FileStatus
+    size: Optional[int] = None
+    hash: Optional[int] = None
+    old_size: Optional[int] = None
+    old_hash: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        data = {"path": self.path, "status": self.status.name}
+        for key in ["size", "hash", "old_size", "old_hash"]:
+            if getattr(self, key) is not None:
+                data[key] = getattr(self, key)
+        return data
+
+
+class Catalog(dict):
+    """Relative file path -> (size, hash) of a game version, straight from indexes."""
+
+    def __init__(self, source: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.source = source
+
+    @classmethod
+    async def from_installation(cls, path: Path, cache=None) -> Catalog:
+        catalog = cls(str(path))
+        async for index in find_all_indexes(path, None, False, cache):
+            table = await index.files_list
+            directory = index.relative_directory(path)
+            prefix = f"{directory}/" if directory else ""
+            for row, (size, hash) in enumerate(zip(table.sizes, table.hashes)):
+                catalog[prefix + table.name(row)] = (size, hash)
+        return catalog
+
+    @classmethod
+    def from_manifest(
+        cls, manifest: ExtractionManifest, disk: Optional[dict] = None
+    ) -> Catalog:
+        """Catalog of an extracted tree, only of the files still on disk if a scan is given."""
+        catalog = cls(str(manifest.path))
+        for key, entry in manifest.files.items():
+            if disk is None or key in disk:
+                catalog[key] = (entry[0], entry[1])
+        return catalog
+
+    @classmethod
+    def from_pack(cls, path: Path) -> Catalog:
+        catalog = cls(str(path))
+        with PackReader(path) as pack:
+            for name, size, hash in pack.entries():
+                catalog[name] = (size, hash)
+        return catalog
+
+    @classmethod
+    async def load(cls, path: Path, cache=None) -> Catalog:
+        """Catalog of an installation, an extracted folder, a pack or a manifest file."""
+        if PackReader.is_pack(path):
+            return cls.from_pack(path)
+        if path.is_file():
+            return cls.from_manifest(ExtractionManifest.load(path.parent))
+        if path.joinpath(ExtractionManifest.file_name).exists():
+            return cls.from_manifest(ExtractionManifest.load(path))
+        return await cls.from_installation(path, cache)
+
+
+@dataclass
+class CatalogDiff:
+    old: str
+    new: str
+    entries: list[DiffEntry] = field(default_factory=list)
+
+    @classmethod
+    def compare(cls, old: Catalog, new: Catalog) -> CatalogDiff:
+        diff = cls(old.source, new.source)
+        for path, (size, hash) in new.items():
+            previous = old.get(path)
+            if previous is None:
+                diff.entries.append(DiffEntry(path, FileStatus.added, size, hash))
+            elif previous != (size, hash):
+                diff.entries.append(
+                    DiffEntry(path, FileStatus.changed, size, hash, *previous)
+                )
+        for path in old.keys() - new.keys():
+            old_size, old_hash = old[path]
+            diff.entries.append(
+                DiffEntry(
+                    path, FileStatus.removed, old_size=old_size, old_hash=old_hash
+                )
+            )
+        diff.entries.sort(key=lambda e: e.path)
+        return diff
+
+    def by_status(self, status: FileStatus) -> list[DiffEntry]:
+        return [e for e in self.entries if e.status == status]
+
+    @property
+    def added(self) -> list[DiffEntry]:
+        return self.by_status(FileStatus.added)
+
+    @property
+    def changed(self) -> list[DiffEntry]:
+        return self.by_status(FileStatus.changed)
+
+    @property
+    def removed(self) -> list[DiffEntry]:
+        return self.by_status(FileStatus.removed)
+
+    def report(self) -> dict:
+        return {
+            "Compared": self.old,
+            "With": self.new,
+            "Date": datetime.now().isoformat(),
+            "Summary": {
+                status.name.capitalize(): len(self.by_status(status))
+                for status in [FileStatus.added, FileStatus.changed, FileStatus.removed]
+            },
+            "Files": [e.as_dict() for e in self.entries],
+        }
+
+    def save(self, path: Path):
+        """Writes the report as JSON for .json paths, YAML otherwise."""
+        with open(path, "w+") as f:
+            if path.suffix == ".json":
+                json.dump(self.report(), f, indent=4)
+            else:
+                dump(self.report(), f, sort_keys=False)
+
+
+async def find_changes(
+    indexes: list[TFIndex],
+    opath: Path,
+    manifest: ExtractionManifest,
+    trust_manifest: bool = False,
+    workers: int = 0,
+    job=None,
+) -> list[TroveFile]:
+    """Added and changed files of parsed indexes against an extracted tree.
+
+    Trusting the manifest skips the disk scan and every index it synced with,
+    like performance mode. Indexes are compared concurrently so they overlap
+    while waiting on archives to inflate or hash, progress goes to the job."""
+    disk = None if trust_manifest else await asyncio.to_thread(manifest.scan)
+    total_files = sum(index.file_count or 0 for index in indexes)
+    done = 0
+    start = perf_counter()
+    semaphore = asyncio.Semaphore(workers or os.cpu_count() or 1)
+
+    async def compare(index):
+        nonlocal done
+        changed = []
+        async with semaphore:
+            if disk is None and not await manifest.source_changed(index, opath):
+                done += index.file_count or 0
+                return changed
+            for file in await index.files_list:
+                done += 1
+                if job is not None and not done % 1000:
+                    job.report(
+                        done=done, total=total_files, elapsed=perf_counter() - start
+                    )
+                    await job.checkpoint()
+                status = await file.compare(opath, manifest.root, manifest, disk)
+                if status in [FileStatus.added, FileStatus.changed]:
+                    changed.append(file)
+        return changed
+
+    changed_files = []
+    comparisons = [asyncio.create_task(compare(index)) for index in indexes]
+    try:
+        for comparison in asyncio.as_completed(comparisons):
+            changed_files.extend(await comparison)
+    finally:
+        for comparison in comparisons:
+            comparison.cancel()
+    return changed_files
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from threading import Lock
+from typing import Generator, Optional
+
+from utils.trove.file_writer import write_all
+
+MAGIC = b"RTTPACK\x01"
+FOOTER = struct.Struct("<Q8s")
+COUNTS = struct.Struct("<QQ")
+
+
+def _column(typecode: str, data: memoryview) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def _column_bytes(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class PackWriter:
+    """Streams extracted files into a single indexed pack instead of a folder tree.
+
+    The layout is planned up front from the index sizes, so the extraction
+    engine's writers can drop pieces at their final position in any order and
+    the table of contents is appended once everything landed. Files with the
+    same size and hash are stored once."""
+
+    file_name = "files.rttpack"
+    suffix = ".rttpack"
+
+    def __init__(self, path: Path, opath: Path):
+        self.path = path
+        self.opath = opath
+        self.names = bytearray()
+        self.name_offsets = array("I", [0])
+        self.offsets = array("Q")
+        self.sizes = array("I")
+        self.hashes = array("I")
+        self.end = len(MAGIC)
+        # Position of the files whose bytes are written, duplicates are left out
+        self._positions: dict[tuple[int, int], int] = {}
+        self._fd: Optional[int] = None
+        self._lock = Lock()
+
+    @property
+    def temporary_path(self) -> Path:
+        return self.path.with_name(self.path.name + ".part")
+
+    def layout(self, files):
+        blobs = {}
+        for file in files:
+            name = file.relative_path(self.opath).encode()
+            offset = blobs.get((file.size, file.hash))
+            if offset is None:
+                offset = blobs[(file.size, file.hash)] = self.end
+                self._positions[(id(file.index), file.row)] = offset
+                self.end += file.size
+            self.names += name
+            self.name_offsets.append(len(self.names))
+            self.offsets.append(offset)
+            self.sizes.append(file.size)
+            self.hashes.append(file.hash)
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(
+            self.temporary_path,
+            os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0),
+        )
+        write_all(self._fd, MAGIC)
+        os.ftruncate(self._fd, self.end)
+
+    def write(self, file, at: int, piece: memoryview):
+        position = self._positions.get((id(file.index), file.row))
+        if position is None:
+            return
+        with self._lock:
+            os.lseek(self._fd, position + at, os.SEEK_SET)
+            write_all(self._fd, piece)
+
+    def close(self, commit=True):
+        """Appends the table of contents and moves the pack into place."""
+        if self._fd is None:
+            return
+        try:
+            if commit:
+                os.lseek(self._fd, self.end, os.SEEK_SET)
+                write_all(self._fd, COUNTS.pack(len(self.sizes), len(self.names)))
+                write_all(self._fd, self.names)
+                for column in [
+                    self.name_offsets,
+                    self.offsets,
+                    self.sizes,
+                    self.hashes,
+                ]:
+                    write_all(self._fd, _column_bytes(column))
+                write_all(self._fd, FOOTER.pack(self.end, MAGIC))
+                os.fsync(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+        if commit:
+            os.replace(self.temporary_path, self.path)
+        else:
+            self.temporary_path.unlink(missing_ok=True)
+
+
+class PackReader:
+    """Read access to a pack written by PackWriter, without unpacking it."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a pack")
+        view = memoryview(self._map)
+        toc, magic = None, None
+        if len(view) >= len(MAGIC) + FOOTER.size:
+            toc, magic = FOOTER.unpack_from(view, len(view) - FOOTER.size)
+        if magic != MAGIC or view[: len(MAGIC)] != MAGIC:
+            view.release()
+            self.close()
+            raise ValueError(f"{path} is not a pack")
+        count, names_size = COUNTS.unpack_from(view, toc)
+        position = toc + COUNTS.size
+        self.names = bytes(view[position : position + names_size])
+        position += names_size
+        columns = []
+        for typecode, length in [
+            ("I", count + 1),
+            ("Q", count),
+            ("I", count),
+            ("I", count),
+        ]:
+            size = array(typecode).itemsize * length
+            columns.append(_column(typecode, view[position : position + size]))
+            position += size
+        view.release()
+        self.name_offsets, self.offsets, self.sizes, self.hashes = columns
+        self._rows: Optional[dict[str, int]] = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __contains__(self, name: str):
+        return name in self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @classmethod
+    def is_pack(cls, path: Path) -> bool:
+        return path.is_file() and path.suffix == PackWriter.suffix
+
+    def name(self, row: int) -> str:
+        return self.names[self.name_offsets[row] : self.name_offsets[row + 1]].decode()
+
+    @property
+    def rows(self) -> dict[str, int]:
+        if self._rows is None:
+            self._rows = {self.name(row): row for row in range(len(self))}
+        return self._rows
+
+    def entries(self) -> Generator[tuple[str, int, int]]:
+        """Yields (name, size, hash) of every file in the pack."""
+        for row in range(len(self)):
+            yield self.name(row), self.sizes[row], self.hashes[row]
+
+    def read(self, name: str) -> bytes:
+        row = self.rows[name]
+        offset = self.offsets[row]
+        return self._map[offset : offset + self.sizes[row]]
+
+    def extract(self, name: str, path: Path) -> Path:
+        path_to_save = path.joinpath(name)
+        path_to_save.parent.mkdir(parents=True, exist_ok=True)
+        path_to_save.write_bytes(self.read(name))
+        return path_to_save
+
+    def close(self):
+        self._map.close()
+        self._file.close()
@@ -1,20 +1,52 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import mmap
+import os
+import posixpath
 import re
+import weakref
 import zlib
-from copy import copy
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from hashlib import md5
+from hashlib import blake2b
 from pathlib import Path
+from queue import Queue
+from threading import Event, Lock
+from time import perf_counter
 from typing import Generator, Optional
 
 import aiofiles
-from binary_reader import BinaryReader
-from utils.functions import read_leb128
+from utils.functions import decode_leb128
+from utils.hashing import file_checksum
+from utils.trove.blob_store import BlobStore
+from utils.trove.extraction_pack import PackWriter
+from utils.trove.file_writer import FileWriter, write_all
+from utils.trove.memory_cache import memory_cache
 from models.trove.directory import Directories
 
-
 archive_id = re.compile(r"^archive(\d+)")
+# Upper bound of decompressed bytes held at once while streaming an archive
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def source_key(kind: str, path: Path) -> tuple:
+    """Memory cache key of a file's contents, changes whenever the file does."""
+    stat = path.stat()
+    return kind, str(path), stat.st_size, stat.st_mtime_ns
+
+
+def hash_file(path: Path) -> str:
+    """Fast hash of a file's bytes as stored on disk, read in fixed size chunks."""
+    digest = blake2b(digest_size=16)
+    buffer = bytearray(READ_SIZE)
+    with memoryview(buffer) as view, open(path, "rb") as f:
+        while size := f.readinto(buffer):
+            digest.update(view[:size])
+    return digest.hexdigest()
 
 
 class FileStatus(Enum):
@@ -24,19 +56,153 @@ class FileStatus(Enum):
     removed = "Removed"
 
 
-class TroveFile:
-    index: TFIndex = None
+class FileTable:
+    """Columnar table of the entries listed in an index.tfi
 
-    def __init__(self, **data):
-        for key, value in data.items():
-            setattr(self, key, value)
-        self._content: Optional[bytes] = None
-        self._content_hash: Optional[str] = None
-        self._status: Optional[FileStatus] = None
+    Names are kept in a single blob and every other field in its own array,
+    rows are only materialized as TroveFile views when accessed."""
+
+    def __init__(
+        self,
+        names: bytes = b"",
+        name_offsets: array = None,
+        archive_indexes: array = None,
+        offsets: array = None,
+        sizes: array = None,
+        hashes: array = None,
+    ):
+        self.index: Optional[TFIndex] = None
+        self.names = names
+        self.name_offsets = (
+            name_offsets if name_offsets is not None else array("I", [0])
+        )
+        self.archive_indexes = (
+            archive_indexes if archive_indexes is not None else array("I")
+        )
+        self.offsets = offsets if offsets is not None else array("I")
+        self.sizes = sizes if sizes is not None else array("I")
+        self.hashes = hashes if hashes is not None else array("I")
+        self._archive_rows: Optional[dict[int, array]] = None
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, row: int) -> TroveFile:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("file table index out of range")
+        return TroveFile(self.index, row)
+
+    def __iter__(self) -> Generator[TroveFile]:
+        for row in range(len(self)):
+            yield TroveFile(self.index, row)
 
     @classmethod
-    def parse_obj(cls, data):
-        return cls(**data)
+    def parse(cls, data: bytes) -> FileTable:
+        view = memoryview(data)
+        end = len(view)
+        names = bytearray()
+        name_offsets = array("I", [0])
+        columns = (array("I"), array("I"), array("I"), array("I"))
+        pos = 0
+        while pos < end:
+            length, pos = decode_leb128(view, pos)
+            names += view[pos : pos + length]
+            pos += length
+            name_offsets.append(len(names))
+            for column in columns:
+                # Most values in an index fit a single byte, skip the call for those
+                byte = view[pos]
+                if byte < 0x80:
+                    column.append(byte)
+                    pos += 1
+                else:
+                    value, pos = decode_leb128(view, pos)
+                    column.append(value)
+        table = cls(bytes(names), name_offsets, *columns)
+        _ = table.archive_rows
+        return table
+
+    @property
+    def archive_rows(self) -> dict[int, array]:
+        """Rows of each archive sorted by offset, bucketed in a single pass."""
+        if self._archive_rows is None:
+            buckets = {}
+            for row, archive_index in enumerate(self.archive_indexes):
+                buckets.setdefault(archive_index, []).append(row)
+            self._archive_rows = {
+                archive_index: array("I", sorted(rows, key=self.offsets.__getitem__))
+                for archive_index, rows in buckets.items()
+            }
+        return self._archive_rows
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by the table."""
+        columns = [
+            self.name_offsets,
+            self.archive_indexes,
+            self.offsets,
+            self.sizes,
+            self.hashes,
+            *(self._archive_rows or {}).values(),
+        ]
+        return len(self.names) + sum(c.itemsize * len(c) for c in columns)
+
+    def rows_for(self, archive_index: int) -> array:
+        return self.archive_rows.get(archive_index, array("I"))
+
+    def bind(self, index: TFIndex) -> FileTable:
+        self.index = index
+        return self
+
+    def name(self, row: int) -> str:
+        return self.names[self.name_offsets[row] : self.name_offsets[row + 1]].decode()
+
+
+class TroveFile:
+    def __init__(self, index: TFIndex, row: int, archive: Optional[TFArchive] = None):
+        self.index = index
+        self.row = row
+        self._archive = archive
+        self._status: Optional[FileStatus] = None
+
+    def __str__(self):
+        return f"<path={str(self.path)}>"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def name(self) -> str:
+        return self.index.table.name(self.row)
+
+    @property
+    def path(self) -> Path:
+        return self.index.directory.joinpath(self.name)
+
+    @property
+    def archive_index(self) -> int:
+        return self.index.table.archive_indexes[self.row]
+
+    @property
+    def offset(self) -> int:
+        return self.index.table.offsets[self.row]
+
+    @property
+    def size(self) -> int:
+        return self.index.table.sizes[self.row]
+
+    @property
+    def hash(self) -> int:
+        return self.index.table.hashes[self.row]
+
+    @property
+    def archive(self) -> TFArchive:
+        if self._archive is None:
+            self._archive = self.index.get_archive(self.archive_index)
+        return self._archive
 
     @property
     def status(self):
@@ -53,20 +219,18 @@ class TroveFile:
         if self.status == FileStatus.removed:
             return "red"
 
-    @property
-    async def content_hash(self):
-        if self._content is None:
-            _ = await self.content
-        return self._content_hash
+    async def read(self, budget: int = DEFAULT_MEMORY_BUDGET) -> bytes:
+        """Inflates the archive only up to the end of this file, keeping nothing around."""
 
-    @property
-    async def content(self):
-        if self._content is None:
-            reader = BinaryReader(await self.archive.content)
-            reader.seek(self.offset)
-            self._content = reader.read_bytes(self.size)
-            self._content_hash = md5(self._content).hexdigest()
-        return self._content
+        def read():
+            content = bytearray()
+            for _, _, piece in self.archive.stream([self], budget):
+                content += piece
+                if len(content) >= self.size:
+                    break
+            return bytes(content)
+
+        return await asyncio.to_thread(read)
 
     def extracted_path(self, opath: Path, path: Path) -> Path:
         return path.joinpath(self.path.relative_to(opath))
@@ -74,33 +238,57 @@ class TroveFile:
     def extract_to_path(self, opath: Path, path: Path) -> Path:
         return path.joinpath(self.path.relative_to(opath))
 
-    async def compare(self, opath: Path, path: Path) -> FileStatus:
-        extracted_file = self.extracted_path(opath, path)
-        if not extracted_file.exists():
+    def relative_path(self, opath: Path) -> str:
+        directory = self.index.relative_directory(opath)
+        return f"{directory}/{self.name}" if directory else self.name
+
+    async def compare(
+        self,
+        opath: Path,
+        path: Path,
+        manifest: Optional[ExtractionManifest] = None,
+        disk: Optional[dict] = None,
+    ) -> FileStatus:
+        if manifest is not None:
+            self._status = manifest.status(self, opath, disk)
+            if self._status is not None:
+                return self.status
+        # Checked against the index's hash, the archive is never inflated for it
+        extracted_checksum = await asyncio.to_thread(
+            file_checksum, self.extracted_path(opath, path)
+        )
+        if extracted_checksum is None:
             self._status = FileStatus.added
+        elif extracted_checksum == self.hash:
+            self._status = FileStatus.unchanged
         else:
-            async with aiofiles.open(extracted_file, "rb") as f:
-                if await self.content_hash == md5(await f.read()).hexdigest():
-                    self._status = FileStatus.unchanged
-                else:
-                    self._status = FileStatus.changed
+            self._status = FileStatus.changed
         return self.status
 
-    async def copy_old(self, opath: Path, gpath: Path, path: Path):
+    async def copy_old(
+        self,
+        opath: Path,
+        gpath: Path,
+        path: Path,
+        manifest: Optional[ExtractionManifest] = None,
+        store: Optional[BlobStore] = None,
+        writer: Optional[FileWriter] = None,
+    ):
+        path_to_save = self.extract_to_path(opath, path)
+        writer = writer or FileWriter()
+        if manifest is not None and store is not None:
+            # Link the old version straight from the store when it has it
+            entry = manifest.files.get(self.relative_path(opath))
+            if entry is not None:
+                blob_path = store.path(entry[0], entry[1])
+                if blob_path.exists():
+                    if not await asyncio.to_thread(store.link, blob_path, path_to_save):
+                        writer.sync(path_to_save)
+                    return
         path_to_get = self.extract_to_path(opath, gpath)
         if not path_to_get.exists():
             return
-        path_to_save = self.extract_to_path(opath, path)
-        path_to_save.parent.mkdir(parents=True, exist_ok=True)
-        async with aiofiles.open(path_to_get, "rb") as old:
-            async with aiofiles.open(path_to_save, "wb") as new:
-                await new.write(await old.read())
-
-    async def save(self, opath: Path, path: Path):
-        path_to_save = self.extract_to_path(opath, path)
-        path_to_save.parent.mkdir(parents=True, exist_ok=True)
-        async with aiofiles.open(path_to_save, "wb") as f:
-            await f.write(await self.content)
+        await asyncio.to_thread(writer.copy, path_to_get, path_to_save)
 
 
 class TFArchive:
@@ -109,11 +297,10 @@ class TFArchive:
         self.directory = path.parent
         self.path = path
         self.id = int(archive_id.search(path.stem).group(1))
-        self._content = None
         self._content_hash: Optional[str] = None
 
     def __eq__(self, other):
-        if not isinstance(other, TFIndex):
+        if not isinstance(other, TFArchive):
             return False
         return self.path == other.path
 
@@ -131,34 +318,436 @@ class TFArchive:
 
     @property
     async def content_hash(self):
-        if self._content is None:
-            _ = await self.content
+        """Hash of the compressed archive, doesn't require inflating it."""
+        if self._content_hash is None:
+            self._content_hash = await asyncio.to_thread(hash_file, self.path)
         return self._content_hash
 
+    async def files(self) -> Generator[TroveFile]:
+        table = await self.index.files_list
+        for row in table.rows_for(self.id):
+            yield TroveFile(self.index, row, self)
+
+    def inflate(self, budget: int = DEFAULT_MEMORY_BUDGET) -> Generator[bytes]:
+        """Inflates the memory mapped archive in chunks of at most `budget` bytes."""
+        data = zlib.decompressobj(wbits=zlib.MAX_WBITS)
+        with open(self.path, "rb") as f:
+            if not self.path.stat().st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    position = 0
+                    while True:
+                        if data.unconsumed_tail:
+                            chunk = data.decompress(data.unconsumed_tail, budget)
+                        elif position < len(view):
+                            with view[position : position + READ_SIZE] as compressed:
+                                chunk = data.decompress(compressed, budget)
+                            position += READ_SIZE
+                        else:
+                            chunk = data.flush()
+                            if chunk:
+                                yield chunk
+                            break
+                        if chunk:
+                            yield chunk
+
+    def stream(
+        self, files: list[TroveFile], budget: int = DEFAULT_MEMORY_BUDGET
+    ) -> Generator[tuple[TroveFile, int, memoryview]]:
+        """Yields `(file, at, piece)` slices of the given files as the archive inflates.
+
+        Pieces are views into the decompressed chunk they came from, `at` is the
+        position of the piece within its file."""
+        # Usually already ordered when coming from files(), which makes this linear
+        files = sorted(files, key=lambda f: f.offset)
+        position = 0
+        i = 0
+        active = []
+        chunks = self.inflate(budget)
+        for chunk in chunks:
+            end = position + len(chunk)
+            with memoryview(chunk) as view:
+                while i < len(files) and files[i].offset < end:
+                    active.append(files[i])
+                    i += 1
+                remaining = []
+                for file in active:
+                    file_end = file.offset + file.size
+                    start = max(file.offset, position) - position
+                    stop = min(file_end, end) - position
+                    yield file, position + start - file.offset, view[start:stop]
+                    if file_end > end:
+                        remaining.append(file)
+                active = remaining
+            position = end
+            if i == len(files) and not active:
+                # Nothing else wanted from this archive, skip inflating the rest
+                chunks.close()
+                break
+        # Empty files sitting at the very end of the archive
+        for file in files[i:]:
+            if file.offset == position and not file.size:
+                yield file, 0, memoryview(b"")
+
+
+def write_piece(path: Path, at: int, piece: memoryview, size: int, replace=False):
+    """Writes a piece at its position so pieces of a file can land in any order.
+
+    With `replace` the existing file is unlinked first, so a hardlinked blob
+    behind it is never modified in place."""
+    if replace:
+        path.unlink(missing_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0))
+    try:
+        # Set the final size first, this also drops leftovers of an older version
+        os.ftruncate(fd, size)
+        if piece:
+            os.lseek(fd, at, os.SEEK_SET)
+            write_all(fd, piece)
+    finally:
+        os.close(fd)
+
+
+class ExtractionStats:
+    def __init__(self, total_files: int = 0, total_bytes: int = 0):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.archives = 0
+        self.start = perf_counter()
+        self.end: Optional[float] = None
+        self._lock = Lock()
+
+    def add(self, files: int, size: int, archives: int = 0):
+        with self._lock:
+            self.files += files
+            self.bytes += size
+            self.archives += archives
+
     @property
-    async def content(self):
-        if self._content is None:
-            data = zlib.decompressobj(wbits=zlib.MAX_WBITS)
-            async with aiofiles.open(self.path, "rb") as f:
-                self._content = data.decompress(await f.read())
-                self._content_hash = md5(self._content).hexdigest()
-        return self._content
+    def elapsed(self) -> float:
+        return (self.end or perf_counter()) - self.start
 
-    async def files(self) -> Generator[TroveFile]:
-        for file in await self.index.files_list:
-            if file["archive_index"] == int(self):
-                copy_file = copy(file)
-                copy_file["archive"] = self
-                yield TroveFile.parse_obj(copy_file)
+    @property
+    def progress(self) -> float:
+        if self.total_bytes:
+            return self.bytes / self.total_bytes
+        if self.total_files:
+            return self.files / self.total_files
+        return 1.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> float:
+        if not self.bytes_per_second:
+            return 0.0
+        return max(self.total_bytes - self.bytes, 0) / self.bytes_per_second
+
+    def as_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "total_files": self.total_files,
+            "bytes": self.bytes,
+            "total_bytes": self.total_bytes,
+            "archives": self.archives,
+            "elapsed": round(self.elapsed, 3),
+            "files_per_second": round(self.files_per_second, 1),
+            "bytes_per_second": round(self.bytes_per_second, 1),
+            "eta": round(self.eta, 1),
+        }
+
+
+class ExtractionEngine:
+    """Extracts many archives at once through an inflate -> write pipeline.
+
+    Archives are inflated in parallel on a thread pool (zlib releases the GIL),
+    their file pieces are batched into a bounded queue and drained by a pool of
+    writer threads. Memory in flight is roughly
+    `(queue_size + inflate_workers) * budget` regardless of archive sizes."""
+
+    def __init__(
+        self,
+        opath: Path,
+        *paths: Path,
+        inflate_workers: int = 0,
+        write_workers: int = 4,
+        queue_size: int = 8,
+        budget: int = DEFAULT_MEMORY_BUDGET,
+        manifest: Optional[ExtractionManifest] = None,
+        store: Optional[BlobStore] = None,
+        pack: Optional[PackWriter] = None,
+        writer: Optional[FileWriter] = None,
+    ):
+        self.opath = opath
+        self.paths = paths
+        self.manifest = manifest
+        self.store = store
+        self.pack = pack
+        self.writer = writer or FileWriter()
+        self.inflate_workers = inflate_workers or os.cpu_count() or 1
+        self.write_workers = max(write_workers, 1)
+        self.queue_size = queue_size
+        self.budget = budget
+        self.stats = ExtractionStats()
+        self._queue: Queue = Queue(maxsize=queue_size)
+        self._cancelled = Event()
+        self._resumed = Event()
+        self._resumed.set()
+        self._error: Optional[Exception] = None
+        self._pending: dict[tuple[int, int], int] = {}
+        self._pending_lock = Lock()
+        self._archive_files: dict[Path, int] = {}
+        self._archive_sizes: dict[Path, int] = {}
+        # Archives gone from disk since their index was read, left out of the run
+        self.missing: list[TFArchive] = []
+        # Files whose content is already (or about to be) in the blob store
+        self._aliases: list[TroveFile] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._resumed.set()
+
+    def pause(self):
+        """Holds the inflaters, writers finish what is already queued."""
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def extract(
+        self,
+        jobs: list[tuple[TFArchive, list[TroveFile]]],
+        on_progress=None,
+        interval: float = 0.5,
+    ) -> ExtractionStats:
+        """Runs the pipeline for `(archive, files)` jobs, awaiting `on_progress(stats)` every interval."""
+        if self.manifest is not None and self.manifest.resumable:
+            jobs = [
+                (
+                    archive,
+                    [f for f in files if not self.manifest.is_journaled(f, self.opath)],
+                )
+                for archive, files in jobs
+                if not self.manifest.archive_completed(archive, self.opath)
+            ]
+        jobs = [(archive, files) for archive, files in jobs if files]
+        jobs = await asyncio.to_thread(self._available, jobs)
+        self.stats = ExtractionStats(
+            sum(len(files) for _, files in jobs),
+            sum(f.size for _, files in jobs for f in files),
+        )
+        if self.store is not None:
+            jobs = self._deduplicate(jobs)
+        if self.pack is not None:
+            self.pack.layout(f for _, files in jobs for f in files)
+        self._archive_files = {archive.path: len(files) for archive, files in jobs}
+        task = asyncio.create_task(asyncio.to_thread(self._run, jobs))
+        while not task.done():
+            await asyncio.wait({task}, timeout=interval)
+            if on_progress is not None:
+                await on_progress(self.stats)
+        return task.result()
+
+    def _run(self, jobs) -> ExtractionStats:
+        if self.pack is not None:
+            self.pack.open()
+        with ThreadPoolExecutor(self.write_workers) as writers:
+            for _ in range(self.write_workers):
+                writers.submit(self._write_worker)
+            with ThreadPoolExecutor(self.inflate_workers) as inflaters:
+                # Biggest archives first so a huge one doesn't end up running alone
+                jobs = sorted(jobs, key=lambda j: -self._archive_sizes[j[0].path])
+                for future in [inflaters.submit(self._inflate, *job) for job in jobs]:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self._fail(e)
+            for _ in range(self.write_workers):
+                self._queue.put(None)
+        if self._aliases and not self.cancelled:
+            self._link_aliases()
+        self.stats.end = perf_counter()
+        if self.pack is not None:
+            self.pack.close(self._error is None and not self.cancelled)
+        self.writer.finish()
+        if self.manifest is not None:
+            self.manifest.flush()
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def _available(self, jobs):
+        """Leaves out archives that can't be found, one of them shouldn't stop the rest."""
+        available = []
+        for archive, files in jobs:
+            try:
+                self._archive_sizes[archive.path] = archive.path.stat().st_size
+            except OSError:
+                self.missing.append(archive)
+                continue
+            available.append((archive, files))
+        return available
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self.cancel()
+
+    def _deduplicate(self, jobs):
+        """Leaves out files whose blob exists or is written by another job."""
+        claimed = set()
+        deduplicated = []
+        for archive, files in jobs:
+            unique = []
+            for file in files:
+                key = self.store.key(file.size, file.hash)
+                if key in claimed or self.store.has(file):
+                    self._aliases.append(file)
+                else:
+                    claimed.add(key)
+                    unique.append(file)
+            if unique:
+                deduplicated.append((archive, unique))
+        return deduplicated
+
+    def _link_aliases(self):
+        for file in self._aliases:
+            if self.cancelled:
+                return
+            self._materialize(file)
+            if self.manifest is not None:
+                self._record(file)
+            self.stats.add(1, file.size)
+
+    def _targets(self, file: TroveFile) -> list[Path]:
+        if self.pack is not None:
+            return []
+        if self.store is not None:
+            return [self.store.temporary_path(file)]
+        # Only the first destination is written, the others get kernel copies of it
+        return [file.extract_to_path(self.opath, self.paths[0])]
+
+    def _replicate(self, file: TroveFile):
+        written = file.extract_to_path(self.opath, self.paths[0])
+        self.writer.sync(written)
+        for path in self.paths[1:]:
+            self.writer.copy(written, file.extract_to_path(self.opath, path))
+
+    def _materialize(self, file: TroveFile):
+        for path in self.paths:
+            target = file.extract_to_path(self.opath, path)
+            # Hardlinks share the blob's data, only copies need syncing on their own
+            if not self.store.materialize(file, target):
+                self.writer.sync(target)
+
+    def _record(self, file: TroveFile):
+        path_to_save = file.extract_to_path(self.opath, self.manifest.root)
+        self.manifest.record(file, self.opath, path_to_save.stat())
+
+    def _inflate(self, archive: TFArchive, files: list[TroveFile]):
+        batch = []
+        batch_size = 0
+        for piece in archive.stream(files, self.budget):
+            self._resumed.wait()
+            if self.cancelled:
+                return
+            file, at, data = piece
+            if not at and len(data) < file.size:
+                # First piece of a file spanning batches, clear it before any lands
+                for path_to_save in self._targets(file):
+                    path_to_save.unlink(missing_ok=True)
+            batch.append(piece)
+            batch_size += len(piece[2])
+            if batch_size >= self.budget:
+                self._queue.put(batch)
+                batch = []
+                batch_size = 0
+        if batch:
+            self._queue.put(batch)
+        self.stats.add(0, 0, 1)
+
+    def _write_worker(self):
+        while (batch := self._queue.get()) is not None:
+            # Keep draining after a failure so producers never block on a full queue
+            if self.cancelled:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._fail(e)
+
+    def _write(self, batch):
+        files = 0
+        size = 0
+        for file, at, piece in batch:
+            whole = len(piece) == file.size
+            for path_to_save in self._targets(file):
+                self.writer.ensure_directory(path_to_save.parent)
+                write_piece(path_to_save, at, piece, file.size, whole)
+            if self.pack is not None:
+                self.pack.write(file, at, piece)
+            size += len(piece)
+            if self._completes(file, piece):
+                files += 1
+                if self.store is not None:
+                    self.store.commit(file)
+                    self.writer.sync(self.store.blob_path(file))
+                    self._materialize(file)
+                elif self.pack is None:
+                    self._replicate(file)
+                if self.manifest is not None:
+                    self._record(file)
+                    self._archive_progress(file.archive)
+        self.stats.add(files, size)
+
+    def _archive_progress(self, archive: TFArchive):
+        with self._pending_lock:
+            self._archive_files[archive.path] -= 1
+            completed = not self._archive_files[archive.path]
+        if completed:
+            self.manifest.record_archive(archive, self.opath)
+
+    def _completes(self, file: TroveFile, piece: memoryview) -> bool:
+        """Whether this piece is the last one of its file still to be written."""
+        if len(piece) == file.size:
+            return True
+        key = (id(file.index), file.row)
+        with self._pending_lock:
+            remaining = self._pending.get(key, file.size) - len(piece)
+            if remaining > 0:
+                self._pending[key] = remaining
+                return False
+            self._pending.pop(key, None)
+            return True
 
 
 class TFIndex:
-    def __init__(self, file: Path):
+    def __init__(self, file: Path, cache=None):
         self.directory = file.parent
         self.path = file
-        self._files = []
-        self._content = None
+        self.cache = cache
+        # Tables live in the memory cache, reloaded if evicted while still in use
+        self._table_ref: Optional[weakref.ref] = None
+        self._archives: dict[int, TFArchive] = {}
+        self._relative_directories: dict[Path, str] = {}
+        self._cache_key = None
         self._content_hash: Optional[str] = None
+        # Aggregates of the table, kept after it's evicted from the memory cache
+        self.file_count: Optional[int] = None
+        self.total_size: Optional[int] = None
 
     def __eq__(self, other):
         if not isinstance(other, TFIndex):
@@ -174,46 +763,381 @@ class TFIndex:
     def __repr__(self):
         return self.__str__()
 
+    @property
+    def cache_key(self) -> tuple:
+        if self._cache_key is None:
+            self._cache_key = source_key("index", self.path)
+        return self._cache_key
+
     @property
     async def content_hash(self):
-        if self._content is None:
-            _ = await self.content
+        if self._content_hash is None:
+            content = memory_cache.get(self.cache_key)
+            if content is None:
+                self._content_hash = await asyncio.to_thread(hash_file, self.path)
+            else:
+                self._content_hash = blake2b(content, digest_size=16).hexdigest()
         return self._content_hash
 
     @property
     async def content(self):
-        if self._content is None:
+        content = memory_cache.get(self.cache_key)
+        if content is None:
             async with aiofiles.open(self.path, "rb") as f:
-                self._content = await f.read()
-            self._content_hash = md5(self._content).hexdigest()
-        return self._content
+                content = await f.read()
+            memory_cache.put(self.cache_key, content, len(content))
+        return content
 
     @property
     def archives(self) -> Generator[TFArchive]:
         for archive in self.directory.glob("*.tfa"):
-            yield TFArchive(self, archive)
+            archive = TFArchive(self, archive)
+            yield self._archives.setdefault(archive.id, archive)
+
+    def get_archive(self, archive_index: int) -> TFArchive:
+        if archive_index not in self._archives:
+            path = self.directory.joinpath(f"archive{archive_index}.tfa")
+            self._archives[archive_index] = TFArchive(self, path)
+        return self._archives[archive_index]
+
+    @property
+    def table(self) -> Optional[FileTable]:
+        if self._table_ref is None:
+            return None
+        table = self._table_ref()
+        if table is None:
+            # Evicted while views still use it, read back the same way as at first
+            table = self._read()
+        return table
+
+    def _read(self) -> FileTable:
+        table = None
+        if self.cache is not None:
+            table = self.cache.get(self.path)
+        if table is None:
+            content = memory_cache.get(self.cache_key)
+            if content is None:
+                content = self.path.read_bytes()
+                memory_cache.put(self.cache_key, content, len(content))
+            table = FileTable.parse(content)
+            if self.cache is not None:
+                self.cache.put(self.path, table)
+        self._keep(table)
+        return table
+
+    def _keep(self, table: FileTable):
+        table.bind(self)
+        if self.file_count is None:
+            self.file_count = len(table)
+            self.total_size = sum(table.sizes)
+        # Keyed by the file rather than this object, a newer index of the same
+        # file takes the entry over instead of a dead one holding on to budget
+        memory_cache.put(("table", *self.cache_key), table, table.nbytes)
+        self._table_ref = weakref.ref(table)
+
+    def relative_directory(self, opath: Path) -> str:
+        if opath not in self._relative_directories:
+            directory = self.directory.relative_to(opath).as_posix()
+            self._relative_directories[opath] = "" if directory == "." else directory
+        return self._relative_directories[opath]
 
     @property
-    async def files_list(self) -> list[dict]:
-        if not self._files:
-            self._files.extend([x async for x in self.get_files_list()])
-        return self._files
-
-    async def get_files_list(self) -> Generator[dict]:
-        reader = BinaryReader(await self.content)
-        while reader.pos() < reader.size():
-            file = dict()
-            file["name"] = reader.read_str(read_leb128(reader, reader.pos()))
-            file["path"] = self.directory.joinpath(file["name"])
-            file["archive_index"] = read_leb128(reader, reader.pos())
-            file["offset"] = read_leb128(reader, reader.pos())
-            file["size"] = read_leb128(reader, reader.pos())
-            file["hash"] = read_leb128(reader, reader.pos())
-            yield file
+    async def files_list(self) -> FileTable:
+        table = self.table
+        if table is None:
+            table = await asyncio.to_thread(self.load)
+        return table
+
+    def load(self) -> FileTable:
+        """Table from memory, the sqlite cache or parsing, safe to call from threads."""
+        table = self.table
+        if table is None:
+            table = self._read()
+        return table
+
+
+class ExtractionManifest:
+    """Record of the files written into an extracted tree.
+
+    Each entry keeps the size and Trove hash the file had in its index and the
+    size and mtime it was written with, so later runs can tell what changed from
+    metadata alone instead of reading the extracted files back."""
+
+    file_name = "manifest.json"
+    journal_name = "manifest.journal"
+    # Default content search cache of the tree, sqlite may add a -journal next to it
+    search_name = "manifest.search.sqlite"
+    # Change tracking file of older versions, left behind in extracted trees
+    legacy_name = "hashes.json"
+    version = 1
+    # Journal entries buffered before being flushed to disk
+    journal_flush = 1000
+
+    def __init__(
+        self, root: Path, files: Optional[dict] = None, sources: Optional[dict] = None
+    ):
+        self.root = root
+        self.files: dict[str, list[int]] = files or {}
+        # Indexes and archives the tree was last fully synced with
+        self.sources: dict[str, list] = sources or {}
+        # Progress of an unfinished run, replayed from the journal
+        self.journaled: set[str] = set()
+        # Archive key -> size and mtime it had when all its files were written
+        self.completed_archives: dict[str, list[int]] = {}
+        self._journal = None
+        self._unflushed = 0
+        self._lock = Lock()
+
+    @property
+    def path(self) -> Path:
+        return self.root.joinpath(self.file_name)
+
+    @property
+    def journal_path(self) -> Path:
+        return self.root.joinpath(self.journal_name)
+
+    @property
+    def resumable(self) -> bool:
+        return bool(self.journaled or self.completed_archives)
+
+    @classmethod
+    def load(cls, root: Path) -> ExtractionManifest:
+        manifest = cls(root)
+        path = root.joinpath(cls.file_name)
+        if path.exists():
+            try:
+                data = json.loads(path.read_text())
+                if data.get("version") == cls.version:
+                    manifest = cls(root, data["files"], data.get("sources"))
+            except (json.JSONDecodeError, KeyError, AttributeError):
+                print("Failed to load extraction manifest, malformed file.")
+        manifest.replay()
+        return manifest
+
+    def replay(self):
+        """Applies what an interrupted run committed to the journal."""
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    kind, key, *entry = json.loads(line)
+                except (json.JSONDecodeError, ValueError):
+                    # Last line may have been cut short by a crash
+                    continue
+                if kind == "f":
+                    self.files[key] = entry
+                    self.journaled.add(key)
+                elif kind == "a" and len(entry) == 2:
+                    self.completed_archives[key] = entry
+
+    def save(self, path: Optional[Path] = None):
+        """Atomically writes the manifest, committing and clearing the journal."""
+        commit = path is None
+        path = path or self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": self.version, "files": self.files, "sources": self.sources}
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(temporary_path, "w") as f:
+            f.write(json.dumps(data, separators=(",", ":")))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+        if commit:
+            with self._lock:
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                self.journal_path.unlink(missing_ok=True)
+                self.journaled.clear()
+                self.completed_archives.clear()
+
+    def flush(self):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.flush()
+                self._unflushed = 0
+
+    def _append(self, entry: list, flush=False):
+        with self._lock:
+            if self._journal is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                self._journal = open(self.journal_path, "a")
+            self._journal.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._unflushed += 1
+            if flush or self._unflushed >= self.journal_flush:
+                self._journal.flush()
+                self._unflushed = 0
+
+    def record(self, file: TroveFile, opath: Path, stat: os.stat_result):
+        self.record_path(file.relative_path(opath), file.size, file.hash, stat)
+
+    def record_path(self, key: str, size: int, hash: int, stat: os.stat_result):
+        entry = [size, hash, stat.st_size, stat.st_mtime_ns]
+        self.files[key] = entry
+        self._append(["f", key, *entry])
+
+    def record_archive(self, archive: TFArchive, opath: Path):
+        key = archive.path.relative_to(opath).as_posix()
+        stat = archive.path.stat()
+        entry = [stat.st_size, stat.st_mtime_ns]
+        self.completed_archives[key] = entry
+        self._append(["a", key, *entry], flush=True)
+
+    def archive_completed(self, archive: TFArchive, opath: Path) -> bool:
+        """Whether an unfinished run wrote every file of this archive as it is now.
+
+        A patch landing before the resume changes the archive's size or mtime,
+        its files then go through the per file journal check instead."""
+        entry = self.completed_archives.get(archive.path.relative_to(opath).as_posix())
+        if entry is None:
+            return False
+        try:
+            stat = archive.path.stat()
+        except OSError:
+            return False
+        return entry == [stat.st_size, stat.st_mtime_ns]
+
+    def is_journaled(self, file: TroveFile, opath: Path) -> bool:
+        """Whether an unfinished run already wrote this exact version of the file."""
+        key = file.relative_path(opath)
+        if key not in self.journaled:
+            return False
+        return self.files[key][:2] == [file.size, file.hash]
+
+    async def record_source(self, source: TFIndex | TFArchive, opath: Path):
+        stat = source.path.stat()
+        self.sources[source.path.relative_to(opath).as_posix()] = [
+            stat.st_size,
+            stat.st_mtime_ns,
+            await source.content_hash,
+        ]
+
+    async def record_sync(
+        self, indexes: list[TFIndex], opath: Path, complete: bool = False
+    ) -> int:
+        """Marks indexes as synced with the tree, dropping entries they no longer list.
+
+        Entries belong to the closest directory holding an index, those under a
+        synced index but missing from its table were removed by a patch. With
+        complete the indexes are the whole installation, so entries and sources
+        of indexes that are gone are dropped too. Returns the entries dropped."""
+        listed = set()
+        directories = set()
+        for index in indexes:
+            await self.record_source(index, opath)
+            for archive in index.archives:
+                await self.record_source(archive, opath)
+            directory = index.relative_directory(opath)
+            directories.add(directory)
+            prefix = f"{directory}/" if directory else ""
+            table = await index.files_list
+            listed.update(prefix + table.name(row) for row in range(len(table)))
+        known = directories | {
+            posixpath.dirname(key)
+            for key in self.sources
+            if posixpath.basename(key) == "index.tfi"
+        }
+        stale = []
+        for key in self.files:
+            if key in listed:
+                continue
+            if complete or self._owner(key, known) in directories:
+                stale.append(key)
+        for key in stale:
+            del self.files[key]
+        if complete:
+            for key in [k for k in self.sources if not opath.joinpath(k).exists()]:
+                del self.sources[key]
+        return len(stale)
+
+    @staticmethod
+    def _owner(key: str, directories: set[str]) -> Optional[str]:
+        parent = posixpath.dirname(key)
+        while parent not in directories:
+            if not parent:
+                return None
+            parent = posixpath.dirname(parent)
+        return parent
+
+    async def source_changed(self, source: TFIndex | TFArchive, opath: Path) -> bool:
+        """Whether an index or archive differs from when the tree was synced with it.
+
+        Size and mtime decide most cases, the compressed bytes are only hashed
+        when the file was touched but kept its size."""
+        entry = self.sources.get(source.path.relative_to(opath).as_posix())
+        if entry is None:
+            return True
+        stat = source.path.stat()
+        if stat.st_size != entry[0]:
+            return True
+        if stat.st_mtime_ns == entry[1]:
+            return False
+        if await source.content_hash != entry[2]:
+            return True
+        entry[1] = stat.st_mtime_ns
+        return False
+
+    @classmethod
+    def bookkeeping(cls, key: str) -> bool:
+        """Whether a path of the tree is one of our own files rather than a game file."""
+        if "/" in key:
+            return False
+        return key in {
+            cls.file_name,
+            f"{cls.file_name}.tmp",
+            cls.journal_name,
+            cls.search_name,
+            f"{cls.search_name}-journal",
+            cls.legacy_name,
+        } or key.endswith(PackWriter.suffix)
+
+    def scan(self) -> dict[str, tuple[int, int]]:
+        """Sizes and mtimes of every game file currently in the extracted tree."""
+        disk = {}
+        directories = [(self.root, "")]
+        while directories:
+            directory, prefix = directories.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                name = f"{prefix}{entry.name}"
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append((entry.path, f"{name}/"))
+                elif not self.bookkeeping(name):
+                    stat = entry.stat(follow_symlinks=False)
+                    disk[name] = (stat.st_size, stat.st_mtime_ns)
+        return disk
+
+    def status(
+        self, file: TroveFile, opath: Path, disk: Optional[dict] = None
+    ) -> Optional[FileStatus]:
+        """Status of a file from metadata, None when only its content can tell.
+
+        Without `disk` the manifest is trusted to match the extracted tree."""
+        key = file.relative_path(opath)
+        entry = self.files.get(key)
+        if disk is not None:
+            on_disk = disk.get(key)
+            if on_disk is None:
+                return FileStatus.added
+            if entry is None or tuple(entry[2:]) != on_disk:
+                # Untracked or touched since we wrote it
+                return None
+        elif entry is None:
+            return FileStatus.added
+        if entry[0] == file.size and entry[1] == file.hash:
+            return FileStatus.unchanged
+        return FileStatus.changed
 
 
 async def find_all_indexes(
-    path: Path, hashes: dict, track_changes=True
+    path: Path,
+    manifest: Optional[ExtractionManifest] = None,
+    track_changes=True,
+    cache=None,
 ) -> Generator[TFIndex]:
     for item in path.iterdir():
         if item.is_file():
@@ -221,37 +1145,29 @@ async def find_all_indexes(
         if item.name not in [d.value for d in Directories]:
             continue
         for index_file in item.rglob("index.tfi"):
-            index = TFIndex(index_file)
-            if not track_changes:
+            index = TFIndex(index_file, cache)
+            if not track_changes or manifest is None:
                 yield index
                 continue
-            hash = hashes.get(str(index.path.relative_to(path)))
-            if hash is None or await index.content_hash != hash:
+            if await manifest.source_changed(index, path):
                 yield index
 
 
-async def find_all_archives(path: Path, hashes: dict) -> Generator[TFArchive]:
-    async for index in find_all_indexes(path, hashes):
-        for archive in index.archives:
-            opath = archive.path.relative_to(path)
-            hash = hashes.get(opath)
-            if hash is None or (await archive.content_hash) != hash:
-                yield archive
-
-
-async def find_all_files(path: Path, hashes: dict) -> Generator[TroveFile]:
-    async for archive in find_all_archives(path, hashes):
-        async for file in archive.files():
-            file.index = archive.index
-            yield file
+async def scan_indexes(indexes: list[TFIndex], workers: int = 0) -> Generator[TFIndex]:
+    """Loads the tables of many indexes on a thread pool, yielding each index as
+    soon as its table is ready rather than in the order given."""
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(workers or os.cpu_count() or 1)
 
+    async def load(index: TFIndex) -> TFIndex:
+        await loop.run_in_executor(pool, index.load)
+        return index
 
-async def find_changes(
-    archive_path: Path, extracted_path: Path, hashes: dict
-) -> Generator[TroveFile]:
-    async for file in find_all_files(archive_path, hashes):
-        if (await file.compare(archive_path, extracted_path)) in [
-            FileStatus.added,
-            FileStatus.changed,
-        ]:
-            yield file
+    tasks = [asyncio.create_task(load(index)) for index in indexes]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
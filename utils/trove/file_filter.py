@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import re
+import shlex
+from array import array
+from fnmatch import translate
+from pathlib import Path
+from typing import Optional
+
+from utils.trove.extractor import FileTable, TFArchive, TFIndex, TroveFile
+
+SIZE = re.compile(r"^(\d+(?:\.\d+)?)([kmg]?)i?b?$", re.IGNORECASE)
+UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_size(value: str) -> int:
+    """Bytes in a size like 512, 10k, 1.5M or 2GiB, units are powers of 1024."""
+    match = SIZE.match(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid size: {value}")
+    number, unit = match.groups()
+    return int(float(number) * UNITS[unit.lower()])
+
+
+def _globs(patterns: list[str]) -> Optional[re.Pattern]:
+    if not patterns:
+        return None
+    return re.compile("|".join(translate(p) for p in patterns), re.IGNORECASE)
+
+
+class FileFilter:
+    """Selects files by path and size straight from the index tables.
+
+    Include globs, exclude globs and the regex match the path relative to the
+    installation, a file must also have one of the extensions (if any) and fit
+    the size range. Nothing is inflated to evaluate it, so archives without any
+    match are never opened."""
+
+    def __init__(
+        self,
+        include: Optional[list[str]] = None,
+        exclude: Optional[list[str]] = None,
+        regex: Optional[str] = None,
+        extensions: Optional[list[str]] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ):
+        self.include = include or []
+        self.exclude = exclude or []
+        self.regex = regex
+        self.extensions = [e.lower().lstrip(".") for e in extensions or []]
+        self.min_size = min_size
+        self.max_size = max_size
+        self._include = _globs(self.include)
+        self._exclude = _globs(self.exclude)
+        self._regex = re.compile(regex, re.IGNORECASE) if regex else None
+        self._suffixes = tuple(f".{e}" for e in self.extensions)
+
+    def __bool__(self):
+        return bool(
+            self.include
+            or self.exclude
+            or self.regex
+            or self.extensions
+            or self.min_size is not None
+            or self.max_size is not None
+        )
+
+    @classmethod
+    def parse(cls, expression: str) -> FileFilter:
+        """Filter from a space separated expression, the way it's typed in the UI.
+
+        `*.blueprint` includes, `!languages/**` excludes, `ext:png,dds` limits
+        the extensions, `re:<regex>` matches a regex and `size:>1k`, `size:<2M`
+        or `size:1k-2M` bound the size."""
+        include, exclude, extensions = [], [], []
+        regex, min_size, max_size = None, None, None
+        for token in shlex.split(expression):
+            if token.startswith("!"):
+                exclude.append(token[1:])
+            elif token.startswith("ext:"):
+                extensions.extend(e for e in token[4:].split(",") if e)
+            elif token.startswith("re:"):
+                regex = token[3:]
+            elif token.startswith("size:"):
+                bounds = token[5:]
+                if bounds.startswith(">"):
+                    min_size = parse_size(bounds.lstrip(">="))
+                elif bounds.startswith("<"):
+                    max_size = parse_size(bounds.lstrip("<="))
+                elif "-" in bounds:
+                    low, high = bounds.split("-", 1)
+                    min_size, max_size = parse_size(low), parse_size(high)
+                else:
+                    min_size = max_size = parse_size(bounds)
+            else:
+                include.append(token)
+        if regex is not None:
+            try:
+                re.compile(regex)
+            except re.error as e:
+                raise ValueError(f"Invalid regex: {e}")
+        return cls(include, exclude, regex, extensions, min_size, max_size)
+
+    def matches_path(self, path: str) -> bool:
+        if self._suffixes and not path.lower().endswith(self._suffixes):
+            return False
+        if self._include is not None and not self._include.match(path):
+            return False
+        if self._exclude is not None and self._exclude.match(path):
+            return False
+        if self._regex is not None and not self._regex.search(path):
+            return False
+        return True
+
+    def matches_size(self, size: int) -> bool:
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        return True
+
+    def matches(self, file: TroveFile, opath: Path) -> bool:
+        return self.matches_size(file.size) and self.matches_path(
+            file.relative_path(opath)
+        )
+
+    def rows(self, table: FileTable, prefix: str = "") -> array:
+        """Rows of the table matching the filter, sizes are checked before names."""
+        rows = array("I")
+        sizes = table.sizes
+        check_size = self.min_size is not None or self.max_size is not None
+        for row in range(len(table)):
+            if check_size and not self.matches_size(sizes[row]):
+                continue
+            if self.matches_path(prefix + table.name(row)):
+                rows.append(row)
+        return rows
+
+    async def files(self, index: TFIndex, opath: Path) -> list[TroveFile]:
+        table = await index.files_list
+        directory = index.relative_directory(opath)
+        prefix = f"{directory}/" if directory else ""
+        return [TroveFile(index, row) for row in self.rows(table, prefix)]
+
+    async def jobs(
+        self, indexes: list[TFIndex], opath: Path
+    ) -> list[tuple[TFArchive, list[TroveFile]]]:
+        """Extraction jobs for the matching files, only archives holding some."""
+        jobs = {}
+        for index in indexes:
+            for file in await self.files(index, opath):
+                jobs.setdefault(file.archive.path, (file.archive, []))[1].append(file)
+        return list(jobs.values())
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import os
+import shutil
+from enum import Enum
+from pathlib import Path
+from threading import Lock
+
+
+class FsyncPolicy(Enum):
+    never = "never"
+    file = "file"
+    end = "end"
+
+
+def write_all(fd: int, data) -> int:
+    """Writes a whole buffer, os.write may stop short on large or interrupted writes."""
+    with memoryview(data) as view, view.cast("B") as view:
+        written = 0
+        while written < len(view):
+            written += os.write(fd, view[written:])
+    return written
+
+
+class FileWriter:
+    """Copies extracted files in kernel space and syncs them under an fsync policy.
+
+    Directories already created are remembered for the writer's lifetime (one
+    extraction), copies go through the kernel when the platform allows it and
+    durability follows the fsync policy: never, after every file, or once at
+    the end."""
+
+    def __init__(self, fsync: FsyncPolicy | str = FsyncPolicy.never):
+        self.fsync = FsyncPolicy(fsync)
+        self._directories: set[Path] = set()
+        self._written: list[Path] = []
+        self._lock = Lock()
+
+    def ensure_directory(self, path: Path):
+        if path not in self._directories:
+            path.mkdir(parents=True, exist_ok=True)
+            self._directories.add(path)
+
+    def copy(self, source: Path, target: Path):
+        """Copies a file in kernel space when possible, replacing the target."""
+        self.ensure_directory(target.parent)
+        target.unlink(missing_ok=True)
+        if hasattr(os, "copy_file_range"):
+            try:
+                with open(source, "rb") as src, open(target, "wb") as dst:
+                    size = os.fstat(src.fileno()).st_size
+                    copied = 0
+                    while copied < size:
+                        count = os.copy_file_range(
+                            src.fileno(), dst.fileno(), size - copied
+                        )
+                        if not count:
+                            break
+                        copied += count
+                    if copied == size:
+                        self._synced(dst.fileno(), target)
+                        return
+            except OSError:
+                # Cross device on older kernels or an unsupported filesystem
+                pass
+        # sendfile on Linux, fcopyfile on macOS, a buffered copy elsewhere
+        shutil.copyfile(source, target)
+        if self.fsync != FsyncPolicy.never:
+            self.sync(target)
+
+    def sync(self, path: Path):
+        """Applies the fsync policy to a file written by other means."""
+        if self.fsync == FsyncPolicy.file:
+            fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        elif self.fsync == FsyncPolicy.end:
+            with self._lock:
+                self._written.append(path)
+
+    def _synced(self, fd: int, path: Path):
+        if self.fsync == FsyncPolicy.file:
+            os.fsync(fd)
+        elif self.fsync == FsyncPolicy.end:
+            with self._lock:
+                self._written.append(path)
+
+    def finish(self):
+        """Flushes everything written under the end policy."""
+        with self._lock:
+            written, self._written = self._written, []
+        if not written:
+            return
+        if hasattr(os, "sync"):
+            os.sync()
+            return
+        for path in written:
+            try:
+                fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+            except OSError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from utils.trove.diff import Catalog, CatalogDiff
+from utils.trove.extractor import FileStatus, TFIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    installation TEXT,
+    created TEXT,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    installation TEXT,
+    directory TEXT,
+    size INTEGER,
+    mtime INTEGER,
+    PRIMARY KEY (installation, directory)
+);
+CREATE TABLE IF NOT EXISTS files (
+    installation TEXT,
+    path TEXT,
+    directory TEXT,
+    size INTEGER,
+    hash INTEGER,
+    first_seen INTEGER,
+    last_changed INTEGER,
+    removed INTEGER,
+    PRIMARY KEY (installation, path)
+);
+CREATE INDEX IF NOT EXISTS files_directory ON files (installation, directory);
+CREATE TABLE IF NOT EXISTS changes (
+    version INTEGER,
+    installation TEXT,
+    path TEXT,
+    directory TEXT,
+    status TEXT,
+    size INTEGER,
+    hash INTEGER
+);
+CREATE INDEX IF NOT EXISTS changes_path ON changes (installation, path);
+CREATE INDEX IF NOT EXISTS changes_directory ON changes (installation, directory);
+"""
+
+
+class FileHistory:
+    """Sqlite record of every game file across the versions an installation went through.
+
+    Each file keeps the version it was first seen in, last changed in and was
+    removed in, every change is logged with its size and hash. Updates only
+    diff the indexes whose file changed since the last one and only write
+    that delta, as a new version."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self._lock = Lock()
+
+    @staticmethod
+    def installation(root: Path) -> str:
+        return str(root.absolute())
+
+    def update(
+        self, root: Path, indexes: list[TFIndex], label: Optional[str] = None
+    ) -> Optional[int]:
+        """Records what changed since the last update, returns the new version if any.
+
+        Blocking, index tables are loaded with TFIndex.load."""
+        installation = self.installation(root)
+        with self._lock:
+            known = {
+                row["directory"]: (row["size"], row["mtime"])
+                for row in self.connection.execute(
+                    "SELECT directory, size, mtime FROM sources WHERE installation = ?",
+                    (installation,),
+                )
+            }
+        sources = {}
+        diffs = []
+        for index in indexes:
+            directory = index.relative_directory(root)
+            stat = index.path.stat()
+            sources[directory] = (stat.st_size, stat.st_mtime_ns)
+            if known.get(directory) == sources[directory]:
+                continue
+            old = self._catalog(installation, directory)
+            new = Catalog(str(index.path))
+            table = index.load()
+            prefix = f"{directory}/" if directory else ""
+            for row, (size, hash) in enumerate(zip(table.sizes, table.hashes)):
+                new[prefix + table.name(row)] = (size, hash)
+            diffs.append((directory, CatalogDiff.compare(old, new)))
+        for directory in known.keys() - sources.keys():
+            # The whole index is gone
+            old = self._catalog(installation, directory)
+            diffs.append((directory, CatalogDiff.compare(old, Catalog(directory))))
+        with self._lock, self.connection:
+            version = None
+            if any(diff.entries for _, diff in diffs):
+                version = self.connection.execute(
+                    "INSERT INTO versions (installation, created, label) VALUES (?, ?, ?)",
+                    (installation, datetime.now().isoformat(), label),
+                ).lastrowid
+                for directory, diff in diffs:
+                    self._apply(installation, directory, version, diff)
+            self.connection.execute(
+                "DELETE FROM sources WHERE installation = ?", (installation,)
+            )
+            self.connection.executemany(
+                "INSERT INTO sources VALUES (?, ?, ?, ?)",
+                [(installation, d, *stat) for d, stat in sources.items()],
+            )
+        return version
+
+    def _catalog(self, installation: str, directory: str) -> Catalog:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT path, size, hash FROM files "
+                "WHERE installation = ? AND directory = ? AND removed IS NULL",
+                (installation, directory),
+            ).fetchall()
+        return Catalog(directory, {r["path"]: (r["size"], r["hash"]) for r in rows})
+
+    def _apply(self, installation: str, directory: str, version: int, diff):
+        changes = []
+        current = []
+        removed = []
+        for entry in diff.entries:
+            if entry.status == FileStatus.removed:
+                changes.append(
+                    (
+                        version,
+                        installation,
+                        entry.path,
+                        directory,
+                        entry.status.name,
+                        entry.old_size,
+                        entry.old_hash,
+                    )
+                )
+                removed.append((version, installation, entry.path))
+                continue
+            changes.append(
+                (
+                    version,
+                    installation,
+                    entry.path,
+                    directory,
+                    entry.status.name,
+                    entry.size,
+                    entry.hash,
+                )
+            )
+            current.append(
+                (
+                    installation,
+                    entry.path,
+                    directory,
+                    entry.size,
+                    entry.hash,
+                    version,
+                    version,
+                )
+            )
+        self.connection.executemany(
+            "INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?)", changes
+        )
+        # Files coming back after a removal keep the version they were first seen in
+        self.connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, NULL) "
+            "ON CONFLICT (installation, path) DO UPDATE SET "
+            "directory = excluded.directory, size = excluded.size, "
+            "hash = excluded.hash, last_changed = excluded.last_changed, "
+            "removed = NULL",
+            current,
+        )
+        self.connection.executemany(
+            "UPDATE files SET removed = ? WHERE installation = ? AND path = ?",
+            removed,
+        )
+
+    def versions(self, root: Path) -> list[dict]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT versions.*, COUNT(changes.path) AS changes FROM versions "
+                "LEFT JOIN changes ON changes.version = versions.id "
+                "WHERE versions.installation = ? GROUP BY versions.id "
+                "ORDER BY versions.id",
+                (self.installation(root),),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def file(self, root: Path, path: str) -> Optional[dict]:
+        """State of a file with the versions it was first seen, last changed and removed in."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT * FROM files WHERE installation = ? AND path = ?",
+                (self.installation(root), path),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def file_changes(self, root: Path, path: str) -> list[dict]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT changes.*, versions.created, versions.label FROM changes "
+                "JOIN versions ON versions.id = changes.version "
+                "WHERE changes.installation = ? AND changes.path = ? "
+                "ORDER BY changes.version",
+                (self.installation(root), path),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def directory(self, root: Path, directory: str) -> list[dict]:
+        """Every file ever seen in a directory of indexes, including subdirectories."""
+        directory = directory.strip("/")
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT * FROM files WHERE installation = ? "
+                "AND (directory = ? OR directory BETWEEN ? AND ?) ORDER BY path",
+                (
+                    self.installation(root),
+                    directory,
+                    f"{directory}/",
+                    f"{directory}/\uffff",
+                ),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+_histories: dict[Path, FileHistory] = {}
+
+
+def get_file_history(path: Path) -> Optional[FileHistory]:
+    if path not in _histories:
+        try:
+            _histories[path] = FileHistory(path)
+        except sqlite3.Error as e:
+            print(f"Failed to open file history at {path}: {e}")
+            return None
+    return _histories[path]
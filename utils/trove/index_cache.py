@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import sqlite3
+from array import array
+from hashlib import md5
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from utils.trove.extractor import FileTable
+
+# Bump whenever the FileTable layout changes so old caches get discarded
+CACHE_VERSION = 1
+FINGERPRINT_SIZE = 4096
+COLUMNS = ["name_offsets", "archive_indexes", "offsets", "sizes", "hashes"]
+
+
+def index_signature(path: Path) -> tuple[int, int, bytes]:
+    """Cheap identity of an index file: size, mtime and a hash of its header."""
+    stat = path.stat()
+    with open(path, "rb") as f:
+        fingerprint = md5(f.read(FINGERPRINT_SIZE)).digest()
+    return stat.st_size, stat.st_mtime_ns, fingerprint
+
+
+class IndexCache:
+    """Persistent store of parsed index.tfi file tables and search indexes.
+
+    Entries are keyed by the absolute path of the index, so multiple installations
+    share the same cache file, and are only served back while the index's size,
+    mtime and header fingerprint still match. The connection is shared by the
+    threads scanning indexes, a lock serializes its use."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = Lock()
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != (
+            CACHE_VERSION
+        ):
+            self.connection.execute("DROP TABLE IF EXISTS indexes")
+            self.connection.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS indexes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, fingerprint BLOB, "
+            "names BLOB, " + ", ".join(f"{c} BLOB" for c in COLUMNS) + ")"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS search_indexes ("
+            "key TEXT PRIMARY KEY, signature TEXT, data BLOB)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS search_segments ("
+            "key TEXT, segment INTEGER, signature TEXT, data BLOB, "
+            "PRIMARY KEY (key, segment))"
+        )
+        self.connection.commit()
+
+    def get(self, path: Path) -> Optional[FileTable]:
+        try:
+            size, mtime, fingerprint = index_signature(path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT size, mtime, fingerprint, names, "
+                + ", ".join(COLUMNS)
+                + " FROM indexes WHERE path = ?",
+                (str(path.absolute()),),
+            ).fetchone()
+        if row is None or tuple(row[:3]) != (size, mtime, fingerprint):
+            return None
+        columns = []
+        for data in row[4:]:
+            column = array("I")
+            column.frombytes(data)
+            columns.append(column)
+        return FileTable(row[3], *columns)
+
+    def put(self, path: Path, table: FileTable) -> None:
+        try:
+            size, mtime, fingerprint = index_signature(path)
+        except OSError:
+            return
+        with self._lock:
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO indexes VALUES (?, ?, ?, ?, ?{', ?' * len(COLUMNS)})",
+                (
+                    str(path.absolute()),
+                    size,
+                    mtime,
+                    fingerprint,
+                    table.names,
+                    *[getattr(table, c).tobytes() for c in COLUMNS],
+                ),
+            )
+            self.connection.commit()
+
+    def get_search_index(self, key: str, signature: str) -> Optional[bytes]:
+        """Serialized search index stored under key, if built from the same sources."""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT signature, data FROM search_indexes WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] != signature:
+            return None
+        return row[1]
+
+    def put_search_index(self, key: str, signature: str, data: bytes) -> None:
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO search_indexes VALUES (?, ?, ?)",
+                (key, signature, data),
+            )
+            self.connection.commit()
+
+    def get_search_segments(self, key: str, signature: str) -> Optional[list[bytes]]:
+        """Segments of a search index stored under key in the order they were added."""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT signature, data FROM search_segments WHERE key = ? "
+                "ORDER BY segment",
+                (key,),
+            ).fetchall()
+        if not rows or any(row[0] != signature for row in rows):
+            return None
+        return [row[1] for row in rows]
+
+    def put_search_segment(
+        self, key: str, signature: str, data: bytes, replace: bool = False
+    ) -> None:
+        """Appends a segment to a search index, or replaces all of its segments."""
+        with self._lock:
+            if replace:
+                self.connection.execute(
+                    "DELETE FROM search_segments WHERE key = ?", (key,)
+                )
+                self.connection.execute(
+                    "DELETE FROM search_indexes WHERE key = ?", (key,)
+                )
+            self.connection.execute(
+                "INSERT INTO search_segments VALUES (?, "
+                "(SELECT COALESCE(MAX(segment) + 1, 0) FROM search_segments "
+                "WHERE key = ?), ?, ?)",
+                (key, key, signature, data),
+            )
+            self.connection.commit()
+
+    def prune(self) -> int:
+        """Drops entries of indexes that no longer exist on disk."""
+        with self._lock:
+            paths = self.connection.execute("SELECT path FROM indexes").fetchall()
+            missing = [(path,) for (path,) in paths if not Path(path).exists()]
+            if missing:
+                self.connection.executemany(
+                    "DELETE FROM indexes WHERE path = ?", missing
+                )
+                self.connection.commit()
+        return len(missing)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+_caches: dict[Path, IndexCache] = {}
+
+
+def get_index_cache(path: Path) -> Optional[IndexCache]:
+    if path not in _caches:
+        try:
+            _caches[path] = IndexCache(path)
+        except sqlite3.Error as e:
+            print(f"Failed to open index cache at {path}: {e}")
+            return None
+    return _caches[path]
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024
+
+
+class MemoryCache:
+    """Least recently used cache bounded by the byte size of what it holds.
+
+    Shared by every archive and index so the memory used for decompressed
+    buffers and parsed tables stays under one budget however big the install."""
+
+    def __init__(self, budget: int = DEFAULT_CACHE_BUDGET):
+        self._budget = budget
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        return key in self._entries
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @budget.setter
+    def budget(self, value: int):
+        with self._lock:
+            self._budget = value
+            self._evict()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value, size: int):
+        """Stores value, evicting the least recently used entries to fit it.
+
+        Values bigger than the whole budget are returned without being kept."""
+        with self._lock:
+            self._discard(key)
+            if size > self._budget:
+                return value
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+        return value
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._discard(key)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+        return entry
+
+    def _evict(self):
+        while self.size > self._budget and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "entries": len(self),
+            "size": self.size,
+            "budget": self.budget,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+memory_cache = MemoryCache()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from models.trove.directory import Directories
+from utils.jobs import Job, scheduler
+from utils.trove.diff import find_changes
+from utils.trove.extractor import (
+    ExtractionManifest,
+    TFIndex,
+    TroveFile,
+    find_all_indexes,
+    scan_indexes,
+)
+from utils.trove.index_cache import get_index_cache
+
+GAME_FILES = (".tfi", ".tfa")
+# Reads raise opened and closed_no_write events, comparing must not wake the watcher
+WRITE_EVENTS = {"created", "modified", "moved", "deleted", "closed"}
+
+
+def index_sources(
+    indexes: list[TFIndex], output: Path
+) -> dict[Path, Optional[tuple[int, int]]]:
+    """Sizes and mtimes of the indexes and the manifest a comparison was made with."""
+    sources = {}
+    for path in [index.path for index in indexes] + [
+        output.joinpath(ExtractionManifest.file_name)
+    ]:
+        try:
+            stat = path.stat()
+        except OSError:
+            sources[path] = None
+        else:
+            sources[path] = (stat.st_size, stat.st_mtime_ns)
+    return sources
+
+
+@dataclass
+class PreparedChanges:
+    """Changed files found in the background, valid until a source moves."""
+
+    root: Path
+    output: Path
+    trust_manifest: bool
+    indexes: list[TFIndex]
+    files: list[TroveFile]
+    sources: dict = field(default_factory=dict)
+
+    def valid(
+        self, root: Path, output: Path, trust_manifest: bool, indexes: list[TFIndex]
+    ) -> bool:
+        if (root, output, trust_manifest) != (
+            self.root,
+            self.output,
+            self.trust_manifest,
+        ):
+            return False
+        return index_sources(indexes, output) == self.sources
+
+
+class IndexEventHandler(FileSystemEventHandler):
+    """Forwards any write to an index or archive to the watcher's loop."""
+
+    def __init__(self, watcher: PatchWatcher, root: Path):
+        self.watcher = watcher
+        self.root = root
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in WRITE_EVENTS:
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        outputs = self.watcher.outputs()
+        if any(
+            str(path).endswith(GAME_FILES)
+            and not any(Path(path).is_relative_to(output) for output in outputs)
+            for path in paths
+            if path
+        ):
+            self.watcher.loop.call_soon_threadsafe(self.watcher.touch, self.root)
+
+
+class PatchWatcher:
+    """Compares the installation with its extracted tree on its own after a patch.
+
+    The launcher rewrites hundreds of indexes and archives during an update,
+    each write pushes the comparison back by `settle` seconds so it runs once
+    the files stop moving. It runs as a low priority job and its result is kept
+    for the extractor's next refresh, as long as no index or the manifest moved
+    since."""
+
+    def __init__(
+        self,
+        page,
+        settle: float = 30,
+        on_ready: Optional[Callable[[PreparedChanges], Awaitable]] = None,
+    ):
+        self.page = page
+        self.settle = settle
+        self.on_ready = on_ready
+        self.loop = asyncio.get_running_loop()
+        self.observer = Observer()
+        self.watched: set[Path] = set()
+        self.timers: dict[Path, asyncio.TimerHandle] = {}
+        self.prepared: Optional[PreparedChanges] = None
+        self.job: Optional[Job] = None
+        self.job_root: Optional[Path] = None
+
+    def watch(self, root: Path):
+        """Watches the game directories of an installation, where indexes live.
+
+        Extracted trees usually sit in the installation too, they aren't watched."""
+        if root in self.watched or not root.is_dir():
+            return
+        self.watched.add(root)
+        handler = IndexEventHandler(self, root)
+        for directory in Directories:
+            path = root.joinpath(directory.value)
+            if path.is_dir():
+                self.observer.schedule(handler, path, recursive=True)
+
+    def outputs(self) -> list[Path]:
+        """Extraction outputs, ignored should one be inside a game directory."""
+        directories = self.page.preferences.directories
+        return [
+            path
+            for path in [
+                directories.extract_to,
+                directories.changes_from,
+                directories.changes_to,
+            ]
+            if path is not None
+        ]
+
+    def compared_with(self) -> Optional[Path]:
+        """The extracted tree patches are compared with, None until one was extracted.
+
+        Without a manifest every file of the installation would show as changed."""
+        output = self.page.preferences.directories.changes_from
+        if output is None or not output.joinpath(ExtractionManifest.file_name).exists():
+            return None
+        return output
+
+    def start(self):
+        self.observer.daemon = True
+        self.observer.start()
+
+    def stop(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        if self.job is not None:
+            self.job.cancel()
+        self.observer.stop()
+
+    def touch(self, root: Path):
+        """Restarts the settle delay of an installation, called on every write."""
+        self.prepared = None
+        if self.job is not None and self.job_root == root:
+            # Whatever it found is already stale
+            self.job.cancel()
+        timer = self.timers.pop(root, None)
+        if timer is not None:
+            timer.cancel()
+        self.timers[root] = self.loop.call_later(self.settle, self.settled, root)
+
+    def settled(self, root: Path):
+        self.timers.pop(root, None)
+        if root != self.page.preferences.directories.extract_from:
+            return
+        if self.compared_with() is None:
+            return
+        self.job = scheduler.submit(
+            Job("Compare patched files", self.prepare, root, priority=-1, kind="patch")
+        )
+        self.job_root = root
+
+    async def prepare(self, job: Job, root: Path) -> Optional[PreparedChanges]:
+        preferences = self.page.preferences
+        # Settings may have changed while the job waited for its turn
+        output = self.compared_with()
+        if output is None:
+            return None
+        cache = get_index_cache(self.page.RTT.app_data.joinpath("index_cache.sqlite"))
+        found = [index async for index in find_all_indexes(root, None, False, cache)]
+        indexes = [
+            index
+            async for index in scan_indexes(
+                found, preferences.extraction_inflate_workers
+            )
+        ]
+        await job.checkpoint()
+        manifest = ExtractionManifest.load(output)
+        # Taken before comparing, a patch landing meanwhile invalidates the result
+        sources = index_sources(indexes, output)
+        files = await find_changes(
+            indexes,
+            root,
+            manifest,
+            preferences.performance_mode,
+            preferences.extraction_inflate_workers,
+            job,
+        )
+        self.prepared = PreparedChanges(
+            root, output, preferences.performance_mode, indexes, files, sources
+        )
+        if self.on_ready is not None:
+            await self.on_ready(self.prepared)
+        return self.prepared
+
+    def take(
+        self, root: Path, output: Path, trust_manifest: bool, indexes: list[TFIndex]
+    ) -> Optional[PreparedChanges]:
+        """The prepared changes if they still hold, each result is only used once."""
+        prepared, self.prepared = self.prepared, None
+        if prepared is None or not prepared.valid(
+            root, output, trust_manifest, indexes
+        ):
+            return None
+        return prepared
@@ -0,0 +1,670 @@
+from __future__ import annotations
+
+import json
+import re
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Iterable, Optional
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+from utils.trove.extractor import (
+    ExtractionManifest,
+    TFIndex,
+    TroveFile,
+    find_all_indexes,
+)
+
+SECTIONS = struct.Struct("<5Q")
+SEGMENT = struct.Struct("<7Q")
+WILDCARDS = re.compile(r"[*?\[\]]")
+# Files git would also call binary, or never worth searching
+BINARY_EXTENSIONS = {
+    ".blueprint",
+    ".dds",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".wav",
+    ".ogg",
+    ".mp3",
+    ".bank",
+    ".ttf",
+    ".otf",
+}
+BINARY_SNIFF = 8000
+MAX_CONTENT_SIZE = 16 * 1024 * 1024
+# File flags of the content index
+DEAD, BINARY, TEXT = 0, 1, 2
+
+
+class TrigramIndex:
+    """Maps every 3 character sequence to the sorted ids of the texts holding it.
+
+    Queries only need to intersect a few posting lists and confirm the handful
+    of candidates left, instead of scanning every text."""
+
+    def __init__(self, postings: Optional[dict[str, array]] = None):
+        self.postings = postings if postings is not None else {}
+
+    @staticmethod
+    def trigrams(text: str) -> set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> TrigramIndex:
+        """Indexes texts by their position, texts are matched case insensitively."""
+        postings = {}
+        for i, text in enumerate(texts):
+            for trigram in cls.trigrams(text.lower()):
+                postings.setdefault(trigram, []).append(i)
+        return cls({t: array("I", ids) for t, ids in postings.items()})
+
+    def candidates(self, literals: Iterable[str]) -> Optional[set[int]]:
+        """Ids that may contain all literals, None when they're too short to narrow."""
+        trigrams = set()
+        for literal in literals:
+            trigrams |= self.trigrams(literal.lower())
+        if not trigrams:
+            return None
+        lists = sorted((self.postings.get(t, array("I")) for t in trigrams), key=len)
+        result = set(lists[0])
+        for ids in lists[1:]:
+            if not result:
+                break
+            result.intersection_update(ids)
+        return result
+
+    def dumps(self) -> bytes:
+        keys = [t.encode() for t in self.postings]
+        lengths = array("I", [len(k) for k in keys])
+        counts = array("I", [len(ids) for ids in self.postings.values()])
+        ids = array("I")
+        for posting in self.postings.values():
+            ids.extend(posting)
+        return (
+            struct.pack("<Q", len(keys))
+            + lengths.tobytes()
+            + counts.tobytes()
+            + b"".join(keys)
+            + ids.tobytes()
+        )
+
+    @classmethod
+    def loads(cls, data: bytes) -> TrigramIndex:
+        view = memoryview(data)
+        (count,) = struct.unpack_from("<Q", view)
+        position = 8
+        lengths = array("I")
+        lengths.frombytes(view[position : position + count * 4])
+        position += count * 4
+        counts = array("I")
+        counts.frombytes(view[position : position + count * 4])
+        position += count * 4
+        keys = []
+        for length in lengths:
+            keys.append(bytes(view[position : position + length]).decode())
+            position += length
+        ids = array("I")
+        ids.frombytes(view[position:])
+        postings = {}
+        position = 0
+        for key, size in zip(keys, counts):
+            postings[key] = ids[position : position + size]
+            position += size
+        return cls(postings)
+
+
+class FileNameIndex:
+    """Searchable list of every file of an installation, built from index tables.
+
+    Nothing is inflated to build or query it, entries point back to their index
+    and row so the archive is only touched when a file is actually extracted."""
+
+    cache_key = "names:{}"
+
+    def __init__(
+        self,
+        root: Path,
+        index_paths: list[str],
+        paths: list[str],
+        index_ids: array,
+        rows: array,
+        trigrams: TrigramIndex,
+        signature: str = "",
+    ):
+        self.root = root
+        self.index_paths = index_paths
+        self.paths = paths
+        self.index_ids = index_ids
+        self.rows = rows
+        self.trigrams = trigrams
+        self.signature = signature
+        self._indexes: dict[int, TFIndex] = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    @staticmethod
+    def installation_signature(root: Path, indexes: list[TFIndex]) -> str:
+        entries = []
+        for index in indexes:
+            stat = index.path.stat()
+            entries.append(
+                [
+                    index.path.relative_to(root).as_posix(),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                ]
+            )
+        return json.dumps(sorted(entries))
+
+    @classmethod
+    async def build(cls, root: Path, cache=None) -> FileNameIndex:
+        indexes = [index async for index in find_all_indexes(root, None, False, cache)]
+        index_paths = []
+        paths = []
+        index_ids = array("I")
+        rows = array("I")
+        for index_id, index in enumerate(indexes):
+            table = await index.files_list
+            directory = index.relative_directory(root)
+            prefix = f"{directory}/" if directory else ""
+            index_paths.append(index.path.relative_to(root).as_posix())
+            paths.extend(prefix + table.name(row) for row in range(len(table)))
+            index_ids.extend([index_id] * len(table))
+            rows.extend(range(len(table)))
+        name_index = cls(
+            root,
+            index_paths,
+            paths,
+            index_ids,
+            rows,
+            TrigramIndex.build(paths),
+            cls.installation_signature(root, indexes),
+        )
+        name_index._indexes = dict(enumerate(indexes))
+        return name_index
+
+    @classmethod
+    async def load(cls, root: Path, cache=None) -> FileNameIndex:
+        """Index from the cache while the installation's indexes are unchanged."""
+        if cache is not None:
+            indexes = [
+                index async for index in find_all_indexes(root, None, False, cache)
+            ]
+            signature = cls.installation_signature(root, indexes)
+            key = cls.cache_key.format(root.absolute())
+            data = cache.get_search_index(key, signature)
+            if data is not None:
+                name_index = cls.loads(root, data, signature)
+                by_path = {i.path.relative_to(root).as_posix(): i for i in indexes}
+                name_index._indexes = {
+                    i: by_path[path] for i, path in enumerate(name_index.index_paths)
+                }
+                return name_index
+        name_index = await cls.build(root, cache)
+        if cache is not None:
+            cache.put_search_index(key, name_index.signature, name_index.dumps())
+        return name_index
+
+    async def changed(self, cache=None) -> bool:
+        """Whether the installation's indexes changed since this index was built."""
+        indexes = [
+            index async for index in find_all_indexes(self.root, None, False, cache)
+        ]
+        return self.installation_signature(self.root, indexes) != self.signature
+
+    def dumps(self) -> bytes:
+        index_paths = "\n".join(self.index_paths).encode()
+        paths = "\n".join(self.paths).encode()
+        trigrams = self.trigrams.dumps()
+        sections = [
+            index_paths,
+            paths,
+            self.index_ids.tobytes(),
+            self.rows.tobytes(),
+            trigrams,
+        ]
+        return SECTIONS.pack(*map(len, sections)) + b"".join(sections)
+
+    @classmethod
+    def loads(cls, root: Path, data: bytes, signature: str = "") -> FileNameIndex:
+        view = memoryview(data)
+        sections = []
+        position = SECTIONS.size
+        for size in SECTIONS.unpack_from(view):
+            sections.append(view[position : position + size])
+            position += size
+        index_paths, paths, index_ids, rows, trigrams = sections
+        index_ids_column = array("I")
+        index_ids_column.frombytes(index_ids)
+        rows_column = array("I")
+        rows_column.frombytes(rows)
+        return cls(
+            root,
+            bytes(index_paths).decode().split("\n") if index_paths else [],
+            bytes(paths).decode().split("\n") if paths else [],
+            index_ids_column,
+            rows_column,
+            TrigramIndex.loads(bytes(trigrams)),
+            signature,
+        )
+
+    def search(self, query: str, limit: Optional[int] = None) -> list[int]:
+        """Ids of entries matching a glob over their path or a substring of their name."""
+        query = query.lower()
+        if WILDCARDS.search(query):
+            literals = [part for part in WILDCARDS.split(query) if part]
+
+            def matches(path: str) -> bool:
+                return fnmatch(path, query)
+
+        else:
+            literals = [query]
+
+            def matches(path: str) -> bool:
+                return query in path.rsplit("/", 1)[-1]
+
+        candidates = self.trigrams.candidates(literals)
+        ids = sorted(candidates) if candidates is not None else range(len(self))
+        results = []
+        for i in ids:
+            if matches(self.paths[i].lower()):
+                results.append(i)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def index(self, index_id: int) -> TFIndex:
+        if index_id not in self._indexes:
+            path = self.root.joinpath(self.index_paths[index_id])
+            self._indexes[index_id] = TFIndex(path)
+        return self._indexes[index_id]
+
+    async def file(self, entry: int) -> TroveFile:
+        index = self.index(self.index_ids[entry])
+        table = await index.files_list
+        return table[self.rows[entry]]
+
+    async def files(self, query: str, limit: Optional[int] = None) -> list[TroveFile]:
+        return [await self.file(entry) for entry in self.search(query, limit)]
+
+
+def regex_literals(pattern: str) -> list[str]:
+    """Plain runs of characters every match of a regex must contain.
+
+    Only the top level sequence is looked at, a top level alternation yields
+    nothing. Runs stop at anything other than ASCII so they can be lowercased
+    the same way the content index was."""
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        raise ValueError(f"Invalid regex: {e}")
+    literals = []
+    run = ""
+    for op, value in parsed:
+        if op == sre_parse.LITERAL and value < 0x80:
+            run += chr(value)
+            continue
+        if run:
+            literals.append(run)
+        run = ""
+    if run:
+        literals.append(run)
+    return literals
+
+
+@dataclass
+class SearchHit:
+    path: str
+    line: int
+    text: str
+
+    def as_dict(self) -> dict:
+        return {"path": self.path, "line": self.line, "text": self.text}
+
+
+@dataclass
+class ContentIndexStats:
+    files: int = 0
+    text_files: int = 0
+    indexed: int = 0
+    removed: int = 0
+    trigrams: int = 0
+    size: int = 0
+    elapsed: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "text_files": self.text_files,
+            "indexed": self.indexed,
+            "removed": self.removed,
+            "trigrams": self.trigrams,
+            "size": self.size,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+class ContentIndex:
+    """Trigram index over the contents of the text files of an extracted tree.
+
+    Files are tracked by the size and hash the extraction manifest recorded, an
+    update only reads the ones added or changed since. Replaced files leave
+    their id behind, skipped by queries until enough pile up to compact them.
+    Text is indexed byte for byte, lowercased as latin-1 so any encoding works,
+    and queries only read the files holding all their trigrams.
+
+    It's stored as segments, each holding the files added since the previous
+    one with their postings and the ids that died meanwhile, so saving an
+    update only writes what it indexed. Loading appends them in order, past
+    `max_segments` the next save writes the whole index as one again."""
+
+    cache_key = "content:{}"
+    # Bump whenever the layout changes so old indexes get rebuilt
+    signature = "2"
+    max_segments = 8
+
+    def __init__(
+        self,
+        root: Path,
+        paths: Optional[list[str]] = None,
+        sizes: Optional[array] = None,
+        hashes: Optional[array] = None,
+        flags: Optional[array] = None,
+        trigrams: Optional[TrigramIndex] = None,
+    ):
+        self.root = root
+        self.paths = paths if paths is not None else []
+        self.sizes = sizes if sizes is not None else array("Q")
+        self.hashes = hashes if hashes is not None else array("I")
+        self.flags = flags if flags is not None else array("B")
+        self.trigrams = trigrams if trigrams is not None else TrigramIndex()
+        self.ids = {
+            path: i for i, path in enumerate(self.paths) if self.flags[i] != DEAD
+        }
+        # Ids and segments in the cache and ids removed since, once loaded or saved
+        self.saved = 0
+        self.segments = 0
+        self.removed = array("I")
+        self.stored_size = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, root: Path, cache=None) -> ContentIndex:
+        if cache is not None:
+            segments = cache.get_search_segments(
+                cls.cache_key.format(root.absolute()), cls.signature
+            )
+            if segments is not None:
+                try:
+                    content_index = cls.loads(
+                        root, [zlib.decompress(data) for data in segments]
+                    )
+                except (zlib.error, ValueError, struct.error) as e:
+                    print(f"Rebuilding the content index of {root}: {e}")
+                    return cls(root)
+                content_index.saved = len(content_index.paths)
+                content_index.segments = len(segments)
+                content_index.stored_size = sum(map(len, segments))
+                return content_index
+        return cls(root)
+
+    @classmethod
+    def refresh(
+        cls,
+        root: Path,
+        cache=None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> tuple[ContentIndex, ContentIndexStats]:
+        """Loads the index of a tree and catches it up with its manifest.
+
+        Saved back only when a file changed. Blocking, meant to run on a thread."""
+        start = perf_counter()
+        content_index = cls.load(root, cache)
+        stats = content_index.update(ExtractionManifest.load(root), progress)
+        if cache is not None and (stats.indexed or stats.removed):
+            content_index.save(cache)
+        stats.size = content_index.stored_size
+        stats.elapsed = perf_counter() - start
+        return content_index, stats
+
+    def save(self, cache) -> int:
+        """Stores what changed since the last save, returns the index's size in bytes."""
+        full = not self.saved or self.segments >= self.max_segments
+        # Posting lists of close ids compress well even at the fastest level
+        data = zlib.compress(self.dumps(0 if full else self.saved), 1)
+        cache.put_search_segment(
+            self.cache_key.format(self.root.absolute()), self.signature, data, full
+        )
+        self.stored_size = len(data) + (0 if full else self.stored_size)
+        self.segments = 1 if full else self.segments + 1
+        self.saved = len(self.paths)
+        self.removed = array("I")
+        return self.stored_size
+
+    def dumps(self, start: int = 0) -> bytes:
+        """A segment of the ids from `start` on, and the older ids removed since."""
+        postings = {}
+        for trigram, posting in self.trigrams.postings.items():
+            at = bisect_left(posting, start) if start else 0
+            if at < len(posting):
+                postings[trigram] = posting[at:] if at else posting
+        sections = [
+            "\n".join(self.paths[start:]).encode(),
+            self.sizes[start:].tobytes(),
+            self.hashes[start:].tobytes(),
+            self.flags[start:].tobytes(),
+            (self.removed if start else array("I")).tobytes(),
+            TrigramIndex(postings).dumps(),
+        ]
+        return SEGMENT.pack(start, *map(len, sections)) + b"".join(sections)
+
+    @classmethod
+    def loads(cls, root: Path, segments: list[bytes]) -> ContentIndex:
+        paths = []
+        columns = [array("Q"), array("I"), array("B")]
+        postings = {}
+        for data in segments:
+            view = memoryview(data)
+            start, *lengths = SEGMENT.unpack_from(view)
+            if start != len(paths):
+                raise ValueError("Content index segments out of order")
+            sections = []
+            position = SEGMENT.size
+            for size in lengths:
+                sections.append(view[position : position + size])
+                position += size
+            names, sizes, hashes, flags, removed, trigrams = sections
+            for column, section in zip(columns, [sizes, hashes, flags]):
+                column.frombytes(section)
+            if len(columns[0]) > len(paths):
+                paths.extend(bytes(names).decode().split("\n"))
+            dead = array("I")
+            dead.frombytes(removed)
+            for i in dead:
+                paths[i] = ""
+                columns[2][i] = DEAD
+            # Ids only grow from one segment to the next, lists stay sorted
+            for trigram, ids in TrigramIndex.loads(bytes(trigrams)).postings.items():
+                posting = postings.get(trigram)
+                if posting is None:
+                    postings[trigram] = ids
+                else:
+                    posting.extend(ids)
+        if len(paths) != len(columns[0]):
+            raise ValueError("Content index segments don't match")
+        return cls(root, paths, *columns, TrigramIndex(postings))
+
+    @staticmethod
+    def normalize(data: bytes) -> str:
+        return data.decode("latin-1").lower()
+
+    def _remove(self, path: str):
+        i = self.ids.pop(path)
+        self.paths[i] = ""
+        self.flags[i] = DEAD
+        self.removed.append(i)
+
+    def _add(self, path: str, size: int, hash: int) -> int:
+        i = len(self.paths)
+        self.paths.append(path)
+        self.sizes.append(size)
+        self.hashes.append(hash)
+        self.ids[path] = i
+        data = None
+        if Path(path).suffix.lower() not in BINARY_EXTENSIONS:
+            if size <= MAX_CONTENT_SIZE:
+                try:
+                    data = self.root.joinpath(path).read_bytes()
+                except OSError:
+                    pass
+        if data is None or b"\0" in data[:BINARY_SNIFF]:
+            self.flags.append(BINARY)
+            return i
+        self.flags.append(TEXT)
+        postings = self.trigrams.postings
+        for trigram in TrigramIndex.trigrams(self.normalize(data)):
+            posting = postings.get(trigram)
+            if posting is None:
+                posting = postings[trigram] = array("I")
+            posting.append(i)
+        return i
+
+    def compact(self):
+        """Drops the ids left by removed files, renumbering the rest."""
+        remap = {}
+        for i, flag in enumerate(self.flags):
+            if flag != DEAD:
+                remap[i] = len(remap)
+        postings = {}
+        for trigram, posting in self.trigrams.postings.items():
+            ids = array("I", [remap[i] for i in posting if i in remap])
+            if ids:
+                postings[trigram] = ids
+        self.trigrams = TrigramIndex(postings)
+        alive = list(remap)
+        self.paths = [self.paths[i] for i in alive]
+        self.sizes = array("Q", [self.sizes[i] for i in alive])
+        self.hashes = array("I", [self.hashes[i] for i in alive])
+        self.flags = array("B", [self.flags[i] for i in alive])
+        self.ids = {path: i for i, path in enumerate(self.paths)}
+        # Every id moved, the next save rewrites the whole index
+        self.saved = 0
+
+    def update(
+        self,
+        manifest: ExtractionManifest,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> ContentIndexStats:
+        """Brings the index up to date with the manifest, reading changed files only.
+
+        Blocking, meant to run on a thread."""
+        start = perf_counter()
+        stats = ContentIndexStats()
+        files = {key: (entry[0], entry[1]) for key, entry in manifest.files.items()}
+        for path in [p for p in self.ids if p not in files]:
+            self._remove(path)
+            stats.removed += 1
+        changed = []
+        for path, (size, hash) in files.items():
+            i = self.ids.get(path)
+            if i is not None and (self.sizes[i], self.hashes[i]) == (size, hash):
+                continue
+            changed.append((path, size, hash))
+        for done, (path, size, hash) in enumerate(changed, 1):
+            if path in self.ids:
+                self._remove(path)
+            self._add(path, size, hash)
+            stats.indexed += 1
+            if progress is not None and not done % 100:
+                progress(done, len(changed))
+        dead = len(self.paths) - len(self.ids)
+        if dead > 1000 and dead * 4 > len(self.paths):
+            self.compact()
+        stats.files = len(self.ids)
+        stats.text_files = self.flags.count(TEXT)
+        stats.trigrams = len(self.trigrams.postings)
+        stats.elapsed = perf_counter() - start
+        return stats
+
+    def candidates(self, literals: list[str]) -> list[int]:
+        ids = self.trigrams.candidates(
+            [self.normalize(literal.encode()) for literal in literals]
+        )
+        if ids is None:
+            ids = range(len(self.paths))
+        return [i for i in sorted(ids) if self.flags[i] == TEXT]
+
+    def search(
+        self, query: str, regex: bool = False, limit: Optional[int] = 1000
+    ) -> list[SearchHit]:
+        """Lines holding a substring, or matching a regex, case insensitively."""
+        if not query:
+            raise ValueError("Empty query")
+        if regex:
+            literals = regex_literals(query)
+            pattern = re.compile(query, re.IGNORECASE | re.MULTILINE)
+        else:
+            needle = self.normalize(query.encode())
+            literals = [query]
+        hits = []
+        for i in self.candidates(literals):
+            try:
+                data = self.root.joinpath(self.paths[i]).read_bytes()
+            except OSError:
+                continue
+            if regex:
+                text = data.decode("utf-8", "replace")
+                positions = (match.start() for match in pattern.finditer(text))
+            else:
+                text = self.normalize(data)
+                positions = self._find_all(text, needle)
+                # Byte offsets, lines are cut from the raw data
+                text = data
+            hits.extend(self._lines(self.paths[i], text, positions))
+            if limit is not None and len(hits) >= limit:
+                return hits[:limit]
+        return hits
+
+    @staticmethod
+    def _find_all(text: str, needle: str):
+        position = text.find(needle)
+        while position != -1:
+            yield position
+            position = text.find(needle, position + 1)
+
+    @staticmethod
+    def _lines(path: str, text, positions) -> list[SearchHit]:
+        newline = "\n" if isinstance(text, str) else b"\n"
+        hits = []
+        line = 1
+        counted = 0
+        end = -1
+        for position in positions:
+            if position <= end:
+                # Same line as the previous hit
+                continue
+            line += text.count(newline, counted, position)
+            counted = position
+            begin = text.rfind(newline, 0, position) + 1
+            end = text.find(newline, position)
+            if end == -1:
+                end = len(text)
+            content = text[begin:end]
+            if not isinstance(content, str):
+                content = content.decode("utf-8", "replace")
+            hits.append(SearchHit(path, line, content.strip()[:200]))
+        return hits
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from utils.trove.extractor import TFIndex
+
+
+@dataclass
+class IndexTotals:
+    files: int = 0
+    size: int = 0
+    changed_files: int = 0
+    changed_size: int = 0
+
+    def add(self, other: IndexTotals):
+        self.files += other.files
+        self.size += other.size
+        self.changed_files += other.changed_files
+        self.changed_size += other.changed_size
+
+    def subtract(self, other: IndexTotals):
+        self.files -= other.files
+        self.size -= other.size
+        self.changed_files -= other.changed_files
+        self.changed_size -= other.changed_size
+
+
+class SelectionTotals:
+    """Totals of every listed index and of the selected ones.
+
+    Each index's totals are computed once when it's listed, toggling an index
+    then only adds or subtracts them instead of summing its files again."""
+
+    def __init__(self):
+        self.indexes: dict[Path, IndexTotals] = {}
+        self.selected: set[Path] = set()
+        self.all = IndexTotals()
+        self.chosen = IndexTotals()
+
+    def __getitem__(self, index: TFIndex) -> IndexTotals:
+        return self.indexes[index.path]
+
+    def clear(self):
+        self.indexes.clear()
+        self.selected.clear()
+        self.all = IndexTotals()
+        self.chosen = IndexTotals()
+
+    async def add(self, index: TFIndex) -> IndexTotals:
+        """Lists an index, its file count and size come from its parsed table."""
+        if index.path in self.indexes:
+            return self.indexes[index.path]
+        await index.files_list
+        totals = self.indexes[index.path] = IndexTotals(
+            index.file_count, index.total_size
+        )
+        self.all.add(totals)
+        return totals
+
+    def add_change(self, index: TFIndex, size: int):
+        totals = self.indexes[index.path]
+        totals.changed_files += 1
+        totals.changed_size += size
+        self.all.changed_files += 1
+        self.all.changed_size += size
+        if index.path in self.selected:
+            self.chosen.changed_files += 1
+            self.chosen.changed_size += size
+
+    def select(self, index: TFIndex, selected: bool = True):
+        if selected == (index.path in self.selected):
+            return
+        if selected:
+            self.selected.add(index.path)
+            self.chosen.add(self.indexes[index.path])
+        else:
+            self.selected.remove(index.path)
+            self.chosen.subtract(self.indexes[index.path])
+
+    def select_all(self):
+        self.selected = set(self.indexes)
+        self.chosen = IndexTotals(**vars(self.all))
+
+    def unselect_all(self):
+        self.selected.clear()
+        self.chosen = IndexTotals()
+
+    def is_selected(self, index: TFIndex) -> bool:
+        return index.path in self.selected
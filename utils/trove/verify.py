@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+from typing import Awaitable, Callable, Optional
+
+from utils.hashing import file_checksum
+from utils.trove.blob_store import BlobStore
+from utils.trove.extractor import ExtractionManifest, TFArchive, TroveFile
+
+
+class VerificationReport:
+    def __init__(self):
+        self.checked = 0
+        self.bytes = 0
+        self.missing: list[TroveFile] = []
+        self.corrupt: list[TroveFile] = []
+        self.extra: list[str] = []
+        self.elapsed = 0.0
+
+    def __bool__(self):
+        """Whether the tree matched its indexes."""
+        return not (self.missing or self.corrupt or self.extra)
+
+    @property
+    def damaged(self) -> list[TroveFile]:
+        return self.missing + self.corrupt
+
+    def jobs(self) -> list[tuple[TFArchive, list[TroveFile]]]:
+        """Extraction jobs rewriting only the missing and corrupt files."""
+        jobs = {}
+        for file in self.damaged:
+            jobs.setdefault(file.archive.path, (file.archive, []))[1].append(file)
+        return list(jobs.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "checked": self.checked,
+            "bytes": self.bytes,
+            "missing": len(self.missing),
+            "corrupt": len(self.corrupt),
+            "extra": len(self.extra),
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+class TreeVerifier:
+    """Checks an extracted tree against the sizes and hashes in the indexes.
+
+    Sizes come from a single scan of the tree, only files with the right size
+    are read back and hashed, on a thread pool since the native hash releases
+    the GIL. Extra files are only looked for when every index file is expected,
+    a filtered run can't tell them apart from files it left out."""
+
+    def __init__(self, opath: Path, path: Path, workers: int = 0):
+        self.opath = opath
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+
+    async def verify(
+        self,
+        files: list[TroveFile],
+        complete: bool = True,
+        progress: Optional[Callable[[int, int], Awaitable]] = None,
+        interval: float = 0.5,
+        checkpoint: Optional[Callable[[], Awaitable]] = None,
+    ) -> VerificationReport:
+        report = VerificationReport()
+        start = perf_counter()
+        manifest = ExtractionManifest(self.path)
+        disk = await asyncio.to_thread(manifest.scan)
+        to_hash = []
+        expected = set()
+        for file in files:
+            key = file.relative_path(self.opath)
+            expected.add(key)
+            on_disk = disk.get(key)
+            if on_disk is None:
+                report.missing.append(file)
+            elif on_disk[0] != file.size:
+                report.corrupt.append(file)
+            else:
+                to_hash.append(file)
+        if complete:
+            # The scan already leaves out the manifest, packs and other files of ours
+            report.extra = sorted(key for key in disk if key not in expected)
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(self.workers)
+        pending = [
+            (
+                file,
+                loop.run_in_executor(
+                    pool, file_checksum, file.extracted_path(self.opath, self.path)
+                ),
+            )
+            for file in to_hash
+        ]
+        shown = perf_counter()
+        try:
+            for file, future in pending:
+                if await future != file.hash:
+                    report.corrupt.append(file)
+                report.checked += 1
+                report.bytes += file.size
+                if checkpoint is not None and not report.checked % 1000:
+                    await checkpoint()
+                if progress is not None and perf_counter() - shown > interval:
+                    shown = perf_counter()
+                    await progress(report.checked, len(to_hash))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        report.elapsed = perf_counter() - start
+        return report
+
+    @staticmethod
+    def discard_blobs(report: VerificationReport, store: Optional[BlobStore]):
+        """Drops the blobs of corrupt files so a repair doesn't link them back.
+
+        Extracted files are usually hardlinks of their blob, damage to one is
+        damage to the other."""
+        if store is None:
+            return
+        for file in report.corrupt:
+            store.blob_path(file).unlink(missing_ok=True)
+
+    def remove_extra(self, report: VerificationReport) -> int:
+        removed = 0
+        for key in report.extra:
+            try:
+                self.path.joinpath(key).unlink()
+                removed += 1
+            except OSError:
+                continue
+        return removed